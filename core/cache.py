@@ -0,0 +1,84 @@
+import zlib
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache, RedisSerializer
+
+from .metrics import record_cache_lookup, timed
+
+# Признак сжатого значения. Значения pickle начинаются с b'\x80', целые числа
+# хранятся как есть, поэтому с ними признак не пересекается
+COMPRESSED_PREFIX = b'z:'
+
+
+class CompressedRedisSerializer(RedisSerializer):
+    """
+    Сериализатор кэша Redis со сжатием zlib
+
+    Значения длиннее CACHE_COMPRESS_MIN_SIZE байт сжимаются (снимки меню,
+    справочники), короткие и целые числа (версии, счётчики для incr())
+    хранятся без изменений. Ранее записанные несжатые значения читаются.
+    """
+
+    def dumps(self, obj):
+        data = super().dumps(obj)
+        if type(data) is int or len(data) < settings.CACHE_COMPRESS_MIN_SIZE:
+            return data
+        return COMPRESSED_PREFIX + zlib.compress(data, settings.CACHE_COMPRESS_LEVEL)
+
+    def loads(self, data):
+        if isinstance(data, bytes) and data.startswith(COMPRESSED_PREFIX):
+            data = zlib.decompress(data[len(COMPRESSED_PREFIX):])
+        return super().loads(data)
+
+
+_MISSING = object()
+
+
+class InstrumentedCacheMixin:
+    """
+    Учитывает обращения к кэшу в метриках запроса (core.metrics)
+
+    Время всех операций складывается в метрику 'cache', для чтения
+    дополнительно считаются попадания и промахи.
+    """
+
+    def get(self, key, default=None, version=None):
+        with timed('cache'):
+            value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            record_cache_lookup(0, 1)
+            return default
+        record_cache_lookup(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        with timed('cache'):
+            values = super().get_many(keys, version)
+        record_cache_lookup(len(values), len(keys) - len(values))
+        return values
+
+    def set(self, *args, **kwargs):
+        with timed('cache'):
+            return super().set(*args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        with timed('cache'):
+            return super().add(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with timed('cache'):
+            return super().delete(*args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        with timed('cache'):
+            return super().incr(*args, **kwargs)
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    pass
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
@@ -1,6 +1,5 @@
 from django.conf import settings
-from .models import Page
-from orders.models import Table
+from .registry import get_active_table, get_menu_pages
 
 def table_number(request):
     """
@@ -10,10 +9,8 @@ def table_number(request):
     table = None
     
     if table_number:
-        try:
-            table = Table.objects.get(number=table_number, is_active=True)
-        except Table.DoesNotExist:
-            pass
+        # Столы берутся из кэшированного справочника, без запроса к базе
+        table = get_active_table(table_number)
     
     return {
         'table_number': table_number,
@@ -35,7 +32,6 @@ def menu_pages(request):
     """
     Добавляет страницы, которые должны отображаться в меню, в контекст шаблона
     """
-    pages = Page.objects.filter(is_published=True, show_in_menu=True).order_by('order')
     return {
-        'menu_pages': pages,
+        'menu_pages': get_menu_pages(),
     } 
\ No newline at end of file
@@ -0,0 +1,117 @@
+import logging
+import os
+import queue
+import random
+import threading
+from logging.handlers import QueueListener
+
+
+class QueuedHandler(logging.Handler):
+    """
+    Обработчик логов, выносящий запись в фоновый поток
+
+    Запрос только кладёт запись в очередь; форматирование сообщения и запись
+    на диск или в консоль выполняет QueueListener в отдельном потоке. Если
+    очередь переполнена, запись отбрасывается, а не задерживает запрос.
+
+    Поток запускается при первой записи в каждом процессе, поэтому обработчик
+    работает и в процессах, порождённых fork (воркеры gunicorn и Celery).
+
+    Args:
+        targets (list): Обработчики, выполняющие запись (в LOGGING задаются
+            как 'cfg://handlers.<имя>' и должны быть объявлены раньше по алфавиту)
+        queue_size (int): Размер очереди
+    """
+
+    def __init__(self, targets, queue_size=10000):
+        super().__init__()
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._queue = None
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        # dictConfig разворачивает 'cfg://' при обращении по индексу, а не при итерации
+        self.targets = [targets[i] for i in range(len(targets))]
+        for target in self.targets:
+            if not isinstance(target, logging.Handler):
+                raise ValueError(f"QueuedHandler: обработчик {target!r} ещё не настроен")
+
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            # Очередь и поток родительского процесса после fork не работают
+            self._queue = queue.Queue(self.queue_size)
+            self._listener = QueueListener(self._queue, *self.targets, respect_handler_level=True)
+            self._listener.start()
+            self._pid = pid
+
+    def emit(self, record):
+        try:
+            self._ensure_listener()
+            # Сообщение не форматируется здесь: msg % args выполнится в потоке записи
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        # logging.shutdown() при выходе закрывает обработчик раньше целевых:
+        # оставшиеся в очереди записи успевают записаться
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+        self._listener = None
+        self._pid = None
+        super().close()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю записей уровня max_level и ниже
+
+    Доля задаётся по имени логгера (берётся самый длинный совпавший префикс),
+    записи уровня выше max_level (предупреждения, ошибки) проходят всегда.
+
+    Args:
+        rates (dict|str): Доли записей по логгерам: {'orders.views': 0.1}
+            или строка 'orders.views=0.1,menu=0.5'
+        max_level (str): Максимальный уровень, к которому применяется выборка
+    """
+
+    def __init__(self, rates=None, max_level='INFO'):
+        super().__init__()
+        self.rates = _parse_rates(rates) if isinstance(rates, str) else dict(rates or {})
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+        self._cache = {}
+
+    def _rate(self, name):
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = 1.0
+            prefix_len = -1
+            for prefix, prefix_rate in self.rates.items():
+                if (name == prefix or name.startswith(prefix + '.')) and len(prefix) > prefix_len:
+                    rate, prefix_len = float(prefix_rate), len(prefix)
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+def _parse_rates(value):
+    """Разбирает доли выборки из строки вида 'orders.views=0.1,menu=0.5'"""
+    rates = {}
+    for part in value.split(','):
+        name, _, rate = part.strip().partition('=')
+        if name and rate:
+            rates[name.strip()] = float(rate)
+    return rates
@@ -0,0 +1,84 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Метрики обрабатываемого запроса; вне запроса (Celery, команды) - None
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Время и число обращений к базе, кэшу и внешним сервисам за один запрос
+
+    Заполняется RequestMetricsMiddleware и функциями этого модуля.
+    timings: {имя: [число обращений, секунды]}, имена - 'db', 'cache',
+    'rk7', 'forte'.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def add(self, name, seconds, count=1):
+        timing = self.timings.setdefault(name, [0, 0.0])
+        timing[0] += count
+        timing[1] += seconds
+
+    def count(self, name):
+        return self.timings.get(name, (0, 0.0))[0]
+
+    def duration_ms(self, name):
+        return self.timings.get(name, (0, 0.0))[1] * 1000
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        """Обёртка для connection.execute_wrapper"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add('db', time.perf_counter() - started)
+
+
+def start_request_metrics():
+    """Начинает сбор метрик; возвращает (метрики, токен для finish_request_metrics)"""
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def finish_request_metrics(token):
+    _current.reset(token)
+
+
+def current_metrics():
+    return _current.get()
+
+
+@contextmanager
+def timed(name):
+    """
+    Добавляет время блока к метрике запроса
+
+    Вне запроса ничего не делает, поэтому подходит и для кода, который
+    выполняется в Celery.
+
+    Пример:
+        with timed('forte'):
+            response = requests.post(...)
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - started)
+
+
+def record_cache_lookup(hits, misses):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
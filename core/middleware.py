@@ -1,22 +1,143 @@
+import logging
+import random
+import time
+from contextlib import ExitStack
+
 from django.conf import settings
+from django.db import connections
+
+from .metrics import finish_request_metrics, start_request_metrics
+
+logger = logging.getLogger(__name__)
+
+# Внешние сервисы, время которых выводится отдельно
+EXTERNAL_SERVICES = ('rk7', 'forte')
 
 class TableNumberMiddleware:
+    """
+    Определяет номер стола для запроса (request.table_number).
+
+    Номер берётся из параметра URL, подписанной cookie или (для старых
+    сессий) из сессии. Сохраняется он в подписанной cookie и только когда
+    значение изменилось, поэтому просмотр меню не пишет сессию в базу.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        # Получаем номер стола из параметра URL или сессии
-        table_number = request.GET.get('table') or request.session.get('table_number')
-        
-        if table_number:
-            try:
-                table_number = int(table_number)
-                request.table_number = table_number
-                request.session['table_number'] = table_number
-            except (ValueError, TypeError):
-                request.table_number = None
-        else:
-            request.table_number = None
+        stored_number = self._parse(request.get_signed_cookie(
+            settings.TABLE_COOKIE_NAME, default=None, salt=settings.TABLE_COOKIE_SALT
+        ))
+        if stored_number is None and settings.SESSION_COOKIE_NAME in request.COOKIES:
+            # Сессии, созданные до перехода на cookie
+            stored_number = self._parse(request.session.get('table_number'))
+
+        # Получаем номер стола из параметра URL или сохранённого значения
+        table_number = request.GET.get('table')
+        request.table_number = self._parse(table_number) if table_number else stored_number
 
         response = self.get_response(request)
-        return response 
\ No newline at end of file
+
+        # Представление тоже может сменить стол (номер стола в пути URL)
+        if request.table_number is not None and request.table_number != stored_number:
+            response.set_signed_cookie(
+                settings.TABLE_COOKIE_NAME,
+                request.table_number,
+                salt=settings.TABLE_COOKIE_SALT,
+                max_age=settings.TABLE_COOKIE_AGE,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    @staticmethod
+    def _parse(value):
+        try:
+            return int(value) if value not in (None, '') else None
+        except (ValueError, TypeError):
+            return None
+
+
+class RequestMetricsMiddleware:
+    """
+    Измеряет, на что ушло время запроса: база, кэш, R-Keeper, ForteBank
+
+    Метрики отдаются заголовком Server-Timing (видны во вкладке Network
+    браузера, в nginx - через $upstream_http_server_timing) и пишутся
+    в лог строкой request.timing. Заголовок получают сотрудники, а всем
+    посетителям - только при REQUEST_METRICS_HEADER. В лог попадает доля запросов
+    REQUEST_METRICS_SAMPLE_RATE, а запросы дольше REQUEST_METRICS_SLOW_MS
+    пишутся всегда, с уровнем WARNING.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics, token = start_request_metrics()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.db_wrapper))
+                response = self.get_response(request)
+        finally:
+            finish_request_metrics(token)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        if settings.REQUEST_METRICS_HEADER or self._is_staff(request):
+            response['Server-Timing'] = self._server_timing(metrics, total_ms)
+        self._log(request, response, metrics, total_ms)
+        return response
+
+    @staticmethod
+    def _is_staff(request):
+        # request.user ленивый: обращение к нему читает сессию и пользователя.
+        # Без cookie сессии посетитель точно анонимный, а уже загруженного
+        # представлением пользователя берём как есть
+        user = getattr(request, '_cached_user', None)
+        if user is None:
+            if not hasattr(request, 'user') or settings.SESSION_COOKIE_NAME not in request.COOKIES:
+                return False
+            user = request.user
+        return user.is_staff
+
+    @staticmethod
+    def _server_timing(metrics, total_ms):
+        parts = [
+            f'total;dur={total_ms:.1f}',
+            f'db;dur={metrics.duration_ms("db"):.1f};desc="{metrics.count("db")} queries"',
+            f'cache;dur={metrics.duration_ms("cache"):.1f};'
+            f'desc="{metrics.cache_hits} hit, {metrics.cache_misses} miss"',
+        ]
+        for name in EXTERNAL_SERVICES:
+            if metrics.count(name):
+                parts.append(f'{name};dur={metrics.duration_ms(name):.1f};desc="{metrics.count(name)} calls"')
+        return ', '.join(parts)
+
+    @staticmethod
+    def _log(request, response, metrics, total_ms):
+        if total_ms >= settings.REQUEST_METRICS_SLOW_MS:
+            level = logging.WARNING
+        elif random.random() < settings.REQUEST_METRICS_SAMPLE_RATE:
+            level = logging.INFO
+        else:
+            return
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'db_ms': round(metrics.duration_ms('db'), 1),
+            'db_queries': metrics.count('db'),
+            'cache_ms': round(metrics.duration_ms('cache'), 1),
+            'cache_hits': metrics.cache_hits,
+            'cache_misses': metrics.cache_misses,
+        }
+        for name in EXTERNAL_SERVICES:
+            fields[f'{name}_ms'] = round(metrics.duration_ms(name), 1)
+            fields[f'{name}_calls'] = metrics.count(name)
+        logger.log(level, "request.timing %s", ' '.join(f'{key}={value}' for key, value in fields.items()),
+                   extra={'event': 'request.timing', **fields})
@@ -0,0 +1,198 @@
+import logging
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+SAVEPOINT_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Число SQL-запросов превысило заданный бюджет"""
+
+
+class QueryBudget:
+    """
+    Считает SQL-запросы блока кода и сверяет их число с бюджетом
+
+    Запросы перехватываются через connection.execute_wrapper, поэтому
+    DEBUG для подсчёта не нужен. При превышении бюджета отчёт показывает
+    повторяющиеся запросы - обычно это и есть N+1.
+
+    Args:
+        max_queries (int): Допустимое число запросов
+        label (str): Название проверяемого кода для отчёта
+
+    Пример:
+        with QueryBudget(3, 'menu_list') as budget:
+            ...
+        budget.check()  # QueryBudgetExceeded при превышении
+    """
+
+    def __init__(self, max_queries, label=''):
+        self.max_queries = max_queries
+        self.label = label
+        self.queries = []
+        self._wrapper = None
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self._record)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+    def _record(self, execute, sql, params, many, context):
+        # Точки сохранения atomic() - управление транзакцией, а не запросы к данным;
+        # к тому же в тестах их число зависит от внешней транзакции TestCase
+        if not sql.startswith(SAVEPOINT_STATEMENTS):
+            self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def exceeded(self):
+        return self.max_queries is not None and self.count > self.max_queries
+
+    def duplicates(self):
+        """Запросы, выполненные больше одного раза: [(sql, сколько раз)]"""
+        return [(sql, times) for sql, times in Counter(self.queries).most_common() if times > 1]
+
+    def report(self):
+        lines = [f"{self.label or 'Код'}: {self.count} SQL-запросов при бюджете {self.max_queries}"]
+        duplicates = self.duplicates()
+        if duplicates:
+            lines.append("Повторяющиеся запросы:")
+            lines.extend(f"  {times}x {sql}" for sql, times in duplicates)
+        else:
+            lines.append("Все запросы:")
+            lines.extend(f"  {sql}" for sql in self.queries)
+        return "\n".join(lines)
+
+    def check(self):
+        if self.exceeded:
+            raise QueryBudgetExceeded(self.report())
+
+
+def query_budget(max_queries):
+    """
+    Задаёт бюджет SQL-запросов представления
+
+    Подходит и для функций, и для классов-представлений. Бюджет проверяет
+    QueryBudgetMiddleware (в режиме QUERY_BUDGET_MODE 'warn' или 'raise')
+    и тесты (QueryBudgetTestMixin).
+
+    Пример:
+        @query_budget(4)
+        def add_to_cart(request):
+            ...
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def get_view_budget(view_func):
+    """Бюджет представления, заданный query_budget, или None"""
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None and hasattr(view_func, 'view_class'):
+        budget = getattr(view_func.view_class, 'query_budget', None)
+    return budget
+
+
+class QueryBudgetMiddleware:
+    """
+    Проверяет бюджеты SQL-запросов представлений во время разработки
+
+    Режим задаётся QUERY_BUDGET_MODE: 'off' - не проверять, 'warn' - писать
+    отчёт в лог, 'raise' - отвечать ошибкой QueryBudgetExceeded. Запросы
+    считаются за весь запрос, включая сессию и middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = settings.QUERY_BUDGET_MODE
+        if mode == 'off':
+            return self.get_response(request)
+
+        request.query_budget = None
+        with QueryBudget(None, request.path) as budget:
+            response = self.get_response(request)
+        budget.max_queries = request.query_budget
+        if budget.exceeded:
+            if mode == 'raise':
+                raise QueryBudgetExceeded(budget.report())
+            logger.warning(budget.report())
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Бюджет, заданный админкой (QueryBudgetAdminMixin), не перезаписываем
+        if getattr(request, 'query_budget', None) is None:
+            request.query_budget = get_view_budget(view_func)
+
+
+class QueryBudgetAdminMixin:
+    """
+    Бюджеты SQL-запросов страниц админки
+
+    changelist_query_budget - для списка объектов, change_query_budget -
+    для формы редактирования (вместе с inline). Бюджеты не должны зависеть
+    от числа строк на странице. Сохранение формы (POST) не проверяется:
+    его запросы растут с числом строк inline, а ошибка после сохранения
+    только скрыла бы уже записанные изменения.
+    """
+
+    changelist_query_budget = None
+    change_query_budget = None
+
+    def changelist_view(self, request, extra_context=None):
+        request.query_budget = self.changelist_query_budget
+        return super().changelist_view(request, extra_context)
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        if request.method in ('GET', 'HEAD'):
+            request.query_budget = self.change_query_budget
+        return super().change_view(request, object_id, form_url, extra_context)
+
+
+class QueryBudgetTestMixin:
+    """
+    Проверки бюджетов SQL-запросов для TestCase
+
+    В отличие от assertNumQueries проверяют верхнюю границу и при
+    превышении показывают повторяющиеся запросы.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, label=''):
+        with QueryBudget(max_queries, label) as budget:
+            yield budget
+        if budget.exceeded:
+            self.fail(budget.report())
+
+    def assertViewWithinBudget(self, view_func, client_method, *args, **kwargs):
+        """Выполняет запрос тестовым клиентом и сверяет его с бюджетом представления"""
+        max_queries = get_view_budget(view_func)
+        self.assertIsNotNone(max_queries, f"У представления {view_func.__name__} не задан бюджет запросов")
+        with self.assertQueryBudget(max_queries, view_func.__name__):
+            response = client_method(*args, **kwargs)
+        return response
+
+    def assertChangelistWithinBudget(self, client, model_admin):
+        """Открывает список объектов в админке и сверяет его с changelist_query_budget"""
+        opts = model_admin.model._meta
+        with self.assertQueryBudget(model_admin.changelist_query_budget, f'{opts.label} changelist'):
+            response = client.get(reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return response
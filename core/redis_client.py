@@ -0,0 +1,25 @@
+import threading
+
+import redis
+from django.conf import settings
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_redis_client(url=None):
+    """
+    Возвращает клиент Redis с общим пулом соединений для указанного URL.
+
+    Клиенты кэшируются на уровне процесса, поэтому повторные вызовы
+    не создают новых соединений.
+    """
+    url = url or settings.REDIS_URL
+    client = _clients.get(url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(url)
+            if client is None:
+                client = redis.Redis.from_url(url, decode_responses=True)
+                _clients[url] = client
+    return client
@@ -0,0 +1,86 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class CachedRegistry:
+    """
+    Редко меняющийся справочник с двумя уровнями кэша.
+
+    Значение хранится в памяти процесса и в общем кэше под ключом,
+    включающим версию. Процесс сверяет версию с общим кэшем не чаще раза
+    в CORE_REGISTRY_LOCAL_TTL секунд, поэтому в устоявшемся режиме чтение
+    не обращается ни к базе, ни к кэшу. invalidate() увеличивает версию,
+    и все процессы перезагружают значение при следующей сверке.
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.version_key = f'core:registry:{name}:version'
+        self._local = None  # (версия, значение, время сверки)
+        self._lock = threading.Lock()
+
+    def get(self):
+        local = self._local
+        now = time.monotonic()
+        if local is not None and now - local[2] < settings.CORE_REGISTRY_LOCAL_TTL:
+            return local[1]
+
+        version = cache.get(self.version_key)
+        if version is None:
+            version = time.time_ns()
+            if not cache.add(self.version_key, version, None):
+                version = cache.get(self.version_key, version)
+
+        if local is not None and local[0] == version:
+            self._local = (version, local[1], now)
+            return local[1]
+
+        with self._lock:
+            data_key = f'core:registry:{self.name}:{version}'
+            value = cache.get(data_key)
+            if value is None:
+                value = self.loader()
+                cache.set(data_key, value, settings.CORE_REGISTRY_TIMEOUT)
+            self._local = (version, value, now)
+        return value
+
+    def invalidate(self):
+        """Помечает значение устаревшим во всех процессах"""
+        self._local = None
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, time.time_ns(), None)
+
+
+def _load_active_tables():
+    from orders.models import Table
+
+    return {table.number: table for table in Table.objects.filter(is_active=True).select_related('waiter')}
+
+
+def _load_menu_pages():
+    from .models import Page
+
+    return list(Page.objects.filter(is_published=True, show_in_menu=True).order_by('order'))
+
+
+active_tables = CachedRegistry('active_tables', _load_active_tables)
+menu_pages = CachedRegistry('menu_pages', _load_menu_pages)
+
+
+def get_active_table(number):
+    """Возвращает активный стол с загруженным официантом или None"""
+    try:
+        return active_tables.get().get(int(number))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_menu_pages():
+    """Возвращает опубликованные страницы для меню сайта"""
+    return menu_pages.get()
@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from orders.models import Table, Waiter
+from .models import Page
+from .registry import active_tables, menu_pages
+
+
+# Справочники сбрасываются после фиксации транзакции: иначе параллельный запрос
+# мог бы закэшировать под новой версией ещё не зафиксированные данные
+@receiver([post_save, post_delete], sender=Table)
+@receiver([post_save, post_delete], sender=Waiter)
+def invalidate_active_tables(sender, **kwargs):
+    transaction.on_commit(active_tables.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Page)
+def invalidate_menu_pages(sender, **kwargs):
+    transaction.on_commit(menu_pages.invalidate)
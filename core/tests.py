@@ -1,3 +1,163 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+
+from orders.admin import WaiterAdmin
+from orders.models import Table
+
+from .metrics import current_metrics, timed
+from .middleware import RequestMetricsMiddleware
+from .models import Page
+from .query_budget import QueryBudget, QueryBudgetExceeded, QueryBudgetTestMixin, query_budget
+from .registry import active_tables, menu_pages
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Подсчёт SQL-запросов и отчёт о превышении бюджета"""
+
+    def test_report_lists_repeated_queries(self):
+        with QueryBudget(2, 'users') as budget:
+            for _ in range(3):
+                list(User.objects.filter(username='guest'))
+        self.assertEqual(budget.count, 3)
+        self.assertTrue(budget.exceeded)
+        self.assertEqual(budget.duplicates()[0][1], 3)
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'users: 3 SQL-запросов при бюджете 2'):
+            budget.check()
+
+    def test_within_budget(self):
+        with self.assertQueryBudget(1) as budget:
+            User.objects.exists()
+        self.assertEqual(budget.count, 1)
+        budget.check()
+
+    def test_decorator_marks_view(self):
+        @query_budget(4)
+        def view(request):
+            pass
+        self.assertEqual(view.query_budget, 4)
+
+    @override_settings(ALLOWED_HOSTS=['*'], QUERY_BUDGET_MODE='raise')
+    def test_middleware_raises_when_admin_page_exceeds_budget(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        with mock.patch.object(WaiterAdmin, 'changelist_query_budget', 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('admin:orders_waiter_changelist'))
+
+    @override_settings(ALLOWED_HOSTS=['*'], QUERY_BUDGET_MODE='warn')
+    def test_middleware_only_logs_in_warn_mode(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        with mock.patch.object(WaiterAdmin, 'changelist_query_budget', 1), \
+                self.assertLogs('core.query_budget', 'WARNING'):
+            response = self.client.get(reverse('admin:orders_waiter_changelist'))
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(REQUEST_METRICS_HEADER=True, REQUEST_METRICS_SAMPLE_RATE=0, REQUEST_METRICS_SLOW_MS=10000)
+class RequestMetricsMiddlewareTests(TestCase):
+    """Метрики запроса попадают в Server-Timing и в лог"""
+
+    def _view(self, request):
+        User.objects.exists()
+        cache.set('metrics-test', 1)
+        cache.get('metrics-test')
+        cache.get('metrics-test-missing')
+        with timed('forte'):
+            pass
+        return HttpResponse()
+
+    def test_server_timing_header(self):
+        response = RequestMetricsMiddleware(self._view)(RequestFactory().get('/'))
+        header = response['Server-Timing']
+        self.assertIn('db;dur=', header)
+        self.assertIn('desc="1 queries"', header)
+        self.assertIn('desc="1 hit, 1 miss"', header)
+        self.assertIn('forte;dur=', header)
+        self.assertNotIn('rk7', header)
+        self.assertIsNone(current_metrics())
+
+    @override_settings(REQUEST_METRICS_SLOW_MS=0)
+    def test_slow_request_is_always_logged(self):
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            RequestMetricsMiddleware(self._view)(RequestFactory().get('/checkout/'))
+        record = logs.records[0]
+        self.assertEqual(record.event, 'request.timing')
+        self.assertEqual(record.path, '/checkout/')
+        self.assertEqual(record.db_queries, 1)
+        self.assertEqual(record.forte_calls, 1)
+
+    @override_settings(REQUEST_METRICS_HEADER=False)
+    def test_header_only_for_staff_when_disabled(self):
+        request = RequestFactory().get('/')
+        request._cached_user = AnonymousUser()
+        self.assertNotIn('Server-Timing', RequestMetricsMiddleware(self._view)(request))
+
+        request._cached_user = User(username='admin', is_staff=True)
+        self.assertIn('Server-Timing', RequestMetricsMiddleware(self._view)(request))
+
+        request = RequestFactory().get('/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = 'session'
+        request.user = SimpleLazyObject(lambda: User(username='admin', is_staff=True))
+        self.assertIn('Server-Timing', RequestMetricsMiddleware(self._view)(request))
+
+    @override_settings(REQUEST_METRICS_HEADER=False)
+    def test_anonymous_visitor_user_is_not_loaded(self):
+        request = RequestFactory().get('/')
+        get_user = mock.Mock(return_value=AnonymousUser())
+        request.user = SimpleLazyObject(get_user)
+        self.assertNotIn('Server-Timing', RequestMetricsMiddleware(self._view)(request))
+        get_user.assert_not_called()
+
+    def test_timed_outside_request_is_noop(self):
+        with timed('rk7'):
+            pass
+        self.assertIsNone(current_metrics())
+
+
+class RegistryInvalidationTests(TestCase):
+    """Справочники сбрасываются только после фиксации изменений"""
+
+    def test_table_change_invalidates_on_commit(self):
+        with mock.patch.object(active_tables, 'invalidate') as invalidate, \
+                self.captureOnCommitCallbacks(execute=True):
+            Table.objects.create(number=1, station_id='101')
+            invalidate.assert_not_called()
+        invalidate.assert_called_once()
+
+    def test_page_change_invalidates_on_commit(self):
+        with mock.patch.object(menu_pages, 'invalidate') as invalidate, \
+                self.captureOnCommitCallbacks(execute=True):
+            Page.objects.create(title='О нас', slug='about', content='')
+            invalidate.assert_not_called()
+        invalidate.assert_called_once()
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class DatabaseHealthTests(TestCase):
+    """Проверка базы данных не раскрывает подробности ошибки"""
+
+    def test_ok(self):
+        response = self.client.get(reverse('database_health'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'status', 'latency_ms'})
+        self.assertEqual(response.json()['status'], 'ok')
+
+    def test_details_for_staff(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get(reverse('database_health'))
+        self.assertIn('conn_max_age', response.json())
+
+    def test_error_details_are_not_exposed(self):
+        error = DatabaseError('could not connect to server "db.internal" as user "restoqr"')
+        with mock.patch('core.views.connection') as connection, self.assertLogs('core.views', 'ERROR'):
+            connection.cursor.side_effect = error
+            response = self.client.get(reverse('database_health'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {'status': 'error'})
@@ -1,7 +1,15 @@
+import logging
+import time
+
+from django.db import DatabaseError, connection
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404
+from django.views.decorators.cache import never_cache
 from django.views.generic import DetailView
 from .models import Page
 
+logger = logging.getLogger(__name__)
+
 
 class PageDetailView(DetailView):
     model = Page
@@ -13,3 +21,35 @@ class PageDetailView(DetailView):
         if not self.request.user.is_staff:
             queryset = queryset.filter(is_published=True)
         return queryset
+
+
+@never_cache
+def database_health(request):
+    """
+    Проверка доступности базы данных для балансировщика и мониторинга
+
+    Возвращает статус и время выполнения SELECT 1. Сотрудникам дополнительно
+    показываются настройки соединения и, если включён пул соединений, его
+    статистика (занятые и свободные соединения, ожидающие запросы).
+    """
+    started = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except DatabaseError:
+        # Текст ошибки может содержать адрес сервера, имя пользователя и базы -
+        # наружу отдаём только статус
+        logger.exception("Проверка базы данных не прошла")
+        return JsonResponse({'status': 'error'}, status=503)
+
+    data = {
+        'status': 'ok',
+        'latency_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+    # Эндпоинт открыт балансировщику, а устройство пула посторонним знать незачем
+    if request.user.is_staff:
+        data['conn_max_age'] = connection.settings_dict.get('CONN_MAX_AGE')
+        pool = getattr(connection, 'pool', None)
+        if pool is not None:
+            data['pool'] = pool.get_stats()
+    return JsonResponse(data)
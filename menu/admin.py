@@ -1,19 +1,55 @@
 from django.contrib import admin
 from django.contrib import messages
 from django.core.management import call_command
+from django.db import transaction
+from core.query_budget import QueryBudgetAdminMixin
 from .models import Category, MenuItem, Station
+from .services.menu_snapshot import bump_menu_version
 from .sync_utils import get_dish_names, sync_station_menu
 from .tasks import manual_sync_menu_task
 
+class MenuSnapshotInvalidationMixin:
+    """
+    Сбрасывает снимки меню после изменений в админке
+
+    Версия меняется только после фиксации транзакции, иначе параллельный
+    запрос успел бы закэшировать под новой версией ещё старые данные.
+    """
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        transaction.on_commit(bump_menu_version)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        transaction.on_commit(bump_menu_version)
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        transaction.on_commit(bump_menu_version)
+
+class CategoryListFilter(admin.RelatedFieldListFilter):
+    """Фильтр по категории: названия категорий включают станцию, загружаем её сразу"""
+
+    def field_choices(self, field, request, model_admin):
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        categories = Category.objects.select_related('station').order_by(*ordering)
+        return [(category.pk, str(category)) for category in categories]
+
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(QueryBudgetAdminMixin, MenuSnapshotInvalidationMixin, admin.ModelAdmin):
     list_display = ('name', 'station')
+    list_select_related = ('station',)
+    changelist_query_budget = 7
     search_fields = ('name', 'station__name')
     list_filter = ('station',)
 
 @admin.register(MenuItem)
-class MenuItemAdmin(admin.ModelAdmin):
+class MenuItemAdmin(QueryBudgetAdminMixin, MenuSnapshotInvalidationMixin, admin.ModelAdmin):
     list_display = ('name', 'name_kk', 'category', 'quantity', 'category__station', 'is_available', 'stop_list')
+    list_select_related = ('category__station',)
+    changelist_query_budget = 6
+    change_query_budget = 8
     list_filter = ('category__station', 'is_available', 'stop_list')
     search_fields = ('name', 'name_kk', 'description', 'description_kk')
     fieldsets = (
@@ -29,8 +65,20 @@ class MenuItemAdmin(admin.ModelAdmin):
     )
     readonly_fields = ('last_updated',)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Подписи в автодополнении (позиции заказа) включают название станции
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        return queryset.select_related('station'), may_have_duplicates
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'category':
+            # Подпись категории включает название станции
+            kwargs['queryset'] = Category.objects.select_related('station')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
 @admin.register(Station)
-class StationAdmin(admin.ModelAdmin):
+class StationAdmin(QueryBudgetAdminMixin, MenuSnapshotInvalidationMixin, admin.ModelAdmin):
+    changelist_query_budget = 6
     list_display = ('name', 'rkeeper_code', 'rkeeper_id', 'r_keeper_number', 'is_active')
     search_fields = ('name', 'rkeeper_code', 'rkeeper_id')
     list_filter = ('is_active',)
@@ -39,7 +87,7 @@ class StationAdmin(admin.ModelAdmin):
     def sync_menu(self, request, queryset):
         for station in queryset:
             try:
-                call_command('sync_menu_from_stations', station_id=station.id)
+                call_command('sync_menu_from_stations', station_id=station.id, force=True)
                 self.message_user(request, f"Меню для станции {station.name} успешно синхронизировано")
             except Exception as e:
                 self.message_user(request, f"Ошибка при синхронизации меню для станции {station.name}: {str(e)}", level=messages.ERROR)
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
-from menu.models import MenuItem, Category
+from menu.models import MenuItem, Category, MenuSyncState
+from menu.services.menu_snapshot import bump_menu_version
 from django.db import transaction
 
 class Command(BaseCommand):
@@ -31,5 +32,9 @@ class Command(BaseCommand):
                 Category.objects.all().delete()
                 self.stdout.write(self.style.SUCCESS(f'Удалено {categories_count} категорий'))
 
+                # Следующая синхронизация должна загрузить меню заново
+                MenuSyncState.objects.all().delete()
+                transaction.on_commit(bump_menu_version)
+
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Ошибка при удалении: {str(e)}')) 
\ No newline at end of file
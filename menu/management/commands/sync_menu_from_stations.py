@@ -1,182 +1,137 @@
 from django.core.management.base import BaseCommand
-import os
 import sys
 import django
 import logging
 from datetime import datetime
-import requests
 import xml.etree.ElementTree as ET
-from urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
-from urllib3.util.ssl_ import create_urllib3_context
-import warnings
-import ssl
-from django.db import transaction
-from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.db import connections, transaction
 from django.conf import settings
-from menu.models import Station, Category, MenuItem
+from menu.models import Station
 from orders.models import Waiter
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("menu_sync.log"),
-        logging.StreamHandler()
-    ]
+from orders.services.rk7_client import get_rk7_client
+from core.registry import active_tables
+from menu.sync_utils import (
+    apply_station_menu, get_dish_names, iter_reference_items, load_fingerprints, response_fingerprint,
+    station_fingerprint_key, store_fingerprint
 )
-logger = logging.getLogger(__name__)
-
-# Отключаем предупреждения SSL
-warnings.filterwarnings('ignore', message='Unverified HTTPS request')
-
-class CustomAdapter(HTTPAdapter):
-    def init_poolmanager(self, *args, **kwargs):
-        context = create_urllib3_context(ssl_version=ssl.PROTOCOL_SSLv23)
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
-        context.set_ciphers('ALL:@SECLEVEL=0')
-        kwargs['ssl_context'] = context
-        return super(CustomAdapter, self).init_poolmanager(*args, **kwargs)
 
-# Настройка сессии с retry-логикой
-session = requests.Session()
-retry = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
-adapter = CustomAdapter(max_retries=retry)
-session.mount('http://', adapter)
-session.mount('https://', adapter)
-
-# Конфигурация из .env
-base_url = os.environ.get('RKEEPER_API_URL')
+logger = logging.getLogger(__name__)
 
-def get_dish_names():
-    """Получает справочник названий блюд"""
-    logger.info("Получение справочника блюд из R-Keeper")
+def get_employees():
+    """
+    Получает справочник сотрудников (один раз за запуск синхронизации)
+    
+    Returns:
+        list|None: Список словарей {code, name, guid} или None при ошибке
+    """
+    logger.info("Получение справочника сотрудников из R-Keeper")
     xml_query = '''<?xml version="1.0" encoding="utf-8"?>
     <RK7Query>
-        <RK7Command CMD="GetRefData" RefName="MenuItems" onlyActive="1">
+        <RK7Command CMD="GetRefData" RefName="EMPLOYEES" OnlyActive="1">
             <PROPFILTER>
-                <PROP name="ItemIdent"/>
+                <PROP name="Ident"/>
                 <PROP name="Code"/>
                 <PROP name="Name"/>
                 <PROP name="Status"/>
                 <PROP name="MainParentIdent"/>
-                <PROP name="Price"/>
-                <PROP name="Quantity"/>
-                <PROP name="Available"/>
-                <PROP name="RecipeText"/>
-                <PROP name="RecipeIngredients"/>
-                <PROP name="CategPath"/>
+                <PROP name="Flags"/>
             </PROPFILTER>
-            <FILTER>
-                <EQ FieldName="ItemKind" Value="1"/>
-            </FILTER>
         </RK7Command>
     </RK7Query>'''
     
     try:
-        response = session.post(
-            base_url,
-            data=xml_query.encode('utf-8'),
-            verify=False,
-            headers={'Content-Type': 'application/xml'}
-        )
-        response.raise_for_status()
-        
-        # Парсим ответ и создаем словарь {код: название}
-        root = ET.fromstring(response.text)
-        dish_names = {}
-        for item in root.findall('.//Item'):
-            if item.get('Status') == 'rsActive':
-                category = item.get('CategPath', '').split('\\')[-1] if item.get('CategPath') else 'Без категории'
-                dish_names[item.get('ItemIdent')] = {
-                    'name': item.get('Name', 'Без названия'),
-                    'code': item.get('Code', 'Н/Д'),
-                    'recipe': item.get('RecipeText', ''),
-                    'category': category
-                }
-        logger.info(f"Получен справочник из {len(dish_names)} позиций")
-        return dish_names
+        response = get_rk7_client().post(xml_query, stream=True)
+        try:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            employees = []
+            for item in iter_reference_items(response.raw):
+                code = item.get('Code', '')
+                if not code:
+                    continue
+                employees.append({
+                    'code': code,
+                    'name': item.get('Name', ''),
+                    'guid': item.get('Ident', ''),
+                })
+        finally:
+            response.close()
+        logger.info(f"Получено {len(employees)} сотрудников")
+        return employees
     except Exception as e:
-        logger.error(f"Ошибка при получении справочника блюд: {e}")
-        return {}
+        logger.error(f"Ошибка при получении справочника сотрудников: {e}")
+        logger.exception("Полный стек ошибки:")
+        return None
+
+def sync_waiters(employees):
+    """
+    Сравнивает справочник сотрудников с таблицей официантов и записывает
+    изменения одним пакетным upsert
+    
+    Args:
+        employees (list): Результат get_employees
+    
+    Returns:
+        dict: Количество добавленных, обновлённых и неизменных записей
+    """
+    stats = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    incoming = {employee['code']: employee for employee in employees}
+    existing = Waiter.objects.in_bulk(list(incoming), field_name='code')
+    
+    changed = []
+    for code, employee in incoming.items():
+        waiter = existing.get(code)
+        if waiter is None:
+            changed.append(Waiter(code=code, name=employee['name'], guid=employee['guid'], is_active=True))
+            stats['inserted'] += 1
+        elif waiter.name != employee['name'] or waiter.guid != employee['guid'] or not waiter.is_active:
+            waiter.name = employee['name']
+            waiter.guid = employee['guid']
+            waiter.is_active = True
+            changed.append(waiter)
+            stats['updated'] += 1
+        else:
+            stats['unchanged'] += 1
+    
+    if changed:
+        Waiter.objects.bulk_create(
+            changed,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['code'],
+            update_fields=['name', 'guid', 'is_active', 'updated_at'],
+        )
+        # Пакетная запись не отправляет сигналы моделей - сбрасываем справочник столов явно
+        transaction.on_commit(active_tables.invalidate)
+    logger.info(
+        f"Синхронизация официантов: добавлено {stats['inserted']}, "
+        f"обновлено {stats['updated']}, без изменений {stats['unchanged']}"
+    )
+    return stats
 
-def get_station_menu(station):
-    """Получает меню для конкретной станции"""
+def get_station_menu(station, timeout=None, known_fingerprint=None):
+    """
+    Получает меню для конкретной станции
+    
+    Args:
+        station (Station): Станция
+        timeout (float): Таймаут запроса, секунды
+        known_fingerprint (str): Отпечаток последнего применённого меню станции
+    
+    Returns:
+        tuple: (позиции меню, отпечаток ответа). Если ответ совпал с
+        known_fingerprint, он не разбирается и вместо позиций возвращается None
+    """
     # Используем поле r_keeper_number из модели станции
     station_number = station.r_keeper_number
     if not station_number:
         logger.error(f"Не указан номер станции в R-Keeper для {station.name}")
-        return [], None, None
+        return [], None
     
     logger.info(f"Получение меню для станции {station.name} (номер: {station_number})")
     
-    # Запрос для получения списка официантов
-    waiters_query = '''<?xml version="1.0" encoding="utf-8"?>
-    <RK7Query>
-        <RK7Command CMD="GetRefData" RefName="EMPLOYEES" OnlyActive="1">
-            <PROPFILTER>
-                <PROP name="Ident"/>
-                <PROP name="Code"/>
-                <PROP name="Name"/>
-                <PROP name="Status"/>
-                <PROP name="MainParentIdent"/>
-                <PROP name="Flags"/>
-            </PROPFILTER>
-        </RK7Command>
-    </RK7Query>'''
-    
     try:
-        # Получаем список официантов
-        waiters_response = session.post(
-            base_url,
-            data=waiters_query.encode('utf-8'),
-            verify=False,
-            headers={'Content-Type': 'application/xml'}
-        )
-        waiters_response.raise_for_status()
-        
-        # Логируем ответ для отладки
-        logger.info(f"Ответ от R-Keeper по запросу официантов: {waiters_response.text[:1000]}")
-        
-        # Парсим ответ со списком официантов
-        waiters_root = ET.fromstring(waiters_response.text)
-        
-        # Проверяем статус ответа
-        status = waiters_root.get('Status')
-        if status != "Ok":
-            logger.error(f"Ошибка при получении списка персонала: {waiters_root.get('ErrorText')}")
-            waiter_info = None
-        else:
-            waiters = waiters_root.findall('.//Item')
-            logger.info(f"Найдено {len(waiters)} сотрудников в ответе")
-            
-            # Сохраняем всех найденных сотрудников
-            for waiter in waiters:
-                waiter_info = {
-                    'code': waiter.get('Code', ''),
-                    'name': waiter.get('Name', ''),
-                    'guid': waiter.get('Ident', ''),
-                }
-                logger.info(f"Начинаем синхронизацию сотрудника: {waiter_info}")
-                try:
-                    waiter_obj, created = Waiter.objects.update_or_create(
-                        code=waiter_info['code'],
-                        defaults={
-                            'name': waiter_info['name'],
-                            'guid': waiter_info['guid'],
-                            'is_active': True
-                        }
-                    )
-                    if created:
-                        logger.info(f"Создан новый сотрудник: {waiter_obj.name}")
-                    else:
-                        logger.info(f"Обновлен сотрудник: {waiter_obj.name}")
-                except Exception as e:
-                    logger.error(f"Ошибка при создании/обновлении сотрудника {waiter_info['name']}: {e}")
-                    logger.exception("Полный стек ошибки:")
-    
         # Запрос для получения меню
         menu_query = f'''<?xml version="1.0" encoding="utf-8"?>
         <RK7Query>
@@ -191,141 +146,100 @@ def get_station_menu(station):
             </RK7CMD>
         </RK7Query>'''
         
-        response = session.post(
-            base_url,
-            data=menu_query.encode('utf-8'),
-            verify=False,
-            headers={'Content-Type': 'application/xml'}
-        )
+        response = get_rk7_client().post(menu_query, timeout=timeout)
         response.raise_for_status()
         
+        # Меню не изменилось с прошлой синхронизации - разбирать его незачем
+        fingerprint = response_fingerprint(response.content)
+        if known_fingerprint and fingerprint == known_fingerprint:
+            logger.info(f"Меню станции {station.name} не изменилось")
+            return None, fingerprint
+        
         # Парсим XML-ответ
-        root = ET.fromstring(response.text)
+        root = ET.fromstring(response.content)
         
         # Проверяем статус ответа
         status = root.get('Status')
         if status != "Ok":
             logger.error(f"Ошибка при получении меню для {station.name}: {root.get('ErrorText')}")
-            return [], None, None
+            return [], None
         
         # Получаем список блюд
         dishes = root.findall('.//Dishes/Item')
         logger.info(f"Получено {len(dishes)} позиций для станции {station.name}")
-        return dishes, waiter_info, None
+        return dishes, fingerprint
     except Exception as e:
         logger.error(f"Ошибка при получении меню для станции {station.name}: {e}")
         logger.exception("Полный стек ошибки:")
-        return [], None, None
+        return [], None
 
-def sync_station_menu(station, dish_names):
-    """Синхронизирует меню для конкретной станции"""
-    logger.info(f"Синхронизация меню для станции {station.name}")
+def fetch_station_menus(stations, concurrency, timeout, deadline, fingerprints=None):
+    """
+    Параллельно загружает меню станций
     
-    # Получаем меню станции и информацию об официанте
-    dishes, waiter_info, table_info = get_station_menu(station)
-    if not dishes:
-        logger.warning(f"Для станции {station.name} не получено ни одной позиции меню")
-        return False
+    Args:
+        stations (list): Станции
+        concurrency (int): Максимум одновременных запросов к R-Keeper
+        timeout (float): Таймаут запроса меню одной станции, секунды
+        deadline (float): Общий лимит времени на загрузку, секунды
+        fingerprints (dict): {station.id: отпечаток последнего применённого меню}
     
-    # Создаем словарь для хранения категорий
-    categories = {}
+    Returns:
+        dict: {station.id: результат get_station_menu}; станции, не успевшие
+        загрузиться до deadline, в результат не попадают
+    """
+    fingerprints = fingerprints or {}
     
-    # Обрабатываем каждое блюдо
-    for dish in dishes:
-        ident = dish.get('Ident', 'Н/Д')
-        price = float(dish.get('Price', 0)) / 100  # Конвертируем копейки в рубли
-        quantity = dish.get('Quantity', 0)
-        # Если количество равно 0, это означает неограниченное количество
-        if quantity == 0:
-            quantity = 2147483647  # Максимальное значение для IntegerField
-        
-        dish_info = dish_names.get(ident, {
-            'name': 'Без названия',
-            'code': 'Н/Д',
-            'recipe': '',
-            'category': 'Без категории'
-        })
-        
-        # Получаем или создаем категорию
-        category_name = dish_info['category']
-        if category_name not in categories:
-            category, created = Category.objects.get_or_create(
-                name=category_name,
-                station=station,
-                defaults={'rkeeper_id': f"CAT_{category_name}"}
-            )
-            categories[category_name] = category
-            if created:
-                logger.info(f"Создана новая категория: {category_name} для станции {station.name}")
-        
-        # Создаем или обновляем позицию меню
+    def fetch(station):
         try:
-            menu_item, created = MenuItem.objects.get_or_create(
-                rkeeper_id=ident,
-                station=station,
-                defaults={
-                    'name': dish_info['name'],
-                    'description': dish_info['recipe'],
-                    'price': price,
-                    'quantity': quantity,
-                    'category': categories[category_name],
-                    'is_available': True,  # Позиция доступна в R-Keeper
-                    'stop_list': False,    # По умолчанию не в стоп-листе
-                    'last_updated': timezone.now()
-                }
-            )
-            # Если запись уже существует, обновляем только определенные поля
-            if not created:
-                # Обновляем только поля, которые приходят из R-Keeper
-                # НЕ обновляем stop_list - это поле управляется только в админке
-                menu_item.price = price
-                menu_item.quantity = quantity
-                menu_item.is_available = True  # Позиция доступна в R-Keeper
-                menu_item.last_updated = timezone.now()
-                menu_item.save(update_fields=['price', 'quantity', 'is_available', 'last_updated'])
-        except Exception as e:
-            logger.error(f"Ошибка при создании/обновлении позиции меню {dish_info['name']}: {e}")
+            return get_station_menu(station, timeout=timeout, known_fingerprint=fingerprints.get(station.id))
+        finally:
+            # Поток мог открыть соединение с БД - не оставляем его висеть
+            connections.close_all()
     
-    # Отключаем позиции, которых больше нет в меню R-Keeper
-    # НЕ изменяем stop_list - это поле управляется только в админке
-    items_to_disable = MenuItem.objects.filter(station=station).exclude(
-        rkeeper_id__in=[dish.get('Ident') for dish in dishes]
-    )
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='menu-sync')
+    futures = {executor.submit(fetch, station): station for station in stations}
+    done, not_done = wait(futures, timeout=deadline)
+    executor.shutdown(wait=False, cancel_futures=True)
     
-    if items_to_disable.exists():
-        disabled_items = list(items_to_disable.values_list('name', flat=True))
-        disabled_count = items_to_disable.count()
-        logger.info(f"Отключаем {disabled_count} позиций из меню станции {station.name}: {', '.join(disabled_items)}")
-        # Устанавливаем is_available=False для позиций, которых нет в R-Keeper
-        # НЕ изменяем stop_list - это поле остается как есть
-        items_to_disable.update(is_available=False)
-    else:
-        logger.info(f"Нет позиций для отключения из меню станции {station.name}")
+    for future in not_done:
+        logger.error(f"Меню станции {futures[future].name} не загружено за {deadline} с, станция пропущена")
     
-    # Синхронизируем информацию об официанте, если она есть
-    if waiter_info:
-        logger.info(f"Начинаем синхронизацию официанта: {waiter_info}")
+    menus = {}
+    for future in done:
+        station = futures[future]
         try:
-            waiter_obj, created = Waiter.objects.update_or_create(
-                code=waiter_info['code'],
-                defaults={
-                    'name': waiter_info['name'],
-                    'guid': waiter_info['guid'],
-                    'is_active': True
-                }
-            )
-            if created:
-                logger.info(f"Создан новый официант: {waiter_obj.name}")
-            else:
-                logger.info(f"Обновлен официант: {waiter_obj.name}")
+            menus[station.id] = future.result()
         except Exception as e:
-            logger.error(f"Ошибка при создании/обновлении официанта {waiter_info['name']}: {e}")
-            logger.exception("Полный стек ошибки:")
-    else:
-        logger.warning("Информация об официанте отсутствует")
+            logger.error(f"Ошибка при получении меню для станции {station.name}: {e}")
+    return menus
+
+def sync_station_menu(station, dish_names, menu=None):
+    """
+    Синхронизирует меню для конкретной станции
+    
+    Args:
+        station (Station): Станция
+        dish_names (dict): Справочник блюд
+        menu (list): Заранее загруженные позиции меню (первый элемент результата
+            get_station_menu); если не передан, меню загружается здесь
+    """
+    logger.info(f"Синхронизация меню для станции {station.name}")
+    
+    # Получаем меню станции
+    dishes = menu
+    if dishes is None:
+        dishes, _ = get_station_menu(station)
+    if not dishes:
+        logger.warning(f"Для станции {station.name} не получено ни одной позиции меню")
+        return None
+    
+    # Сравниваем меню с базой и пишем пачками только изменившиеся позиции.
+    # Новые позиции по умолчанию не в стоп-листе
+    stats = apply_station_menu(station, dishes, dish_names, new_item_defaults={'stop_list': False})
     
     logger.info(f"Синхронизация меню для станции {station.name} завершена")
-    return True
+    return stats
 
 class Command(BaseCommand):
     help = 'Синхронизация меню и официантов из станций R-Keeper'
@@ -337,15 +251,47 @@ class Command(BaseCommand):
             help='ID конкретной станции для синхронизации',
             required=False
         )
+        parser.add_argument(
+            '--stations',
+            nargs='+',
+            help='Коды станций (rkeeper_code) для синхронизации',
+            required=False
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.MENU_SYNC_CONCURRENCY,
+            help='Сколько станций загружать одновременно'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=settings.MENU_SYNC_STATION_TIMEOUT,
+            help='Таймаут запроса меню одной станции, секунды'
+        )
+        parser.add_argument(
+            '--deadline',
+            type=float,
+            default=settings.MENU_SYNC_DEADLINE,
+            help='Общий лимит времени на загрузку меню всех станций, секунды'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Применить меню даже если ответ R-Keeper не изменился'
+        )
 
     def handle(self, *args, **options):
         station_id = options.get('station_id')
+        station_codes = options.get('stations')
         
-        # Получаем справочник названий блюд
-        dish_names = get_dish_names()
-        if not dish_names:
-            self.stdout.write(self.style.ERROR("Не удалось получить справочник блюд. Синхронизация прервана."))
-            return
+        # Итоги запуска, доступные вызывающему коду (например, задаче Celery)
+        self.sync_stats = {
+            'stations_synced': 0,
+            'stations_skipped': 0,
+            'stations_failed': 0,
+            'reference_skipped': True,
+        }
         
         # Получаем станции для синхронизации
         if station_id:
@@ -353,21 +299,89 @@ class Command(BaseCommand):
             if not stations.exists():
                 self.stdout.write(self.style.ERROR(f"Станция с ID {station_id} не найдена или неактивна"))
                 return
+        elif station_codes:
+            stations = Station.objects.filter(rkeeper_code__in=station_codes, is_active=True)
+            if not stations.exists():
+                self.stdout.write(self.style.ERROR(f"Станции {', '.join(station_codes)} не найдены или неактивны"))
+                return
         else:
             stations = Station.objects.filter(is_active=True)
             if not stations.exists():
                 self.stdout.write(self.style.WARNING("Нет активных станций в базе данных"))
                 return
         
-        self.stdout.write(f"Найдено {stations.count()} активных станций для синхронизации")
+        stations = list(stations)
+        self.stdout.write(f"Найдено {len(stations)} активных станций для синхронизации")
+        
+        # Справочник сотрудников общий для всех станций - загружаем его один раз
+        employees = get_employees()
+        if employees is None:
+            self.stdout.write(self.style.WARNING("Не удалось получить справочник сотрудников, официанты не обновлены"))
+        else:
+            try:
+                with transaction.atomic():
+                    waiter_stats = sync_waiters(employees)
+                self.stdout.write(
+                    f"Официанты синхронизированы: добавлено {waiter_stats['inserted']}, "
+                    f"обновлено {waiter_stats['updated']}, без изменений {waiter_stats['unchanged']}"
+                )
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Ошибка при синхронизации официантов: {e}"))
+        
+        # Отпечатки последних применённых меню: неизменившиеся меню не разбираются и не пишутся в базу
+        fingerprint_keys = {station.id: station_fingerprint_key(station) for station in stations}
+        known = {} if options['force'] else load_fingerprints(fingerprint_keys.values())
+        fingerprints = {station_id: known.get(key) for station_id, key in fingerprint_keys.items()}
+        
+        # Загружаем меню всех станций параллельно, медленная станция не задерживает остальные
+        menus = fetch_station_menus(
+            stations, options['concurrency'], options['timeout'], options['deadline'], fingerprints=fingerprints
+        )
         
-        # Синхронизируем меню для каждой станции
+        pending = []
         for station in stations:
+            if station.id not in menus:
+                self.stdout.write(self.style.ERROR(f"Меню для станции {station.name} не загружено вовремя"))
+                self.sync_stats['stations_failed'] += 1
+            elif menus[station.id][0] is None:
+                self.stdout.write(f"Меню для станции {station.name} не изменилось, синхронизация пропущена")
+                self.sync_stats['stations_skipped'] += 1
+            else:
+                pending.append(station)
+        
+        if not pending:
+            self.stdout.write(self.style.SUCCESS("Синхронизация меню завершена: изменений нет"))
+            return
+        
+        # Справочник блюд нужен только для создания новых позиций,
+        # поэтому запрашиваем его, лишь когда меню какой-то станции изменилось
+        dish_names = get_dish_names()
+        if not dish_names:
+            self.sync_stats['stations_failed'] += len(pending)
+            self.stdout.write(self.style.ERROR("Не удалось получить справочник блюд. Синхронизация прервана."))
+            return
+        self.sync_stats['reference_skipped'] = False
+        
+        # Применяем меню к базе последовательно
+        for station in pending:
+            dishes, fingerprint = menus[station.id]
             try:
                 with transaction.atomic():
-                    sync_station_menu(station, dish_names)
-                self.stdout.write(self.style.SUCCESS(f"Меню для станции {station.name} успешно синхронизировано"))
+                    stats = sync_station_menu(station, dish_names, menu=dishes)
+                    if stats is not None:
+                        store_fingerprint(fingerprint_keys[station.id], fingerprint)
+                if stats is None:
+                    self.sync_stats['stations_failed'] += 1
+                    self.stdout.write(self.style.WARNING(f"Меню для станции {station.name} не получено"))
+                    continue
+                self.sync_stats['stations_synced'] += 1
+                self.stdout.write(self.style.SUCCESS(
+                    f"Меню для станции {station.name} успешно синхронизировано: "
+                    f"добавлено {stats['inserted']}, обновлено {stats['updated']}, "
+                    f"без изменений {stats['unchanged']}, отключено {stats['disabled']}"
+                ))
             except Exception as e:
+                self.sync_stats['stations_failed'] += 1
                 self.stdout.write(self.style.ERROR(f"Ошибка при синхронизации меню для станции {station.name}: {e}"))
         
-        self.stdout.write(self.style.SUCCESS("Синхронизация меню завершена")) 
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS("Синхронизация меню завершена"))
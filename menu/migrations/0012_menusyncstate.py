@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0011_menuitem_stop_list'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='Ключ')),
+                ('fingerprint', models.CharField(max_length=64, verbose_name='Отпечаток ответа')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Состояние синхронизации меню',
+                'verbose_name_plural': 'Состояния синхронизации меню',
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0012_menusyncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menuitem',
+            name='reserved_quantity',
+            field=models.PositiveIntegerField(default=0, verbose_name='Зарезервировано'),
+        ),
+    ]
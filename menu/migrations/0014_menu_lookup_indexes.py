@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0013_menuitem_reserved_quantity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='station',
+            index=models.Index(fields=['rkeeper_id', 'is_active'], name='menu_station_rkeeper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(condition=models.Q(('is_available', True), ('stop_list', False)), fields=['station', 'category', 'name'], name='menu_item_visible_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 
-# Create your models here.
+# Количество, которым в базе обозначается неограниченный остаток блюда
+UNLIMITED_QUANTITY = 2147483647  # Максимальное значение для IntegerField
 
 class Station(models.Model):
     """Станция R-Keeper"""
@@ -13,6 +14,10 @@ class Station(models.Model):
     class Meta:
         verbose_name = 'Станция'
         verbose_name_plural = 'Станции'
+        indexes = [
+            # Поиск станции по ID в R-Keeper при показе меню и отправке заказа
+            models.Index(fields=['rkeeper_id', 'is_active'], name='menu_station_rkeeper_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -40,6 +45,7 @@ class MenuItem(models.Model):
     description_kk = models.TextField(verbose_name='Состав (казахский)', null=True, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=0, verbose_name='Цена', default=0)
     quantity = models.PositiveIntegerField(verbose_name='Количество', default=0)
+    reserved_quantity = models.PositiveIntegerField(verbose_name='Зарезервировано', default=0)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, verbose_name='Категория')
     station = models.ForeignKey(Station, on_delete=models.CASCADE, verbose_name='Станция', null=True, blank=True)
     rkeeper_id = models.CharField(max_length=50, verbose_name='ID в R-Keeper', null=True, blank=True)
@@ -51,6 +57,27 @@ class MenuItem(models.Model):
         verbose_name = 'Позиция меню'
         verbose_name_plural = 'Позиции меню'
         unique_together = ['rkeeper_id', 'station']
+        indexes = [
+            # Только видимые в меню позиции: индекс не растёт от выключенных и снятых блюд
+            models.Index(
+                fields=['station', 'category', 'name'],
+                condition=models.Q(is_available=True, stop_list=False),
+                name='menu_item_visible_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.station.name if self.station else 'Без станции'})"
+
+class MenuSyncState(models.Model):
+    """Отпечаток последнего применённого ответа R-Keeper для синхронизации меню"""
+    key = models.CharField(max_length=100, unique=True, verbose_name='Ключ')
+    fingerprint = models.CharField(max_length=64, verbose_name='Отпечаток ответа')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
+
+    class Meta:
+        verbose_name = 'Состояние синхронизации меню'
+        verbose_name_plural = 'Состояния синхронизации меню'
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,118 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from menu.models import MenuItem, Station
+
+logger = logging.getLogger(__name__)
+
+# Версия данных меню. Увеличивается при любом изменении меню (синхронизация,
+# правка в админке), после чего все снимки перестраиваются при первом обращении
+SNAPSHOT_VERSION_KEY = 'menu:snapshot:version'
+
+
+def _snapshot_key(station_code, language):
+    return f'menu:snapshot:{station_code}:{language}'
+
+
+def _new_version():
+    # Версия, начатая заново после вытеснения ключа, не совпадёт ни с одной из старых
+    version = time.time_ns()
+    if not cache.add(SNAPSHOT_VERSION_KEY, version, None):
+        version = cache.get(SNAPSHOT_VERSION_KEY, version)
+    return version
+
+
+def bump_menu_version():
+    """Помечает все снимки меню устаревшими"""
+    try:
+        cache.incr(SNAPSHOT_VERSION_KEY)
+    except ValueError:
+        _new_version()
+
+
+def build_menu_snapshot(station_code, language):
+    """
+    Строит снимок меню станции на указанном языке
+
+    Args:
+        station_code (str): Код станции (Station.rkeeper_id)
+        language (str): Код языка
+
+    Returns:
+        dict: Станция, категории и позиции меню в виде простых словарей
+        или None, если активной станции с таким кодом нет
+    """
+    station = Station.objects.filter(rkeeper_id=station_code, is_active=True).first()
+    if station is None:
+        return None
+
+    menu_items = MenuItem.objects.filter(
+        station=station,
+        is_available=True,  # Позиция доступна в R-Keeper
+        stop_list=False     # Позиция не в стоп-листе (не выключена вручную)
+    ).select_related('category').order_by('category__name', 'name')
+
+    items = []
+    categories = {}
+    for item in menu_items:
+        name = item.name
+        description = item.description
+        # Если язык казахский, заменяем названия и описания на казахские
+        if language == 'kk':
+            name = item.name_kk or name
+            description = item.description_kk or description
+        items.append({
+            'id': item.id,
+            'name': name,
+            'description': description or '',
+            'price': item.price,
+            'quantity': item.quantity,
+            'photo_url': item.photo.url if item.photo else '',
+            'category_id': item.category_id,
+        })
+        # Только категории, в которых есть доступные блюда
+        categories.setdefault(item.category_id, {'id': item.category_id, 'name': item.category.name})
+
+    return {
+        'station': {
+            'id': station.id,
+            'name': station.name,
+            'rkeeper_id': station.rkeeper_id,
+            'rkeeper_code': station.rkeeper_code,
+        },
+        'categories': list(categories.values()),
+        'items': items,
+    }
+
+
+def get_menu_snapshot(station_code, language):
+    """
+    Возвращает снимок меню станции из кэша, перестраивая его при смене версии
+
+    Версия и снимок читаются из кэша одним запросом.
+
+    Returns:
+        dict: Снимок (см. build_menu_snapshot) или None, если станция не найдена
+    """
+    key = _snapshot_key(station_code, language)
+    cached = cache.get_many([SNAPSHOT_VERSION_KEY, key])
+    version = cached.get(SNAPSHOT_VERSION_KEY)
+    if version is None:
+        version = _new_version()
+
+    snapshot = cached.get(key)
+    if snapshot is not None and snapshot['version'] == version:
+        return snapshot
+
+    # Версия прочитана до обращения к базе: если меню изменится во время
+    # построения, снимок сохранится со старой версией и будет перестроен
+    snapshot = build_menu_snapshot(station_code, language)
+    if snapshot is None:
+        return None
+    snapshot['version'] = version
+    cache.set(key, snapshot, settings.MENU_SNAPSHOT_TIMEOUT)
+    logger.debug(f"Построен снимок меню станции {station_code} ({language}), версия {version}")
+    return snapshot
@@ -1,45 +1,93 @@
-import requests
 import xml.etree.ElementTree as ET
-from urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
-from urllib3.util.ssl_ import create_urllib3_context
-import warnings
-import ssl
-import os
+import hashlib
 import logging
+from decimal import Decimal
+from orders.services.rk7_client import get_rk7_client
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("menu_sync.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
-# Отключаем предупреждения SSL
-warnings.filterwarnings('ignore', message='Unverified HTTPS request')
+# Описание блюда, отсутствующего в справочнике MenuItems
+DEFAULT_DISH_INFO = {
+    'name': 'Без названия',
+    'code': 'Н/Д',
+    'recipe': '',
+    'category': 'Без категории'
+}
+
+def response_fingerprint(content):
+    """
+    Возвращает отпечаток (sha256) ответа R-Keeper
+
+    Атрибуты корневого элемента RK7QueryResult (время сервера, длительность
+    обработки и т.п.) меняются при каждом запросе, поэтому в отпечаток
+    попадает только содержимое ответа после открывающего тега.
+
+    Args:
+        content (bytes): Тело ответа
+    """
+    start = content.find(b'<RK7QueryResult')
+    if start != -1:
+        content = content[content.find(b'>', start) + 1:]
+    return hashlib.sha256(content).hexdigest()
+
+def station_fingerprint_key(station):
+    """Ключ отпечатка меню станции в MenuSyncState"""
+    return f"GetOrderMenu:{station.rkeeper_code}"
+
+def load_fingerprints(keys):
+    """Возвращает сохранённые отпечатки {ключ: отпечаток} одним запросом"""
+    from .models import MenuSyncState
+
+    return dict(MenuSyncState.objects.filter(key__in=keys).values_list('key', 'fingerprint'))
+
+def store_fingerprint(key, fingerprint):
+    """Сохраняет отпечаток успешно применённого ответа"""
+    from .models import MenuSyncState
 
-class CustomAdapter(HTTPAdapter):
-    def init_poolmanager(self, *args, **kwargs):
-        context = create_urllib3_context(ssl_version=ssl.PROTOCOL_SSLv23)
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
-        context.set_ciphers('ALL:@SECLEVEL=0')
-        kwargs['ssl_context'] = context
-        return super(CustomAdapter, self).init_poolmanager(*args, **kwargs)
+    MenuSyncState.objects.update_or_create(key=key, defaults={'fingerprint': fingerprint})
 
-# Настройка сессии с retry-логикой
-session = requests.Session()
-retry = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
-adapter = CustomAdapter(max_retries=retry)
-session.mount('http://', adapter)
-session.mount('https://', adapter)
+def iter_reference_items(stream):
+    """
+    Потоково разбирает ответ GetRefData и по одному выдаёт атрибуты элементов Item
 
-# Конфигурация из переменных окружения
-base_url = os.environ.get('RKEEPER_API_URL', 'https://example.com/rk7api/v0/xmlinterface.xml')
+    Дерево целиком в памяти не строится: каждый разобранный Item сразу
+    удаляется из родителя, поэтому память не зависит от размера справочника.
+
+    Args:
+        stream: Файлоподобный объект с телом ответа в байтах
+
+    Yields:
+        dict: Атрибуты очередного элемента Item
+    """
+    parents = []
+    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            if not parents and elem.get('Status') != 'Ok':
+                raise ValueError(f"R-Keeper вернул ошибку: {elem.get('ErrorText')}")
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag == 'Item':
+            yield dict(elem.attrib)
+            if parents:
+                parents[-1].remove(elem)
+
+def iter_dish_records(stream):
+    """
+    Выдаёт активные блюда справочника MenuItems
+
+    Yields:
+        tuple: (ident, {'name', 'code', 'recipe', 'category'})
+    """
+    for item in iter_reference_items(stream):
+        if item.get('Status') == 'rsActive':
+            category = item.get('CategPath', '').split('\\')[-1] if item.get('CategPath') else 'Без категории'
+            yield item.get('ItemIdent'), {
+                'name': item.get('Name', 'Без названия'),
+                'code': item.get('Code', 'Н/Д'),
+                'recipe': item.get('RecipeText', ''),
+                'category': category
+            }
 
 def get_dish_names():
     """Получает справочник названий блюд"""
@@ -67,25 +115,14 @@ def get_dish_names():
     </RK7Query>'''
     
     try:
-        response = session.post(
-            base_url,
-            data=xml_query.encode('utf-8'),
-            verify=False,
-            headers={'Content-Type': 'application/xml'}
-        )
-        response.raise_for_status()
-        
-        root = ET.fromstring(response.text)
-        dish_names = {}
-        for item in root.findall('.//Item'):
-            if item.get('Status') == 'rsActive':
-                category = item.get('CategPath', '').split('\\')[-1] if item.get('CategPath') else 'Без категории'
-                dish_names[item.get('ItemIdent')] = {
-                    'name': item.get('Name', 'Без названия'),
-                    'code': item.get('Code', 'Н/Д'),
-                    'recipe': item.get('RecipeText', ''),
-                    'category': category
-                }
+        response = get_rk7_client().post(xml_query, stream=True)
+        try:
+            response.raise_for_status()
+            # Разбираем тело по мере получения, не загружая его в память целиком
+            response.raw.decode_content = True
+            dish_names = dict(iter_dish_records(response.raw))
+        finally:
+            response.close()
         logger.info(f"Получен справочник из {len(dish_names)} позиций")
         return dish_names
     except Exception as e:
@@ -114,12 +151,7 @@ def get_station_menu(station):
     '''
     
     try:
-        response = session.post(
-            base_url,
-            data=xml_query.encode('utf-8'),
-            verify=False,
-            headers={'Content-Type': 'application/xml'}
-        )
+        response = get_rk7_client().post(xml_query)
         response.raise_for_status()
         
         root = ET.fromstring(response.text)
@@ -136,85 +168,139 @@ def get_station_menu(station):
         logger.error(f"Ошибка при получении меню для станции {station.name}: {e}")
         return []
 
-def sync_station_menu(station, dish_names):
-    """Синхронизирует меню для конкретной станции"""
+def parse_dish(dish):
+    """
+    Возвращает (ident, цена, количество) позиции из ответа GetOrderMenu
+
+    Цена приходит в копейках и приводится к точности поля MenuItem.price.
+    """
+    from .models import UNLIMITED_QUANTITY
+
+    ident = dish.get('Ident', 'Н/Д')
+    price = (Decimal(dish.get('Price') or 0) / 100).quantize(Decimal('1'))  # Конвертируем копейки в рубли
+    quantity = dish.get('Quantity')
+    # Если количество не передано, оно не ограничено
+    quantity = UNLIMITED_QUANTITY if quantity is None else int(quantity)
+    return ident, price, quantity
+
+def apply_station_menu(station, dishes, dish_names, new_item_defaults=None):
+    """
+    Применяет меню станции к базе данных
+
+    Загружает текущие позиции станции одним запросом, сравнивает их с меню
+    из R-Keeper и пишет пачками только изменившиеся строки.
+
+    Args:
+        station (Station): Станция
+        dishes (list): Позиции меню из ответа GetOrderMenu
+        dish_names (dict): Справочник блюд {ident: {...}}
+        new_item_defaults (dict): Дополнительные значения полей для новых позиций
+
+    Returns:
+        dict: Количество добавленных, обновлённых, неизменных и отключённых позиций
+    """
+    from django.db import transaction
     from django.utils import timezone
     from .models import Category, MenuItem
-    
-    logger.info(f"Синхронизация меню для станции {station.name}")
-    
-    dishes = get_station_menu(station)
-    if not dishes:
-        logger.warning(f"Для станции {station.name} не получено ни одной позиции меню")
-        return False
-    
-    categories = {}
-    
+    from .services.menu_snapshot import bump_menu_version
+
+    now = timezone.now()
+    stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'disabled': 0}
+
+    incoming = {}
     for dish in dishes:
-        ident = dish.get('Ident', 'Н/Д')
-        price = float(dish.get('Price', 0)) / 100  # Конвертируем копейки в рубли
-        quantity = dish.get('Quantity', 0)
-        # Если количество равно 0, это означает неограниченное количество
-        if quantity == 0:
-            quantity = 2147483647  # Максимальное значение для IntegerField
-        
-        dish_info = dish_names.get(ident, {
-            'name': 'Без названия',
-            'code': 'Н/Д',
-            'recipe': '',
-            'category': 'Без категории'
+        ident, price, quantity = parse_dish(dish)
+        incoming[ident] = (price, quantity, dish_names.get(ident, DEFAULT_DISH_INFO))
+
+    existing_items = list(
+        MenuItem.objects.filter(station=station).only('id', 'name', 'rkeeper_id', 'price', 'quantity', 'is_available')
+    )
+    existing = {item.rkeeper_id: item for item in existing_items if item.rkeeper_id}
+
+    # Категории нужны только для новых позиций
+    categories = {category.name: category for category in Category.objects.filter(station=station)}
+    missing_categories = {
+        info['category'] for ident, (_, _, info) in incoming.items() if ident not in existing
+    } - categories.keys()
+    if missing_categories:
+        Category.objects.bulk_create([
+            Category(name=name, station=station, rkeeper_id=f"CAT_{name}") for name in missing_categories
+        ])
+        categories.update({
+            category.name: category
+            for category in Category.objects.filter(station=station, name__in=missing_categories)
         })
-        
-        category_name = dish_info['category']
-        if category_name not in categories:
-            category, created = Category.objects.get_or_create(
-                name=category_name,
-                station=station,
-                defaults={'rkeeper_id': f"CAT_{category_name}"}
-            )
-            categories[category_name] = category
-            if created:
-                logger.info(f"Создана новая категория: {category_name} для станции {station.name}")
-        
-        try:
-            menu_item, created = MenuItem.objects.get_or_create(
+        logger.info(f"Создано {len(missing_categories)} новых категорий для станции {station.name}")
+
+    to_create = []
+    to_update = []
+    for ident, (price, quantity, info) in incoming.items():
+        menu_item = existing.get(ident)
+        if menu_item is None:
+            to_create.append(MenuItem(
                 rkeeper_id=ident,
                 station=station,
-                defaults={
-                    'name': dish_info['name'],
-                    'description': dish_info['recipe'],
-                    'price': price,
-                    'quantity': quantity,
-                    'category': categories[category_name],
-                    'is_available': True,
-                    'last_updated': timezone.now()
-                }
-            )
-            # Если запись уже существует, обновляем цену, количество и доступность
-            if not created:
-                menu_item.price = price
-                menu_item.quantity = quantity
-                menu_item.is_available = True  # Включаем блюдо, если оно есть в меню
-                menu_item.last_updated = timezone.now()
-                menu_item.save(update_fields=['price', 'quantity', 'is_available', 'last_updated'])
-                logger.info(f"Обновлена позиция меню: {dish_info['name']} для станции {station.name}")
-            else:
-                logger.info(f"Создана новая позиция меню: {dish_info['name']} для станции {station.name}")
-        except Exception as e:
-            logger.error(f"Ошибка при создании/обновлении позиции меню {dish_info['name']}: {e}")
-    
+                name=info['name'],
+                description=info['recipe'],
+                price=price,
+                quantity=quantity,
+                category=categories[info['category']],
+                is_available=True,
+                last_updated=now,
+                **(new_item_defaults or {})
+            ))
+        elif menu_item.price != price or menu_item.quantity != quantity or not menu_item.is_available:
+            menu_item.price = price
+            menu_item.quantity = quantity
+            menu_item.is_available = True  # Включаем блюдо, если оно есть в меню
+            menu_item.last_updated = now
+            to_update.append(menu_item)
+        else:
+            stats['unchanged'] += 1
+
+    # Обновляем только поля, которые приходят из R-Keeper.
+    # НЕ обновляем stop_list - это поле управляется только в админке
+    MenuItem.objects.bulk_create(to_create, batch_size=500)
+    MenuItem.objects.bulk_update(to_update, ['price', 'quantity', 'is_available', 'last_updated'], batch_size=500)
+    stats['inserted'] = len(to_create)
+    stats['updated'] = len(to_update)
+
     # Отключаем позиции, которых больше нет в меню R-Keeper
-    items_to_disable = MenuItem.objects.filter(station=station).exclude(
-        rkeeper_id__in=[dish.get('Ident') for dish in dishes]
+    items_to_disable = [
+        item for item in existing_items if item.rkeeper_id not in incoming and item.is_available
+    ]
+    if items_to_disable:
+        logger.info(
+            f"Отключаем {len(items_to_disable)} позиций из меню станции {station.name}: "
+            f"{', '.join(item.name for item in items_to_disable)}"
+        )
+        MenuItem.objects.filter(id__in=[item.id for item in items_to_disable]).update(is_available=False, last_updated=now)
+        stats['disabled'] = len(items_to_disable)
+
+    logger.info(
+        f"Меню станции {station.name}: добавлено {stats['inserted']}, обновлено {stats['updated']}, "
+        f"без изменений {stats['unchanged']}, отключено {stats['disabled']}"
     )
-    
-    if items_to_disable.exists():
-        disabled_items = list(items_to_disable.values_list('name', flat=True))
-        disabled_count = items_to_disable.count()
-        logger.info(f"Отключаем {disabled_count} позиций из меню станции {station.name}: {', '.join(disabled_items)}")
-        items_to_disable.update(is_available=False)
-    else:
-        logger.info(f"Нет позиций для отключения из меню станции {station.name}")
-    
+
+    # Снимки меню перестраиваются после фиксации изменений
+    if stats['inserted'] or stats['updated'] or stats['disabled']:
+        transaction.on_commit(bump_menu_version)
+    return stats
+
+def sync_station_menu(station, dish_names):
+    """
+    Синхронизирует меню для конкретной станции
+
+    Returns:
+        dict: Статистика apply_station_menu или None, если меню не получено
+    """
+    logger.info(f"Синхронизация меню для станции {station.name}")
+
+    dishes = get_station_menu(station)
+    if not dishes:
+        logger.warning(f"Для станции {station.name} не получено ни одной позиции меню")
+        return None
+
+    stats = apply_station_menu(station, dishes, dish_names)
     logger.info(f"Синхронизация меню для станции {station.name} завершена")
-    return True 
\ No newline at end of file
+    return stats
@@ -3,6 +3,8 @@ from django.core.management import call_command
 from django.utils import timezone
 import logging
 
+from .management.commands.sync_menu_from_stations import Command as SyncMenuCommand
+
 logger = logging.getLogger(__name__)
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=300)
@@ -14,12 +16,18 @@ def sync_menu_from_stations_task(self):
         logger.info("Запуск задачи синхронизации меню из станций R-Keeper")
         
         # Вызываем Django команду для синхронизации
-        call_command('sync_menu_from_stations', '--verbosity=2')
+        command = SyncMenuCommand()
+        call_command(command, '--verbosity=2')
+        sync_stats = getattr(command, 'sync_stats', {})
         
-        logger.info("Синхронизация меню завершена успешно")
+        logger.info(f"Синхронизация меню завершена успешно: {sync_stats}")
         return {
             'status': 'success',
             'message': 'Синхронизация меню завершена успешно',
+            'stations_synced': sync_stats.get('stations_synced', 0),
+            'stations_skipped': sync_stats.get('stations_skipped', 0),
+            'stations_failed': sync_stats.get('stations_failed', 0),
+            'reference_skipped': sync_stats.get('reference_skipped', False),
             'timestamp': timezone.now().isoformat()
         }
         
@@ -49,8 +57,9 @@ def manual_sync_menu_task(station_codes=None):
     try:
         logger.info(f"Запуск ручной синхронизации меню для станций: {station_codes or 'все'}")
         
-        # Формируем аргументы команды
-        cmd_args = ['sync_menu_from_stations', '--verbosity=2']
+        # Формируем аргументы команды. Ручная синхронизация применяет меню,
+        # даже если ответ R-Keeper не изменился
+        cmd_args = ['sync_menu_from_stations', '--verbosity=2', '--force']
         if station_codes:
             cmd_args.extend(['--stations'] + station_codes)
         
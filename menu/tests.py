@@ -1,3 +1,111 @@
-from django.test import TestCase
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.query_budget import QueryBudgetTestMixin
+
+from .admin import MenuItemAdmin
+from .management.commands.sync_menu_from_stations import sync_station_menu
+from .models import Category, MenuItem, Station
+
+
+@skipUnless(connection.vendor == 'postgresql', 'План запроса проверяется только на PostgreSQL')
+class MenuLookupIndexTests(TestCase):
+    """Запросы показа меню используют индексы, а не полный просмотр таблиц"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.station = Station.objects.create(name='Зал', rkeeper_code='1', rkeeper_id='101')
+        category = Category.objects.create(name='Супы', station=cls.station)
+        MenuItem.objects.bulk_create([
+            MenuItem(
+                name=f'Блюдо {i}', category=category, station=cls.station, rkeeper_id=str(i),
+                is_available=i % 3 != 0, stop_list=i % 5 == 0,
+            )
+            for i in range(200)
+        ])
+
+    def setUp(self):
+        # На маленькой тестовой таблице планировщик предпочёл бы полный просмотр
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def test_visible_menu_items_use_partial_index(self):
+        plan = MenuItem.objects.filter(
+            station=self.station, is_available=True, stop_list=False
+        ).order_by('category', 'name').explain()
+        self.assertIn('menu_item_visible_idx', plan)
+
+    def test_station_lookup_uses_index(self):
+        plan = Station.objects.filter(rkeeper_id='101', is_active=True).explain()
+        self.assertIn('menu_station_rkeeper_idx', plan)
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class MenuAdminQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Страницы админки меню укладываются в бюджет запросов при любом числе строк"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        for i in range(5):
+            station = Station.objects.create(name=f'Зал {i}', rkeeper_code=str(i), rkeeper_id=str(100 + i))
+            category = Category.objects.create(name=f'Категория {i}', station=station)
+            MenuItem.objects.bulk_create([
+                MenuItem(name=f'Блюдо {i}-{j}', category=category, station=station, rkeeper_id=f'{i}{j}')
+                for j in range(10)
+            ])
+        cls.item = MenuItem.objects.first()
+
+    def setUp(self):
+        # Бюджет должен выдерживать и первый запрос после сброса справочников
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_changelists_within_budget(self):
+        for model in (Station, Category, MenuItem):
+            with self.subTest(model=model.__name__):
+                self.assertChangelistWithinBudget(self.client, admin.site._registry[model])
+
+    def test_menu_item_change_within_budget(self):
+        with self.assertQueryBudget(MenuItemAdmin.change_query_budget, 'MenuItem change'):
+            response = self.client.get(reverse('admin:menu_menuitem_change', args=[self.item.pk]))
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class MenuAdminInvalidationTests(TestCase):
+    """Снимки меню сбрасываются только после фиксации изменений из админки"""
+
+    def test_version_bumped_on_commit(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        with mock.patch('menu.admin.bump_menu_version') as bump, \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(reverse('admin:menu_station_add'), {
+                'name': 'Терраса', 'rkeeper_code': '7', 'rkeeper_id': '107', 'r_keeper_number': 7, 'is_active': 'on',
+            })
+            bump.assert_not_called()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(callbacks), 1)
+        bump.assert_called_once()
+
+
+class SyncStationMenuTests(TestCase):
+    """Синхронизация станции без заранее загруженного меню"""
+
+    @mock.patch('menu.management.commands.sync_menu_from_stations.apply_station_menu')
+    @mock.patch('menu.management.commands.sync_menu_from_stations.get_station_menu')
+    def test_fetches_menu_when_not_given(self, get_station_menu, apply_station_menu):
+        station = Station.objects.create(name='Зал', rkeeper_code='1', rkeeper_id='101', r_keeper_number=1)
+        dishes = [mock.Mock()]
+        get_station_menu.return_value = (dishes, 'fingerprint')
+
+        stats = sync_station_menu(station, {})
+
+        self.assertEqual(stats, apply_station_menu.return_value)
+        self.assertEqual(apply_station_menu.call_args.args[1], dishes)
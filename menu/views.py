@@ -1,8 +1,11 @@
 from django.shortcuts import render, get_object_or_404
 from django.http import Http404
 from django.utils.translation import get_language
-from .models import MenuItem, Category, Station
+from .models import MenuItem, Station
+from .services.menu_snapshot import get_menu_snapshot
+from core.query_budget import query_budget
 
+@query_budget(8)
 def menu_list(request, station_id=None, table=None):
     """
     Отображение меню или списка станций
@@ -11,9 +14,12 @@ def menu_list(request, station_id=None, table=None):
     - station_id: код станции (из URL или GET-параметра)
     - table: номер стола (из URL или GET-параметра)
     """
-    # Получаем параметры из URL, GET-запроса или сессии
+    # Получаем параметры из URL, GET-запроса или сессии.
+    # Номер стола из GET-параметра или cookie определяет TableNumberMiddleware
     station_code = station_id or request.GET.get('station_id') or request.session.get('station_code')
-    table_number = table or request.GET.get('table') or request.session.get('table_number')
+    if table:
+        request.table_number = table
+    table_number = request.table_number
     
     # Получаем текущий язык
     current_language = get_language()
@@ -27,43 +33,27 @@ def menu_list(request, station_id=None, table=None):
         'stations': Station.objects.filter(is_active=True)
     }
     
-    # Если указан код станции, показываем меню этой станции
+    # Если указан код станции, показываем меню этой станции.
+    # Меню берётся из снимка в кэше и перестраивается только после изменений
     if station_code:
-        station = get_object_or_404(Station, rkeeper_id=station_code, is_active=True)
-        items = MenuItem.objects.filter(
-            station=station,
-            is_available=True,  # Позиция доступна в R-Keeper
-            stop_list=False     # Позиция не в стоп-листе (не выключена вручную)
-        ).select_related('category').order_by('category__name', 'name')
-        
-        # Если язык казахский, заменяем названия и описания на казахские
-        if current_language == 'kk':
-            for item in items:
-                if item.name_kk:
-                    item.name = item.name_kk
-                if item.description_kk:
-                    item.description = item.description_kk
-        
-        # Получаем только те категории, в которых есть доступные блюда
-        categories_with_items = Category.objects.filter(
-            station=station,
-            menuitem__is_available=True,  # Позиция доступна в R-Keeper
-            menuitem__stop_list=False     # Позиция не в стоп-листе
-        ).distinct()
+        snapshot = get_menu_snapshot(station_code, current_language)
+        if snapshot is None:
+            raise Http404("Station not found")
         
         context.update({
-            'station': station,
-            'categories': categories_with_items,
-            'items': items
+            'station': snapshot['station'],
+            'categories': snapshot['categories'],
+            'items': snapshot['items']
         })
         
-        # Сохраняем параметры в сессии
-        request.session['station_code'] = station_code
-        if table_number:
-            request.session['table_number'] = table_number
+        # Сохраняем станцию в сессии, только если она сменилась:
+        # иначе каждый просмотр меню перезаписывал бы сессию в базе
+        if request.session.get('station_code') != station_code:
+            request.session['station_code'] = station_code
     
     return render(request, 'menu/menu_list.html', context)
 
+@query_budget(5)
 def menu_detail(request, item_id):
     """
     Детальная информация о позиции меню
@@ -73,7 +63,7 @@ def menu_detail(request, item_id):
     """
     # Получаем параметры из сессии
     station_code = request.session.get('station_code')
-    table_number = request.session.get('table_number')
+    table_number = request.table_number
     
     # Получаем позицию меню
     item = get_object_or_404(MenuItem, id=item_id, is_available=True, stop_list=False)
@@ -1,15 +1,64 @@
+from django import forms
 from django.contrib import admin
-from .models import Order, OrderItem, Waiter, Table
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.utils import timezone
+from core.query_budget import QueryBudgetAdminMixin
+from menu.admin import CategoryListFilter
+from .models import Order, OrderItem, Waiter, Table, RKeeperOutbox
+
+class LoadedAutocompleteSelect(AutocompleteSelect):
+    """
+    Автодополнение, которое подписывает выбранное значение уже загруженным
+    объектом (selected_object), а не отдельным запросом на каждую строку inline
+    """
+
+    selected_object = None
+
+    def optgroups(self, name, value, attr=None):
+        obj = self.selected_object
+        if obj is None or [str(v) for v in value if v not in ('', None)] != [str(obj.pk)]:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        options.append(self.create_option(
+            name, obj.pk, self.choices.field.label_from_instance(obj), True, len(options)
+        ))
+        return [(None, options, 0)]
+
+
+class OrderItemInlineForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.menu_item_id and 'menu_item' in self.fields:
+            widget = self.fields['menu_item'].widget
+            # Админка оборачивает виджет в RelatedFieldWidgetWrapper
+            getattr(widget, 'widget', widget).selected_object = self.instance.menu_item
+
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
+    form = OrderItemInlineForm
     extra = 0
     readonly_fields = ('price', 'total')
     fields = ('menu_item', 'quantity', 'price', 'total')
+    # Выпадающий список всех блюд строился бы заново для каждой строки
+    autocomplete_fields = ['menu_item']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('menu_item__station')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'menu_item':
+            # Подпись выбранного блюда берётся из строки inline (см. get_queryset)
+            kwargs['widget'] = LoadedAutocompleteSelect(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 @admin.register(Table)
-class TableAdmin(admin.ModelAdmin):
+class TableAdmin(QueryBudgetAdminMixin, admin.ModelAdmin):
     list_display = ('name','number', 'station_id', 'waiter', 'is_active')
+    list_select_related = ('waiter',)
+    changelist_query_budget = 6
     list_filter = ('is_active', 'station_id')
     search_fields = ('number', 'station_id', 'waiter__name')
     ordering = ('number',)
@@ -29,8 +78,11 @@ class TableAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at')
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(QueryBudgetAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'station_id', 'table', 'total_amount', 'status', 'created_at')
+    list_select_related = ('table__waiter',)
+    changelist_query_budget = 6
+    change_query_budget = 8
     list_filter = ('status', 'created_at')
     search_fields = ('id', 'table__number', 'payment_id', 'rkeeper_order_id')
     readonly_fields = ('created_at', 'updated_at')
@@ -49,10 +101,18 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'table':
+            # Подпись стола включает официанта
+            kwargs['queryset'] = Table.objects.select_related('waiter')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(QueryBudgetAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'order', 'menu_item', 'quantity', 'price', 'total')
-    list_filter = ('order__status', 'menu_item__category')
+    list_filter = ('order__status', ('menu_item__category', CategoryListFilter))
+    list_select_related = ('order__table', 'menu_item__station')
+    changelist_query_budget = 7
     search_fields = ('order__id', 'menu_item__name')
     readonly_fields = ('total',)
     
@@ -62,7 +122,8 @@ class OrderItemAdmin(admin.ModelAdmin):
         return self.readonly_fields
 
 @admin.register(Waiter)
-class WaiterAdmin(admin.ModelAdmin):
+class WaiterAdmin(QueryBudgetAdminMixin, admin.ModelAdmin):
+    changelist_query_budget = 6
     list_display = ('name', 'code', 'guid', 'is_active', 'created_at')
     list_filter = ('is_active',)
     search_fields = ('name', 'code', 'guid')
@@ -80,3 +141,26 @@ class WaiterAdmin(admin.ModelAdmin):
         }),
     )
     readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(RKeeperOutbox)
+class RKeeperOutboxAdmin(QueryBudgetAdminMixin, admin.ModelAdmin):
+    list_display = ('order', 'status', 'attempts', 'next_attempt_at', 'updated_at')
+    list_select_related = ('order__table',)
+    changelist_query_budget = 6
+    list_filter = ('status',)
+    search_fields = ('order__id', 'order__payment_id', 'last_error')
+    readonly_fields = ('order', 'attempts', 'lease', 'last_error', 'created_at', 'updated_at')
+    actions = ['retry_dispatch']
+
+    def retry_dispatch(self, request, queryset):
+        from .tasks import dispatch_rkeeper_outbox
+
+        # Записи в статусе 'processing' сейчас отправляются: их сброс позволил бы
+        # другому воркеру отправить тот же заказ параллельно
+        updated = queryset.exclude(status__in=['sent', 'processing']).update(
+            status='pending', attempts=0, next_attempt_at=timezone.now()
+        )
+        dispatch_rkeeper_outbox.delay()
+        self.message_user(request, f"Повторная отправка запланирована для {updated} заказов")
+
+    retry_dispatch.short_description = "Повторить отправку в R-Keeper"
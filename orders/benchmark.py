@@ -0,0 +1,294 @@
+import json
+import math
+import platform
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.redis_client import get_redis_client
+
+from menu.models import Category, MenuItem, Station, UNLIMITED_QUANTITY
+from orders.models import Table, Waiter
+
+# Шаги воронки заказа в порядке прохождения
+SCENARIOS = ['menu_list', 'add_to_cart', 'cart_data', 'checkout', 'create_order', 'payment_callback']
+
+BENCHMARK_STATION_CODE = 'BENCH'
+
+
+def seed_benchmark_data(menu_size=200, categories=10, tables=20):
+    """
+    Заполняет базу станцией, меню и столами для замеров
+
+    Остатки не ограничены, чтобы резервирование не прерывало прогон.
+
+    Returns:
+        Station: Станция с меню
+    """
+    station, _ = Station.objects.get_or_create(
+        rkeeper_code=BENCHMARK_STATION_CODE,
+        defaults={'name': 'Benchmark', 'rkeeper_id': BENCHMARK_STATION_CODE, 'r_keeper_number': 1},
+    )
+    category_objects = [
+        Category.objects.get_or_create(name=f'Категория {i + 1}', station=station)[0]
+        for i in range(categories)
+    ]
+    MenuItem.objects.filter(station=station).delete()
+    MenuItem.objects.bulk_create([
+        MenuItem(
+            name=f'Блюдо {i + 1}',
+            price=100 + i % 50 * 10,
+            quantity=UNLIMITED_QUANTITY,
+            category=category_objects[i % categories],
+            station=station,
+            rkeeper_id=str(100000 + i),
+            is_available=True,
+            stop_list=False,
+        )
+        for i in range(menu_size)
+    ])
+    waiter, _ = Waiter.objects.get_or_create(code='BENCH', defaults={'name': 'Benchmark'})
+    for number in range(1, tables + 1):
+        Table.objects.update_or_create(
+            number=number, defaults={'station_id': BENCHMARK_STATION_CODE, 'waiter': waiter, 'is_active': True}
+        )
+    return station
+
+
+@contextmanager
+def isolated_storage():
+    """
+    Отдельные ключи кэша и корзин на время замеров
+
+    Замеры идут на тестовой базе, но с рабочими Redis: без отдельного
+    префикса версии справочников и снимков меню, поднятые на тестовых
+    данных, попали бы в общий кэш, и рабочие запросы получили бы столы
+    и меню из тестовой базы. Ключи прогона удаляются после него
+    (RedisCache.clear() очистил бы всю базу Redis, поэтому он не используется).
+    """
+    run_prefix = f'bench-{uuid.uuid4().hex[:12]}'
+    caches_config = {}
+    for alias, config in settings.CACHES.items():
+        config = {**config, 'KEY_PREFIX': f"{config.get('KEY_PREFIX', '')}:{run_prefix}"}
+        if not issubclass(import_string(config['BACKEND']), RedisCache):
+            # Локальный кэш очищается целиком, поэтому ему нужно своё хранилище
+            config['LOCATION'] = f"{config.get('LOCATION', '')}-{run_prefix}"
+        caches_config[alias] = config
+    with override_settings(CACHES=caches_config, CART_KEY_PREFIX=f'{run_prefix}:cart'):
+        try:
+            yield
+        finally:
+            _delete_run_keys(run_prefix)
+
+
+def _delete_run_keys(run_prefix):
+    urls = set()
+    for alias, config in settings.CACHES.items():
+        cache = caches[alias]
+        if isinstance(cache, RedisCache):
+            urls.update(re.split('[;,]', config['LOCATION']))
+        else:
+            cache.clear()
+    if settings.CART_BACKEND == 'redis':
+        urls.add(settings.CART_REDIS_URL)
+    for url in urls:
+        client = get_redis_client(url)
+        keys = list(client.scan_iter(match=f'*{run_prefix}*'))
+        if keys:
+            client.delete(*keys)
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+class _FakeResponse:
+    """Ответ внешнего сервиса для замеров без сети"""
+
+    def __init__(self, status_code=200, text='', data=None):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode('utf-8')
+        self.headers = {}
+        self._data = data
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        pass
+
+
+class FunnelBenchmark:
+    """
+    Замеры воронки заказа тестовым клиентом Django
+
+    Каждая итерация - новый гость: меню станции, добавление позиций
+    в корзину, данные корзины, оформление, создание заказа с платежом
+    и уведомление об оплате. ForteBank и RK7 подменяются ответами без
+    сети, задача отправки заказа в R-Keeper не запускается. Для каждого
+    шага считаются перцентили времени ответа и число SQL-запросов.
+
+    Args:
+        iterations (int): Количество замеряемых итераций
+        warmup (int): Итерации прогрева, в результаты не входят
+        items_per_order (int): Позиций в корзине
+    """
+
+    def __init__(self, iterations=50, warmup=5, items_per_order=3):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.items_per_order = items_per_order
+        self.samples = {name: [] for name in SCENARIOS}
+        self._payment_seq = 0
+        self._query_count = 0
+
+    def run(self, station):
+        """
+        Выполняет прогон
+
+        Args:
+            station (Station): Станция с меню (см. seed_benchmark_data)
+
+        Returns:
+            dict: Результаты в формате, пригодном для сохранения в JSON
+        """
+        item_ids = list(
+            MenuItem.objects.filter(station=station, is_available=True, stop_list=False)
+            .order_by('id').values_list('id', flat=True)
+        )
+        tables = list(Table.objects.filter(is_active=True).values_list('number', flat=True))
+        if not item_ids or not tables:
+            raise ValueError("Нет позиций меню или столов для замеров")
+
+        started = time.perf_counter()
+        with self._external_services(), connection.execute_wrapper(self._count_query):
+            for iteration in range(self.warmup + self.iterations):
+                record = iteration >= self.warmup
+                items = [item_ids[(iteration * self.items_per_order + i) % len(item_ids)]
+                         for i in range(self.items_per_order)]
+                self._run_guest(station, tables[iteration % len(tables)], items, record)
+        return self.results(time.perf_counter() - started)
+
+    def _run_guest(self, station, table_number, items, record):
+        client = Client()
+        self._request(record, 'menu_list', 200, client.get, reverse('menu:menu_list'),
+                      {'station_id': station.rkeeper_id, 'table': table_number})
+        for item_id in items:
+            self._request(record, 'add_to_cart', 200, client.post, reverse('orders:add_to_cart'),
+                          json.dumps({'item_id': item_id, 'quantity': 1}), content_type='application/json')
+        self._request(record, 'cart_data', 200, client.get, reverse('orders:cart_data'))
+        self._request(record, 'checkout', 200, client.get, reverse('orders:checkout'))
+        response = self._request(record, 'create_order', 302, client.post, reverse('orders:create_order'),
+                                 {'comment': 'benchmark'})
+        payment_id = f'bench-{self._payment_seq}'
+        if 'id=' + payment_id not in response['Location']:
+            raise AssertionError(f"create_order не перенаправил на оплату: {response['Location']}")
+        self._request(record, 'payment_callback', 200, Client().post, reverse('orders:payment_callback'),
+                      json.dumps({'ID': payment_id, 'STATUS': 'FullyPaid'}), content_type='application/json')
+
+    def _request(self, record, name, expected_status, method, *args, **kwargs):
+        queries_before = self._query_count
+        started = time.perf_counter()
+        response = method(*args, **kwargs)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if response.status_code != expected_status:
+            raise AssertionError(f"{name}: ожидался статус {expected_status}, получен {response.status_code}")
+        if record:
+            self.samples[name].append((elapsed_ms, self._query_count - queries_before))
+        return response
+
+    def _count_query(self, execute, sql, params, many, context):
+        self._query_count += 1
+        return execute(sql, params, many, context)
+
+    def _create_payment(self, url, json=None, headers=None, **kwargs):
+        self._payment_seq += 1
+        return _FakeResponse(data={'order': {
+            'id': f'bench-{self._payment_seq}',
+            'hppUrl': 'https://pay.example.com/hpp',
+            'password': 'benchmark',
+            'status': 'Preparing',
+        }})
+
+    @staticmethod
+    def _rk7_post(*args, **kwargs):
+        return _FakeResponse(text='<RK7QueryResult Status="Ok"/>')
+
+    @contextmanager
+    def _external_services(self):
+        with mock.patch('orders.services.forte_payment.requests.post', side_effect=self._create_payment), \
+                mock.patch('orders.services.rk7_client.RK7Client.post', side_effect=self._rk7_post), \
+                mock.patch('orders.services.rkeeper_outbox._schedule_dispatch'):
+            yield
+
+    def results(self, duration=None):
+        scenarios = {}
+        for name in SCENARIOS:
+            timings = [sample[0] for sample in self.samples[name]]
+            queries = [sample[1] for sample in self.samples[name]]
+            if not timings:
+                continue
+            scenarios[name] = {
+                'requests': len(timings),
+                'p50_ms': round(percentile(timings, 50), 2),
+                'p95_ms': round(percentile(timings, 95), 2),
+                'p99_ms': round(percentile(timings, 99), 2),
+                'mean_ms': round(sum(timings) / len(timings), 2),
+                'max_ms': round(max(timings), 2),
+                'queries_mean': round(sum(queries) / len(queries), 2),
+                'queries_max': max(queries),
+            }
+        return {
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'cache': settings.CACHES['default']['BACKEND'],
+                'cart_backend': settings.CART_BACKEND,
+            },
+            'iterations': self.iterations,
+            'warmup': self.warmup,
+            'items_per_order': self.items_per_order,
+            'duration_s': round(duration, 2) if duration is not None else None,
+            'scenarios': scenarios,
+        }
+
+
+def compare_results(current, baseline, max_regression=20):
+    """
+    Сравнивает прогон с базовым
+
+    Регрессией считается рост p95 более чем на max_regression процентов
+    или рост максимального числа запросов шага.
+
+    Returns:
+        list: Описания регрессий (пустой, если их нет)
+    """
+    regressions = []
+    for name, stats in current['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base:
+            continue
+        if base['p95_ms'] and stats['p95_ms'] > base['p95_ms'] * (1 + max_regression / 100):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {stats['p95_ms']} мс")
+        if stats['queries_max'] > base['queries_max']:
+            regressions.append(f"{name}: запросов {base['queries_max']} -> {stats['queries_max']}")
+    return regressions
@@ -0,0 +1,72 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from orders.benchmark import FunnelBenchmark, compare_results, isolated_storage, seed_benchmark_data
+
+
+class Command(BaseCommand):
+    help = 'Замеры воронки заказа (меню, корзина, оформление, оплата) на отдельной тестовой базе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Количество замеряемых гостей')
+        parser.add_argument('--warmup', type=int, default=5, help='Итерации прогрева')
+        parser.add_argument('--items', type=int, default=3, help='Позиций в заказе')
+        parser.add_argument('--menu-size', type=int, default=200, help='Позиций в меню станции')
+        parser.add_argument('--cart-backend', choices=['redis', 'session'], help='Хранилище корзины на время замеров')
+        parser.add_argument('--output', help='Файл для сохранения результатов в JSON')
+        parser.add_argument('--baseline', help='Файл с результатами предыдущего прогона для сравнения')
+        parser.add_argument('--max-regression', type=float, default=20,
+                            help='Допустимый рост p95 относительно базового прогона, проценты')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Завершиться с ошибкой при регрессии')
+
+    def handle(self, *args, **options):
+        overrides = {}
+        if options['cart_backend']:
+            overrides['CART_BACKEND'] = options['cart_backend']
+
+        # Замеры идут на отдельной тестовой базе и с отдельными ключами кэша,
+        # рабочие данные не затрагиваются
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            with override_settings(**overrides), isolated_storage():
+                station = seed_benchmark_data(menu_size=options['menu_size'])
+                benchmark = FunnelBenchmark(
+                    iterations=options['iterations'], warmup=options['warmup'], items_per_order=options['items']
+                )
+                results = benchmark.run(station)
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+        self._print_results(results)
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+            self.stdout.write(f"Результаты сохранены в {options['output']}")
+
+        if options['baseline']:
+            baseline = json.loads(Path(options['baseline']).read_text(encoding='utf-8'))
+            regressions = compare_results(results, baseline, options['max_regression'])
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS('Регрессий относительно базового прогона нет'))
+            else:
+                for regression in regressions:
+                    self.stdout.write(self.style.WARNING(f'Регрессия: {regression}'))
+                if options['fail_on_regression']:
+                    raise CommandError(f'Обнаружено регрессий: {len(regressions)}')
+
+    def _print_results(self, results):
+        self.stdout.write(
+            f"{'шаг':<18}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'запросов':>10}"
+        )
+        for name, stats in results['scenarios'].items():
+            self.stdout.write(
+                f"{name:<18}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['queries_max']:>10}"
+            )
@@ -1,6 +1,5 @@
 from django.core.management.base import BaseCommand
 from orders.services.rkeeper_service import RKeeperService
-from django.core.cache import cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,30 +26,28 @@ class Command(BaseCommand):
             return
 
         rkeeper_service = RKeeperService()
-        cache_key = rkeeper_service.cache_key
 
         if action == 'status':
-            self._show_status(cache_key)
+            self._show_status(rkeeper_service)
         elif action == 'reset':
             self._reset_license(rkeeper_service)
         elif action == 'sync':
             self._sync_license(rkeeper_service)
 
-    def _show_status(self, cache_key):
+    def _show_status(self, rkeeper_service):
         """Показать текущий статус лицензии"""
         try:
-            current_seq = cache.get(cache_key)
+            current_seq = rkeeper_service.seq_allocator.current()
             if current_seq is not None:
                 self.stdout.write(
-                    self.style.SUCCESS(f'Текущий seqNumber в кэше: {current_seq}')
+                    self.style.SUCCESS(f'Следующий seqNumber в общем счётчике: {current_seq}')
                 )
             else:
                 self.stdout.write(
-                    self.style.WARNING('seqNumber не установлен в кэше')
+                    self.style.WARNING('seqNumber не инициализирован в общем счётчике')
                 )
                 
             # Попытаемся получить seqNumber с сервера
-            rkeeper_service = RKeeperService()
             try:
                 server_seq = rkeeper_service._get_license_seq()
                 self.stdout.write(
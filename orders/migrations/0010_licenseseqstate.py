@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_alter_order_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LicenseSeqState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('instance_guid', models.CharField(max_length=100, unique=True, verbose_name='GUID экземпляра лицензии')),
+                ('last_seq', models.IntegerField(blank=True, null=True, verbose_name='Последний выданный seqNumber')),
+                ('epoch', models.PositiveIntegerField(default=0, verbose_name='Номер синхронизации с сервером')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлен')),
+            ],
+            options={
+                'verbose_name': 'Состояние лицензии R-Keeper',
+                'verbose_name_plural': 'Состояния лицензии R-Keeper',
+            },
+        ),
+    ]
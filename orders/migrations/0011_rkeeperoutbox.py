@@ -0,0 +1,32 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_licenseseqstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RKeeperOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('processing', 'Отправляется'), ('sent', 'Отправлен'), ('dead', 'Не отправлен')], default='pending', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлен')),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rkeeper_outbox', to='orders.order', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Отправка в R-Keeper',
+                'verbose_name_plural': 'Очередь отправки в R-Keeper',
+                'ordering': ['next_attempt_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='orders_outbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_stockreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentCallbackEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_id', models.CharField(max_length=100, verbose_name='ID платежа')),
+                ('status', models.CharField(max_length=50, verbose_name='Статус платежа')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Получен')),
+            ],
+            options={
+                'verbose_name': 'Уведомление об оплате',
+                'verbose_name_plural': 'Уведомления об оплате',
+                'unique_together': {('payment_id', 'status')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_paymentcallbackevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='table',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['number'], name='orders_table_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('payment_id__isnull', False)), fields=['payment_id'], name='orders_order_payment_idx'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_order_table_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rkeeperoutbox',
+            name='lease',
+            field=models.PositiveIntegerField(default=0, verbose_name='Номер захвата'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from menu.models import MenuItem
 
 class Waiter(models.Model):
@@ -37,6 +38,9 @@ class Table(models.Model):
         verbose_name = 'Стол'
         verbose_name_plural = 'Столы'
         ordering = ['number']
+        indexes = [
+            models.Index(fields=['number'], condition=models.Q(is_active=True), name='orders_table_active_idx'),
+        ]
 
     def __str__(self):
         waiter_info = f' - {self.waiter.name}' if self.waiter else ''
@@ -71,6 +75,14 @@ class Order(models.Model):
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
         ordering = ['-created_at']
+        indexes = [
+            # Поиск заказа по уведомлению ForteBank; заказы без платежа в индекс не попадают
+            models.Index(
+                fields=['payment_id'],
+                condition=models.Q(payment_id__isnull=False),
+                name='orders_order_payment_idx',
+            ),
+        ]
 
     def __str__(self):
         table_info = f' - Стол {self.table.number}' if self.table else ''
@@ -99,3 +111,94 @@ class OrderItem(models.Model):
             self.price = self.menu_item.price
         self.total = self.price * self.quantity
         super().save(*args, **kwargs)
+
+class RKeeperOutbox(models.Model):
+    """
+    Очередь отправки оплаченных заказов в R-Keeper (transactional outbox).
+
+    Запись создаётся в той же транзакции, что и перевод заказа в статус 'paid',
+    и разбирается Celery-задачами orders.tasks.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает отправки'),
+        ('processing', 'Отправляется'),
+        ('sent', 'Отправлен'),
+        ('dead', 'Не отправлен'),
+    ]
+
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='rkeeper_outbox', verbose_name='Заказ')
+    status = models.CharField('Статус', max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    lease = models.PositiveIntegerField('Номер захвата', default=0)
+    next_attempt_at = models.DateTimeField('Следующая попытка', default=timezone.now)
+    last_error = models.TextField('Последняя ошибка', blank=True, default='')
+    created_at = models.DateTimeField('Создан', auto_now_add=True)
+    updated_at = models.DateTimeField('Обновлен', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Отправка в R-Keeper'
+        verbose_name_plural = 'Очередь отправки в R-Keeper'
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='orders_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.order} - {self.get_status_display()}'
+
+class PaymentCallbackEvent(models.Model):
+    """
+    Обработанный callback платёжной системы.
+
+    Уникальность пары (payment_id, status) делает обработку идемпотентной:
+    повтор того же уведомления от банка распознаётся одним запросом.
+    """
+    payment_id = models.CharField('ID платежа', max_length=100)
+    status = models.CharField('Статус платежа', max_length=50)
+    created_at = models.DateTimeField('Получен', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Уведомление об оплате'
+        verbose_name_plural = 'Уведомления об оплате'
+        unique_together = ['payment_id', 'status']
+
+    def __str__(self):
+        return f'{self.payment_id} - {self.status}'
+
+class StockReservation(models.Model):
+    """
+    Резерв остатка блюда с ограниченным количеством под неоплаченный заказ.
+
+    Пока резерв существует, количество учтено в MenuItem.reserved_quantity.
+    Резерв снимается после отправки заказа в R-Keeper, при неудачной оплате
+    или по истечении срока, если заказ так и не оплатили.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='stock_reservations', verbose_name='Заказ')
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, verbose_name='Позиция меню')
+    quantity = models.PositiveIntegerField('Количество')
+    expires_at = models.DateTimeField('Истекает', db_index=True)
+    created_at = models.DateTimeField('Создан', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Резерв остатка'
+        verbose_name_plural = 'Резервы остатков'
+
+    def __str__(self):
+        return f'{self.order} - {self.menu_item} x{self.quantity}'
+
+class LicenseSeqState(models.Model):
+    """
+    Общее для всех процессов состояние счётчика seqNumber лицензии R-Keeper
+    (используется, если Redis недоступен)
+    """
+    instance_guid = models.CharField('GUID экземпляра лицензии', max_length=100, unique=True)
+    last_seq = models.IntegerField('Последний выданный seqNumber', null=True, blank=True)
+    epoch = models.PositiveIntegerField('Номер синхронизации с сервером', default=0)
+    updated_at = models.DateTimeField('Обновлен', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Состояние лицензии R-Keeper'
+        verbose_name_plural = 'Состояния лицензии R-Keeper'
+
+    def __str__(self):
+        return f'{self.instance_guid}: {self.last_seq}'
@@ -0,0 +1,68 @@
+from collections import namedtuple
+from decimal import Decimal
+
+from menu.models import MenuItem
+
+
+class CartLine(namedtuple('CartLine', ['menu_item', 'quantity', 'total'])):
+    """Позиция корзины с ценой и суммой"""
+    __slots__ = ()
+
+    @property
+    def id(self):
+        return self.menu_item.id
+
+    @property
+    def name(self):
+        return self.menu_item.name
+
+    @property
+    def price(self):
+        return self.menu_item.price
+
+    @property
+    def photo_url(self):
+        return self.menu_item.photo.url if self.menu_item.photo else ''
+
+    def as_dict(self):
+        """Представление позиции для JSON-ответа"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'price': str(self.price),
+            'photo_url': self.photo_url,
+            'quantity': self.quantity,
+            'total': str(self.total)
+        }
+
+
+ResolvedCart = namedtuple('ResolvedCart', ['lines', 'total_amount', 'count'])
+
+
+def resolve_cart(cart):
+    """
+    Загружает позиции корзины одним запросом и считает суммы
+
+    Позиции, которых больше нет в меню, пропускаются.
+
+    Args:
+        cart (dict): Корзина из сессии {id позиции: количество}
+
+    Returns:
+        ResolvedCart: Позиции в порядке корзины, общая сумма и количество товаров
+    """
+    item_ids = [int(item_id) for item_id in cart if str(item_id).isdigit()]
+    menu_items = MenuItem.objects.in_bulk(item_ids) if item_ids else {}
+
+    lines = []
+    total_amount = Decimal('0')
+    for item_id, quantity in cart.items():
+        menu_item = menu_items.get(int(item_id)) if str(item_id).isdigit() else None
+        if menu_item is None:
+            continue
+        item_total = menu_item.price * Decimal(quantity)
+        total_amount += item_total
+        lines.append(CartLine(menu_item, quantity, item_total))
+
+    count = sum(int(value) for value in cart.values())
+    return ResolvedCart(lines, total_amount, count)
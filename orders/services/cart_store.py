@@ -0,0 +1,177 @@
+from django.conf import settings
+
+from core.redis_client import get_redis_client
+
+
+class SessionCartStore:
+    """Корзина в сессии Django: {id позиции: количество}"""
+
+    def __init__(self, request):
+        self.session = request.session
+
+    def items(self):
+        """Возвращает содержимое корзины {id позиции (str): количество}"""
+        return dict(self.session.get('cart', {}))
+
+    def count(self):
+        """Общее количество товаров в корзине"""
+        return sum(int(value) for value in self.session.get('cart', {}).values())
+
+    def add(self, item_id, quantity, max_quantity):
+        """
+        Добавляет товар в корзину
+
+        Returns:
+            int|None: Общее количество товаров или None, если после добавления
+            количество позиции превысило бы max_quantity
+        """
+        cart = self.session.get('cart', {})
+        current_quantity = int(cart.get(item_id, 0))
+        if current_quantity + quantity > max_quantity:
+            return None
+        cart[item_id] = current_quantity + quantity
+        self.session['cart'] = cart
+        return sum(int(value) for value in cart.values())
+
+    def update(self, item_id, quantity):
+        """
+        Устанавливает количество позиции, уже лежащей в корзине
+
+        Returns:
+            int|None: Общее количество товаров или None, если позиции нет в корзине
+        """
+        cart = self.session.get('cart', {})
+        if item_id not in cart:
+            return None
+        cart[item_id] = quantity
+        self.session['cart'] = cart
+        return sum(int(value) for value in cart.values())
+
+    def remove(self, item_id):
+        """
+        Удаляет позицию из корзины
+
+        Returns:
+            int|None: Общее количество товаров или None, если позиции нет в корзине
+        """
+        cart = self.session.get('cart', {})
+        if item_id not in cart:
+            return None
+        del cart[item_id]
+        self.session['cart'] = cart
+        return sum(int(value) for value in cart.values())
+
+    def clear(self):
+        self.session['cart'] = {}
+
+
+class RedisCartStore:
+    """
+    Корзина в хэше Redis, привязанном к ключу сессии.
+
+    Поля хэша - id позиций, в отдельном поле хранится общее количество
+    товаров. Изменения выполняются Lua-скриптами атомарно, поэтому
+    одновременные нажатия с одного телефона не затирают друг друга,
+    а сессия при работе с корзиной не перезаписывается.
+    """
+
+    COUNT_FIELD = '_count'
+
+    ADD_SCRIPT = """
+    local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+    local quantity = tonumber(ARGV[2])
+    if current + quantity > tonumber(ARGV[3]) then
+        return false
+    end
+    redis.call('HINCRBY', KEYS[1], ARGV[1], quantity)
+    local count = redis.call('HINCRBY', KEYS[1], ARGV[5], quantity)
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    return count
+    """
+
+    UPDATE_SCRIPT = """
+    local current = redis.call('HGET', KEYS[1], ARGV[1])
+    if not current then
+        return false
+    end
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    local count = redis.call('HINCRBY', KEYS[1], ARGV[4], tonumber(ARGV[2]) - tonumber(current))
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return count
+    """
+
+    REMOVE_SCRIPT = """
+    local current = redis.call('HGET', KEYS[1], ARGV[1])
+    if not current then
+        return false
+    end
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    return redis.call('HINCRBY', KEYS[1], ARGV[2], -tonumber(current))
+    """
+
+    def __init__(self, request, url=None):
+        self.session = request.session
+        self.client = get_redis_client(url or settings.CART_REDIS_URL)
+        self.ttl = settings.SESSION_COOKIE_AGE
+        self._add_script = self.client.register_script(self.ADD_SCRIPT)
+        self._update_script = self.client.register_script(self.UPDATE_SCRIPT)
+        self._remove_script = self.client.register_script(self.REMOVE_SCRIPT)
+
+    def _key(self, create=False):
+        session_key = self.session.session_key
+        if session_key is None and create:
+            # Корзина привязана к сессии, поэтому сессия нужна уже при первом добавлении
+            self.session.save()
+            session_key = self.session.session_key
+        return f"{settings.CART_KEY_PREFIX}:{session_key}" if session_key else None
+
+    def items(self):
+        key = self._key()
+        if key is None:
+            return {}
+        cart = self.client.hgetall(key)
+        cart.pop(self.COUNT_FIELD, None)
+        return {item_id: int(quantity) for item_id, quantity in cart.items()}
+
+    def count(self):
+        key = self._key()
+        if key is None:
+            return 0
+        return int(self.client.hget(key, self.COUNT_FIELD) or 0)
+
+    def add(self, item_id, quantity, max_quantity):
+        count = self._add_script(
+            keys=[self._key(create=True)],
+            args=[item_id, quantity, max_quantity, self.ttl, self.COUNT_FIELD],
+        )
+        return None if count is None else int(count)
+
+    def update(self, item_id, quantity):
+        key = self._key()
+        if key is None:
+            return None
+        count = self._update_script(keys=[key], args=[item_id, quantity, self.ttl, self.COUNT_FIELD])
+        return None if count is None else int(count)
+
+    def remove(self, item_id):
+        key = self._key()
+        if key is None:
+            return None
+        count = self._remove_script(keys=[key], args=[item_id, self.COUNT_FIELD])
+        return None if count is None else int(count)
+
+    def clear(self):
+        key = self._key()
+        if key is not None:
+            self.client.delete(key)
+
+
+def get_cart_store(request):
+    """
+    Возвращает хранилище корзины для запроса
+
+    Бэкенд выбирается настройкой CART_BACKEND ('redis' или 'session').
+    """
+    if settings.CART_BACKEND == 'redis':
+        return RedisCartStore(request)
+    return SessionCartStore(request)
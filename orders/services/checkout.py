@@ -0,0 +1,58 @@
+import logging
+
+from django.db import transaction
+
+from ..models import Order, OrderItem
+from .stock import reserve_stock
+
+logger = logging.getLogger(__name__)
+
+
+def place_order(lines, total_amount, table=None, station_id=None, comment='', item_comments=None):
+    """
+    Создаёт заказ с позициями одной транзакцией
+
+    Позиции вставляются одним запросом bulk_create с уже посчитанными
+    ценой и суммой, поэтому число запросов не зависит от размера заказа.
+    Остатки позиций с ограниченным количеством резервируются в той же
+    транзакции.
+
+    Args:
+        lines (list): Позиции корзины (CartLine)
+        total_amount (Decimal): Общая сумма заказа
+        table (Table): Стол
+        station_id (str): Код станции
+        comment (str): Комментарий к заказу
+        item_comments (dict): Комментарии к позициям {id позиции меню: текст}
+
+    Returns:
+        Order: Созданный заказ
+
+    Raises:
+        OutOfStockError: Если остатка какой-либо позиции не хватает
+    """
+    item_comments = item_comments or {}
+    with transaction.atomic():
+        order = Order.objects.create(
+            table=table,
+            station_id=station_id,
+            waiter=table.waiter if table else None,
+            total_amount=total_amount,
+            status='new',
+            comment=comment
+        )
+        # bulk_create не вызывает OrderItem.save(), поэтому сумма считается здесь так же
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                menu_item=line.menu_item,
+                quantity=line.quantity,
+                price=line.price,
+                total=line.price * line.quantity,
+                comment=item_comments.get(line.id, '')
+            )
+            for line in lines
+        ])
+        reserve_stock(order, lines)
+    logger.info(f"Создан заказ #{order.id} из {len(lines)} позиций на сумму {total_amount}")
+    return order
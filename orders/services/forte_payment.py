@@ -2,6 +2,7 @@ import requests
 import base64
 import logging
 from django.conf import settings
+from core.metrics import timed
 from ..models import Order
 
 # Настройка логгера
@@ -90,15 +91,16 @@ class ForteBankPaymentService:
 
         try:
             api_url = f'{self.api_url}/order'
-            response = requests.post(
-                api_url,
-                json=payload,
-                headers=headers
-            )
+            with timed('forte'):
+                response = requests.post(
+                    api_url,
+                    json=payload,
+                    headers=headers
+                )
             
-            logger.debug(f"Response status code: {response.status_code}")
-            logger.debug(f"Response headers: {response.headers}")
-            logger.debug(f"Response content: {response.text}")
+            logger.debug("Response status code: %s", response.status_code)
+            logger.debug("Response headers: %s", response.headers)
+            logger.debug("Response content: %s", response.text)
             
             if response.status_code != 200:
                 logger.error(f"Error response from ForteBank: {response.text}")
@@ -113,7 +115,7 @@ class ForteBankPaymentService:
             
             # Сохраняем ID платежа в заказе
             order.payment_id = response_data['order']['id']
-            order.save()
+            order.save(update_fields=['payment_id', 'updated_at'])
             
             # Возвращаем только необходимые данные
             return {
@@ -168,11 +170,12 @@ class ForteBankPaymentService:
         }
 
         try:
-            response = requests.get(
-                f'{self.api_url}/api/v3/transactions/{payment_id}/status',
-                headers=headers,
-                verify=True
-            )
+            with timed('forte'):
+                response = requests.get(
+                    f'{self.api_url}/api/v3/transactions/{payment_id}/status',
+                    headers=headers,
+                    verify=True
+                )
             response.raise_for_status()
             logger.info(f"Successfully retrieved payment status for payment_id: {payment_id}")
             return response.json()
@@ -212,13 +215,14 @@ class ForteBankPaymentService:
         }
 
         try:
-            logger.debug(f"Sending authorization request with payload: {payload}")
-            response = requests.post(
-                f'{self.api_url}/api/v3/transactions/auth',
-                json=payload,
-                headers=headers,
-                verify=True
-            )
+            logger.debug("Sending authorization request with payload: %s", payload)
+            with timed('forte'):
+                response = requests.post(
+                    f'{self.api_url}/api/v3/transactions/auth',
+                    json=payload,
+                    headers=headers,
+                    verify=True
+                )
             response.raise_for_status()
             logger.info(f"Payment authorized successfully for order #{order.id}")
             return response.json()
@@ -257,13 +261,14 @@ class ForteBankPaymentService:
         }
 
         try:
-            logger.debug(f"Sending capture request with payload: {payload}")
-            response = requests.post(
-                f'{self.api_url}/api/v3/transactions/capture',
-                json=payload,
-                headers=headers,
-                verify=True
-            )
+            logger.debug("Sending capture request with payload: %s", payload)
+            with timed('forte'):
+                response = requests.post(
+                    f'{self.api_url}/api/v3/transactions/capture',
+                    json=payload,
+                    headers=headers,
+                    verify=True
+                )
             response.raise_for_status()
             logger.info(f"Payment captured successfully for auth_id: {auth_id}")
             return response.json()
@@ -299,13 +304,14 @@ class ForteBankPaymentService:
         }
 
         try:
-            logger.debug(f"Sending reverse request with payload: {payload}")
-            response = requests.post(
-                f'{self.api_url}/api/v3/transactions/reverse',
-                json=payload,
-                headers=headers,
-                verify=True
-            )
+            logger.debug("Sending reverse request with payload: %s", payload)
+            with timed('forte'):
+                response = requests.post(
+                    f'{self.api_url}/api/v3/transactions/reverse',
+                    json=payload,
+                    headers=headers,
+                    verify=True
+                )
             response.raise_for_status()
             logger.info(f"Payment reversed successfully for auth_id: {auth_id}")
             return response.json()
@@ -344,13 +350,14 @@ class ForteBankPaymentService:
         }
 
         try:
-            logger.debug(f"Sending refund request with payload: {payload}")
-            response = requests.post(
-                f'{self.api_url}/api/v3/transactions/refund',
-                json=payload,
-                headers=headers,
-                verify=True
-            )
+            logger.debug("Sending refund request with payload: %s", payload)
+            with timed('forte'):
+                response = requests.post(
+                    f'{self.api_url}/api/v3/transactions/refund',
+                    json=payload,
+                    headers=headers,
+                    verify=True
+                )
             response.raise_for_status()
             logger.info(f"Payment refunded successfully for payment_id: {payment_id}")
             return response.json()
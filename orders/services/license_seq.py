@@ -0,0 +1,241 @@
+import logging
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+
+from core.redis_client import get_redis_client
+from orders.models import LicenseSeqState
+
+logger = logging.getLogger(__name__)
+
+# seqNumber, выданный для запроса, и номер синхронизации, в рамках которой он выдан
+SeqReservation = namedtuple('SeqReservation', ['seq', 'epoch'])
+
+
+class LicenseSeqAllocator(ABC):
+    """
+    Распределитель seqNumber лицензии R-Keeper, общий для всех процессов.
+
+    Каждый вызов reserve() атомарно выдаёт следующий номер. При конфликте
+    (ошибки 5304/5305/5310) вызывающий код передаёт epoch полученного номера
+    в resync()/reset_instance(): синхронизацию с сервером выполнит только
+    первый процесс, остальные увидят, что epoch уже изменился, и просто
+    запросят новый номер.
+    """
+
+    def __init__(self, instance_guid):
+        self.instance_guid = instance_guid
+        self.key = f"rkeeper:license_seq:{instance_guid}"
+
+    def reserve(self, fetch_server_seq):
+        """
+        Выдаёт следующий seqNumber
+
+        Args:
+            fetch_server_seq (callable): Функция запроса текущего seqNumber
+                с сервера (нужна для первичной инициализации счётчика)
+
+        Returns:
+            SeqReservation: Номер и epoch, в рамках которого он выдан
+        """
+        reservation = self._incr()
+        if reservation is None:
+            self.resync(None, fetch_server_seq)
+            reservation = self._incr()
+            if reservation is None:
+                raise RuntimeError(f"Не удалось инициализировать seqNumber для {self.instance_guid}")
+        return reservation
+
+    def resync(self, epoch, fetch_server_seq):
+        """
+        Синхронизирует счётчик с сервером, если этого ещё никто не сделал
+
+        Args:
+            epoch (int|None): epoch номера, на котором произошёл конфликт
+                (None - счётчик ещё не инициализирован)
+            fetch_server_seq (callable): Функция запроса seqNumber с сервера
+
+        Returns:
+            bool: True, если синхронизацию выполнил текущий процесс
+        """
+        if not self._is_current(epoch):
+            logger.info(f"seqNumber уже синхронизирован другим процессом (epoch {epoch})")
+            return False
+        # Запрос к серверу выполняется до блокировки, иначе остальные процессы
+        # ждали бы ответа кассового сервера вместо того, чтобы выдавать номера
+        try:
+            server_seq = fetch_server_seq()
+        except Exception as e:
+            # Для нового экземпляра лицензии первый запрос идёт с seqNumber=0
+            logger.warning(f"Не удалось получить seqNumber с сервера, начинаем с 0: {e}")
+            server_seq = -1
+        with self._lock():
+            if not self._is_current(epoch):
+                logger.info(f"seqNumber уже синхронизирован другим процессом (epoch {epoch})")
+                return False
+            self._store(server_seq)
+            logger.info(f"seqNumber синхронизирован с сервером: {server_seq}")
+            return True
+
+    def reset_instance(self, epoch):
+        """Начинает отсчёт заново (ошибка 5304: экземпляр лицензии не найден)"""
+        with self._lock():
+            if not self._is_current(epoch):
+                return False
+            self._store(-1)
+            logger.info("seqNumber сброшен в 0 для нового экземпляра лицензии")
+            return True
+
+    def force_resync(self, fetch_server_seq):
+        """Принудительная синхронизация с сервером без проверки epoch"""
+        server_seq = fetch_server_seq()
+        with self._lock():
+            self._store(server_seq)
+        return server_seq + 1
+
+    def current(self):
+        """Возвращает следующий seqNumber, который будет выдан, или None"""
+        last_seq = self._last_seq()
+        return None if last_seq is None else last_seq + 1
+
+    @abstractmethod
+    def clear(self):
+        """Удаляет состояние счётчика"""
+
+    def _is_current(self, epoch):
+        state = self._state()
+        if epoch is None:
+            return state is None
+        return state is None or state[1] == epoch
+
+    def _last_seq(self):
+        state = self._state()
+        return state[0] if state else None
+
+    @abstractmethod
+    def _incr(self):
+        """Увеличивает счётчик: SeqReservation или None, если он не инициализирован"""
+
+    @abstractmethod
+    def _state(self):
+        """Текущее состояние: (последний выданный номер, epoch) или None"""
+
+    @abstractmethod
+    def _store(self, last_seq):
+        """Записывает номер и начинает новый epoch (вызывается под _lock())"""
+
+    @abstractmethod
+    def _lock(self):
+        """Блокировка синхронизации, общая для всех процессов"""
+
+
+class RedisLicenseSeqAllocator(LicenseSeqAllocator):
+    """Счётчик на атомарном INCR в Redis"""
+
+    INCR_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return false
+    end
+    local seq = redis.call('INCR', KEYS[1])
+    local epoch = tonumber(redis.call('GET', KEYS[2]) or '0')
+    return {seq, epoch}
+    """
+
+    def __init__(self, instance_guid, url=None):
+        super().__init__(instance_guid)
+        self.client = get_redis_client(url or settings.RKEEPER_LICENSE_SEQ_REDIS_URL)
+        self.epoch_key = f"{self.key}:epoch"
+        self.lock_key = f"{self.key}:lock"
+        self._incr_script = self.client.register_script(self.INCR_SCRIPT)
+
+    def clear(self):
+        self.client.delete(self.key, self.epoch_key)
+
+    def _incr(self):
+        result = self._incr_script(keys=[self.key, self.epoch_key])
+        if not result:
+            return None
+        return SeqReservation(int(result[0]), int(result[1]))
+
+    def _state(self):
+        last_seq, epoch = self.client.mget(self.key, self.epoch_key)
+        if last_seq is None:
+            return None
+        return int(last_seq), int(epoch or 0)
+
+    def _store(self, last_seq):
+        pipe = self.client.pipeline()
+        pipe.set(self.key, last_seq)
+        pipe.incr(self.epoch_key)
+        pipe.execute()
+
+    def _lock(self):
+        return self.client.lock(
+            self.lock_key,
+            timeout=settings.RKEEPER_LICENSE_SEQ_LOCK_TIMEOUT,
+            blocking_timeout=settings.RKEEPER_LICENSE_SEQ_LOCK_TIMEOUT,
+        )
+
+
+class DatabaseLicenseSeqAllocator(LicenseSeqAllocator):
+    """Счётчик на блокировке строки LicenseSeqState в PostgreSQL"""
+
+    def clear(self):
+        LicenseSeqState.objects.filter(instance_guid=self.instance_guid).delete()
+
+    def _locked_state(self):
+        state, _ = LicenseSeqState.objects.select_for_update().get_or_create(instance_guid=self.instance_guid)
+        return state
+
+    def _incr(self):
+        with transaction.atomic():
+            state = self._locked_state()
+            if state.last_seq is None:
+                return None
+            state.last_seq += 1
+            state.save(update_fields=['last_seq', 'updated_at'])
+            return SeqReservation(state.last_seq, state.epoch)
+
+    def _state(self):
+        state = LicenseSeqState.objects.filter(instance_guid=self.instance_guid).values_list('last_seq', 'epoch').first()
+        if state is None or state[0] is None:
+            return None
+        return state
+
+    def _store(self, last_seq):
+        state = self._locked_state()
+        state.last_seq = last_seq
+        state.epoch += 1
+        state.save(update_fields=['last_seq', 'epoch', 'updated_at'])
+
+    def _lock(self):
+        # Блокировка строки удерживается до конца транзакции
+        return _RowLock(self.instance_guid)
+
+
+class _RowLock:
+    def __init__(self, instance_guid):
+        self.instance_guid = instance_guid
+        self.atomic = transaction.atomic()
+
+    def __enter__(self):
+        self.atomic.__enter__()
+        LicenseSeqState.objects.select_for_update().get_or_create(instance_guid=self.instance_guid)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.atomic.__exit__(exc_type, exc_value, traceback)
+
+
+def get_license_seq_allocator(instance_guid=None):
+    """
+    Возвращает распределитель seqNumber для экземпляра лицензии
+
+    Бэкенд выбирается настройкой RKEEPER_LICENSE_SEQ_BACKEND ('redis' или 'db').
+    """
+    instance_guid = instance_guid or settings.RKEEPER_LICENSE_INSTANCE_GUID
+    if settings.RKEEPER_LICENSE_SEQ_BACKEND == 'db':
+        return DatabaseLicenseSeqAllocator(instance_guid)
+    return RedisLicenseSeqAllocator(instance_guid)
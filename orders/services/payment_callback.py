@@ -0,0 +1,89 @@
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Order, PaymentCallbackEvent
+from .rkeeper_outbox import enqueue_order
+from .stock import release_stock
+
+logger = logging.getLogger(__name__)
+
+# Статусы ForteBank и соответствующие им статусы заказа
+PAYMENT_STATUS_MAP = {
+    'FullyPaid': 'paid',
+    'Completed': 'paid',
+    'Success': 'paid',
+    'Cancelled': 'cancelled',
+    'Canceled': 'cancelled',
+    'Failed': 'failed',
+    'Error': 'failed',
+    'Rejected': 'failed',
+}
+
+# Из этих статусов заказ уведомлениями банка больше не переводится
+FINAL_ORDER_STATUSES = ['paid', 'processing', 'completed']
+
+# Результаты обработки callback
+APPLIED = 'applied'
+DUPLICATE = 'duplicate'
+SKIPPED = 'skipped'
+NOT_FOUND = 'not_found'
+
+
+def process_payment_callback(payment_id, payment_status):
+    """
+    Применяет уведомление ForteBank к заказу
+
+    Повтор уже обработанного уведомления (payment_id, status) отсекается
+    одним запросом. Смена статуса заказа выполняется условным
+    UPDATE ... WHERE status NOT IN (...), поэтому из одновременно пришедших
+    callback и GET-редиректа заказ переведёт и поставит в очередь R-Keeper
+    только один, без блокировок строк.
+
+    Args:
+        payment_id (str): ID платежа ForteBank
+        payment_status (str): Статус платежа ForteBank
+
+    Returns:
+        str: APPLIED, DUPLICATE, SKIPPED или NOT_FOUND
+    """
+    new_status = PAYMENT_STATUS_MAP.get(payment_status)
+    if new_status is None:
+        logger.info(f"Payment {payment_id}: status {payment_status} does not change the order")
+        return SKIPPED
+
+    # Повторное уведомление - один запрос без открытия транзакции
+    if PaymentCallbackEvent.objects.filter(payment_id=payment_id, status=payment_status).exists():
+        logger.info(f"Payment {payment_id}: duplicate callback with status {payment_status}, skipping")
+        return DUPLICATE
+
+    with transaction.atomic():
+        # Одновременные уведомления с одинаковым статусом упрутся в уникальный индекс
+        _, created = PaymentCallbackEvent.objects.get_or_create(payment_id=payment_id, status=payment_status)
+        if not created:
+            logger.info(f"Payment {payment_id}: duplicate callback with status {payment_status}, skipping")
+            return DUPLICATE
+
+        order_id = Order.objects.filter(payment_id=payment_id).values_list('id', flat=True).first()
+        if order_id is None:
+            # Откатываем запись об уведомлении: заказ может появиться позже
+            transaction.set_rollback(True)
+            return NOT_FOUND
+
+        orders = Order.objects.filter(id=order_id).exclude(status__in=FINAL_ORDER_STATUSES).exclude(status=new_status)
+        if new_status == 'paid':
+            orders = orders.filter(rkeeper_order_id__isnull=True)
+        if not orders.update(status=new_status, updated_at=timezone.now()):
+            logger.info(f"Order {order_id}: status {new_status} not applied, order already processed")
+            return SKIPPED
+
+        if new_status == 'paid':
+            # Статус 'paid' и запись в очереди отправки фиксируются одной транзакцией.
+            # Сам заказ отправляет в R-Keeper Celery-воркер, не задерживая ответ банку
+            enqueue_order(order_id)
+            logger.info(f"Order {order_id} marked as paid and queued for R-Keeper")
+        else:
+            release_stock(order_id)
+            logger.info(f"Order {order_id} marked as {new_status}")
+    return APPLIED
@@ -0,0 +1,126 @@
+import logging
+import ssl
+import threading
+import time
+import warnings
+
+import requests
+import urllib3
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.util.ssl_ import create_urllib3_context
+
+from core.metrics import timed
+
+# Отключаем предупреждения о небезопасном SSL-соединении
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+warnings.filterwarnings('ignore', message='Unverified HTTPS request')
+
+logger = logging.getLogger(__name__)
+
+
+class CustomAdapter(HTTPAdapter):
+    """Пользовательский адаптер с настройкой SSL"""
+    def init_poolmanager(self, *args, **kwargs):
+        context = create_urllib3_context(ssl_version=ssl.PROTOCOL_SSLv23)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        context.set_ciphers('ALL:@SECLEVEL=0')
+        kwargs['ssl_context'] = context
+        return super(CustomAdapter, self).init_poolmanager(*args, **kwargs)
+
+
+class RK7Client:
+    """
+    HTTP-клиент XML-интерфейса RK7 с пулом keep-alive соединений.
+
+    Один экземпляр на адрес кассового сервера используется всеми
+    RKeeperService и синхронизацией меню в пределах процесса.
+    """
+
+    def __init__(self, api_url, pool_size=None, max_idle=None):
+        self.api_url = api_url
+        self.pool_size = pool_size or settings.RKEEPER_POOL_SIZE
+        self.max_idle = max_idle if max_idle is not None else settings.RKEEPER_POOL_MAX_IDLE
+        self.headers = {
+            'Content-Type': 'application/xml',
+        }
+        self._lock = threading.Lock()
+        self._last_used = time.monotonic()
+        self.session = self._build_session()
+
+    def _build_session(self):
+        session = requests.Session()
+        retry = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
+        adapter = CustomAdapter(
+            max_retries=retry,
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            pool_block=False,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.verify = False  # Отключение проверки SSL-сертификата
+        session.headers.update(self.headers)
+        return session
+
+    def _drop_idle_connections(self):
+        # Кассовый сервер закрывает простаивающие соединения сам, поэтому
+        # после долгого простоя не рискуем отправлять запрос в "мёртвый" сокет
+        now = time.monotonic()
+        with self._lock:
+            if self.max_idle and now - self._last_used > self.max_idle:
+                logger.debug(f"Соединения с {self.api_url} простаивали дольше {self.max_idle} с, пул сброшен")
+                for adapter in self.session.adapters.values():
+                    adapter.poolmanager.clear()
+            self._last_used = now
+
+    def post(self, xml_query, timeout=None, stream=False):
+        """
+        Отправляет XML-запрос на кассовый сервер
+
+        Args:
+            xml_query (str): Текст запроса RK7Query
+            timeout (float): Таймаут запроса в секундах
+            stream (bool): Не загружать тело ответа сразу
+
+        Returns:
+            requests.Response: Ответ сервера
+        """
+        self._drop_idle_connections()
+        # При stream=True в метрику попадает только ожидание заголовков ответа:
+        # тело читает вызывающий код (синхронизация меню, вне запросов посетителей)
+        with timed('rk7'):
+            return self.session.post(
+                self.api_url,
+                data=xml_query.encode('utf-8'),
+                timeout=timeout or settings.RKEEPER_TIMEOUT,
+                stream=stream,
+            )
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_rk7_client(api_url=None):
+    """
+    Возвращает общий для процесса клиент RK7 для указанного адреса
+
+    Args:
+        api_url (str): Адрес XML-интерфейса (по умолчанию RKEEPER_API_URL)
+    """
+    api_url = api_url or settings.RKEEPER_API_URL
+    client = _clients.get(api_url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(api_url)
+            if client is None:
+                client = RK7Client(api_url)
+                _clients[api_url] = client
+                logger.info(f"Создан пул соединений RK7 для {api_url} (размер {client.pool_size})")
+    return client
@@ -0,0 +1,224 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from orders.models import Order, RKeeperOutbox
+from .rkeeper_service import RKeeperService
+from .stock import release_stock
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки PostgreSQL, под которой проверяется лимит одновременных отправок
+DISPATCH_LOCK_KEY = 7201
+
+
+def enqueue_order(order_id):
+    """
+    Ставит оплаченный заказ в очередь отправки в R-Keeper.
+
+    Должна вызываться внутри той же транзакции, что и смена статуса заказа:
+    задача на отправку запускается только после её фиксации.
+
+    Args:
+        order_id (int): ID заказа
+    """
+    entry, created = RKeeperOutbox.objects.get_or_create(order_id=order_id)
+    if created:
+        logger.info(f"Заказ #{order_id} поставлен в очередь отправки в R-Keeper")
+    transaction.on_commit(_schedule_dispatch)
+    return entry
+
+
+def _schedule_dispatch():
+    from orders.tasks import dispatch_rkeeper_outbox
+
+    try:
+        # Без повторных попыток публикации: ответ банку не должен ждать брокер
+        dispatch_rkeeper_outbox.apply_async(retry=False)
+    except Exception as e:
+        # Запись останется в очереди и будет отправлена периодической задачей
+        logger.warning(f"Не удалось запустить отправку очереди R-Keeper: {e}")
+
+
+def claim_due_entries():
+    """
+    Забирает в работу записи, время отправки которых наступило.
+
+    Одновременно отправляется не более RKEEPER_OUTBOX_CONCURRENCY заказов
+    на весь кластер. Записи, зависшие в статусе 'processing' дольше
+    RKEEPER_OUTBOX_LEASE секунд (например, после падения воркера),
+    забираются повторно; такой повторный захват считается попыткой, и после
+    RKEEPER_OUTBOX_MAX_ATTEMPTS попыток запись помечается 'dead'.
+
+    Каждый захват увеличивает номер захвата записи (lease): отправить заказ
+    может только задача с актуальным номером, см. process_entry().
+
+    Returns:
+        list: Пары (ID записи, номер захвата)
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        _lock_dispatch()
+        in_flight = RKeeperOutbox.objects.filter(status='processing', next_attempt_at__gt=now).count()
+        limit = settings.RKEEPER_OUTBOX_CONCURRENCY - in_flight
+        if limit <= 0:
+            return []
+
+        due = list(
+            RKeeperOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(Q(status='pending') | Q(status='processing'), next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', 'status', 'attempts', 'order_id')[:limit]
+        )
+        dead_ids = _count_expired_leases(due, now)
+        entry_ids = [entry_id for entry_id, *_ in due if entry_id not in dead_ids]
+        RKeeperOutbox.objects.filter(id__in=entry_ids).update(
+            status='processing',
+            lease=F('lease') + 1,
+            next_attempt_at=now + timedelta(seconds=settings.RKEEPER_OUTBOX_LEASE),
+            updated_at=now,
+        )
+        return list(RKeeperOutbox.objects.filter(id__in=entry_ids).values_list('id', 'lease'))
+
+
+def _count_expired_leases(due, now):
+    """
+    Засчитывает попытку записям с истёкшим захватом
+
+    Захват истекает, если прошлая отправка упала вместе с воркером или не
+    уложилась в time_limit задачи. Без подсчёта такая запись повторялась бы
+    бесконечно и никогда не попала бы в 'dead'.
+
+    Args:
+        due (list): Кортежи (ID, статус, попыток, ID заказа) забираемых записей
+        now (datetime): Время захвата
+
+    Returns:
+        set: ID записей, помеченных 'dead'
+    """
+    expired = [(entry_id, attempts + 1, order_id) for entry_id, status, attempts, order_id in due if status == 'processing']
+    if not expired:
+        return set()
+
+    RKeeperOutbox.objects.filter(id__in=[entry_id for entry_id, *_ in expired]).update(
+        attempts=F('attempts') + 1,
+        last_error='Отправка не завершилась за время захвата',
+        updated_at=now,
+    )
+    dead = [(entry_id, order_id) for entry_id, attempts, order_id in expired
+            if attempts >= settings.RKEEPER_OUTBOX_MAX_ATTEMPTS]
+    if dead:
+        RKeeperOutbox.objects.filter(id__in=[entry_id for entry_id, _ in dead]).update(status='dead')
+    for entry_id, order_id in dead:
+        logger.error(f"Заказ #{order_id} не отправлен в R-Keeper: попытки исчерпаны, захват записи {entry_id} истёк")
+        # Как и в _schedule_retry: заказ передаётся кассиру вручную, резерв снимаем
+        release_stock(order_id)
+    return {entry_id for entry_id, _ in dead}
+
+
+def _lock_dispatch():
+    # Без общей блокировки два диспетчера могли бы одновременно увидеть свободные
+    # слоты и вместе захватить больше RKEEPER_OUTBOX_CONCURRENCY записей.
+    # SQLite и так выполняет пишущие транзакции по одной
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [DISPATCH_LOCK_KEY])
+
+
+def process_entry(entry_id, lease):
+    """
+    Отправляет заказ из очереди в R-Keeper
+
+    Перед отправкой задача становится владельцем записи: условное обновление
+    по номеру захвата проходит только один раз, поэтому повторная доставка
+    задачи Celery или задача, чей захват истёк и был передан другой, заказ
+    не отправляют. Захват продлевается на RKEEPER_OUTBOX_LEASE секунд, а
+    задача ограничена по времени меньшим сроком (orders.tasks), поэтому
+    запись не может быть захвачена повторно, пока отправка ещё идёт.
+
+    Args:
+        entry_id (int): ID записи RKeeperOutbox
+        lease (int): Номер захвата, выданный claim_due_entries()
+
+    Returns:
+        bool: True, если заказ принят кассовым сервером
+    """
+    now = timezone.now()
+    owned = RKeeperOutbox.objects.filter(
+        id=entry_id, lease=lease, status='processing', next_attempt_at__gt=now
+    ).update(
+        lease=F('lease') + 1,
+        next_attempt_at=now + timedelta(seconds=settings.RKEEPER_OUTBOX_LEASE),
+        updated_at=now,
+    )
+    if not owned:
+        logger.info(f"Запись очереди {entry_id} уже обрабатывается или обработана (захват {lease})")
+        return False
+
+    lease += 1
+    entry = RKeeperOutbox.objects.select_related('order').get(id=entry_id)
+    order = entry.order
+    try:
+        rkeeper_order_id = RKeeperService().send_order(order)
+        error = None if rkeeper_order_id else 'R-Keeper не принял заказ'
+    except Exception as e:
+        logger.error(f"Ошибка отправки заказа #{order.id} в R-Keeper: {e}", exc_info=True)
+        error = str(e)
+
+    if error is None:
+        with transaction.atomic():
+            updated = RKeeperOutbox.objects.filter(id=entry.id, lease=lease).update(
+                status='sent', last_error='', updated_at=timezone.now()
+            )
+            if updated:
+                Order.objects.filter(id=order.id, status='paid').update(
+                    status='processing', updated_at=timezone.now()
+                )
+        if not updated:
+            logger.error(f"Заказ #{order.id} отправлен в R-Keeper, но захват записи очереди {entry.id} уже утерян")
+            return False
+        # Заказ учтён в остатках R-Keeper - резерв больше не нужен
+        release_stock(order.id)
+        logger.info(f"Заказ #{order.id} отправлен в R-Keeper и переведён в статус processing")
+        return True
+
+    _schedule_retry(entry, lease, error)
+    return False
+
+
+def _schedule_retry(entry, lease, error):
+    attempts = entry.attempts + 1
+    if attempts >= settings.RKEEPER_OUTBOX_MAX_ATTEMPTS:
+        status = 'dead'
+        next_attempt_at = entry.next_attempt_at
+        logger.error(
+            f"Заказ #{entry.order_id} не отправлен в R-Keeper после {attempts} попыток: {error}"
+        )
+    else:
+        status = 'pending'
+        delay = min(
+            settings.RKEEPER_OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1),
+            settings.RKEEPER_OUTBOX_BACKOFF_MAX,
+        )
+        next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        logger.warning(
+            f"Заказ #{entry.order_id} не отправлен в R-Keeper (попытка {attempts}), "
+            f"повтор через {delay} с: {error}"
+        )
+
+    updated = RKeeperOutbox.objects.filter(id=entry.id, lease=lease).update(
+        status=status,
+        attempts=attempts,
+        next_attempt_at=next_attempt_at,
+        last_error=error,
+        updated_at=timezone.now(),
+    )
+    if updated and status == 'dead':
+        # Заказ передаётся кассиру вручную (фильтр 'Не отправлен' в админке);
+        # резерв снимаем, иначе остаток останется занятым навсегда
+        release_stock(entry.order_id)
@@ -4,33 +4,15 @@ import logging
 import xml.etree.ElementTree as ET
 from django.conf import settings
 from orders.models import Order
-from menu.models import Station, MenuItem
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-import urllib3
-import warnings
-import ssl
-from urllib3.util.ssl_ import create_urllib3_context
+from menu.models import Station
 import time
-from django.db.models import F
-from django.core.cache import cache
-
-# Отключаем предупреждения о небезопасном SSL-соединении
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-warnings.filterwarnings('ignore', message='Unverified HTTPS request')
+import uuid
+from contextlib import contextmanager
+from .license_seq import get_license_seq_allocator
+from .rk7_client import get_rk7_client
 
 logger = logging.getLogger(__name__)
 
-class CustomAdapter(HTTPAdapter):
-    """Пользовательский адаптер с настройкой SSL"""
-    def init_poolmanager(self, *args, **kwargs):
-        context = create_urllib3_context(ssl_version=ssl.PROTOCOL_SSLv23)
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
-        context.set_ciphers('ALL:@SECLEVEL=0')
-        kwargs['ssl_context'] = context
-        return super(CustomAdapter, self).init_poolmanager(*args, **kwargs)
-
 class RKeeperService:
     """
     Сервис для интеграции с R-Keeper
@@ -39,26 +21,21 @@ class RKeeperService:
         """Инициализация сервиса"""
         self.api_url = settings.RKEEPER_API_URL
         
-        # Настройка сессии с retry-логикой
-        self.session = requests.Session()
-        retry = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
-        adapter = CustomAdapter(max_retries=retry)
-        self.session.mount('http://', adapter)
-        self.session.mount('https://', adapter)
-        self.session.verify = False  # Отключение проверки SSL-сертификата
-        
-        self.headers = {
-            'Content-Type': 'application/xml',
-        }
+        # Общий для процесса пул keep-alive соединений с кассовым сервером
+        self.client = get_rk7_client(self.api_url)
         
         # Настройки лицензирования XML-интерфейса
         self.license_anchor = getattr(settings, 'RKEEPER_LICENSE_ANCHOR', '')
         self.license_token = getattr(settings, 'RKEEPER_LICENSE_TOKEN', '')
         self.license_instance_guid = getattr(settings, 'RKEEPER_LICENSE_INSTANCE_GUID', '')
-        self.seq_number = 0  # Счётчик запросов лицензирования
         
-        # Ключ для глобального хранения seqNumber лицензии
-        self.cache_key = f"rkeeper:license_seq:{self.license_instance_guid}"
+        # Общий для всех процессов счётчик seqNumber лицензии
+        self.seq_allocator = get_license_seq_allocator(self.license_instance_guid)
+        
+        # Режим отправки заказа: sequential, pipelined или batched (см. RKEEPER_SUBMIT_MODE)
+        self.submit_mode = getattr(settings, 'RKEEPER_SUBMIT_MODE', 'sequential')
+        # Длительность этапов последней отправки заказа, мс
+        self.last_timings = {}
         
         logger.info(f"Инициализирован RKeeperService с URL: {self.api_url}")
     
@@ -66,18 +43,18 @@ class RKeeperService:
         """
         Отправка заказа в R-Keeper
         
+        Вызывается из очереди отправки (orders.tasks); при ошибке очередь
+        повторит попытку позже.
+        
         Args:
             order (Order): Объект заказа
-            
+        
         Returns:
             str: Идентификатор заказа в R-Keeper или None в случае ошибки
         """
         logger.info(f"Отправка заказа #{order.id} в R-Keeper")
-        
-        # Проверяем, не был ли заказ уже отправлен в R-Keeper
-        if order.rkeeper_order_id:
-            logger.info(f"Заказ #{order.id} уже был отправлен в R-Keeper с ID: {order.rkeeper_order_id}, пропускаем повторную отправку")
-            return order.rkeeper_order_id
+        self.last_timings = {}
+        started = time.perf_counter()
         
         # Получаем станцию из сессии или используем стандартную
         try:
@@ -101,46 +78,223 @@ class RKeeperService:
             station_code = 15002  # Код станции по умолчанию
         
         try:
-            # Проверяем текущий seqNumber перед отправкой
-            current_seq = cache.get(self.cache_key)
-            logger.info(f"Текущий seqNumber перед отправкой заказа: {current_seq}")
-            
-            # Создаем заказ в R-Keeper и сохраняем начальный seqNumber
-            order_guid = self._create_order(order, station_code)
+            # Заказ уже создавался при предыдущей попытке: продолжаем с того места,
+            # где она остановилась, не добавляя блюда второй раз
+            if order.rkeeper_order_id:
+                order_guid, added = self._resume_order(order, station_code)
+            elif self.submit_mode in ('pipelined', 'batched'):
+                order_guid, added = self._submit_prepared(order, station_code)
+            else:
+                order_guid = self._create_order(order, station_code)
+                added = bool(order_guid) and self._add_items_to_order(order_guid, order, station_code)
             
             if not order_guid:
                 logger.error(f"Не удалось создать заказ в R-Keeper для заказа #{order.id}")
-                # Возвращаем заглушку вместо None, чтобы не блокировать обработку заказа
-                return f"mock_order_id_{order.id}"
+                return None
             
-            # Добавляем блюда в заказ
-            added = self._add_items_to_order(order_guid, order, station_code)
             if not added:
                 logger.error(f"Не удалось добавить блюда в заказ R-Keeper для заказа #{order.id}")
-                # Если не удалось добавить блюда, но заказ создан, всё равно возвращаем его ID
-                return order_guid
-            
-            # Проверяем финальный seqNumber после успешной отправки
-            final_seq = cache.get(self.cache_key)
-            logger.info(f"Финальный seqNumber после отправки заказа: {final_seq}")
+                return None
             
             logger.info(f"Заказ #{order.id} успешно создан в R-Keeper с идентификатором {order_guid}")
             return order_guid
         except Exception as e:
             logger.error(f"Произошла непредвиденная ошибка при отправке заказа в R-Keeper: {str(e)}")
-            # Возвращаем заглушку вместо None, чтобы не блокировать обработку заказа
-            return f"mock_order_id_{order.id}"
+            return None
+        finally:
+            self.last_timings['total'] = round((time.perf_counter() - started) * 1000, 1)
+            logger.info(
+                f"Тайминги отправки заказа #{order.id} ({self.submit_mode}): "
+                + ", ".join(f"{phase}={ms} мс" for phase, ms in self.last_timings.items())
+            )
+    
+    @contextmanager
+    def _timed(self, phase):
+        """Замеряет длительность этапа отправки заказа (при повторах время суммируется)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.last_timings[phase] = round(self.last_timings.get(phase, 0) + elapsed, 1)
     
-    def _create_order(self, order, station_code):
+    def _resume_order(self, order, station_code):
         """
-        Создание нового заказа в R-Keeper и сохранение seqNumber
+        Повторная отправка заказа, для которого уже известен GUID в R-Keeper
+        
+        Предыдущая попытка могла оборваться по таймауту уже после того, как
+        сервер выполнил команду, поэтому сначала смотрим состояние заказа в
+        R-Keeper: блюда есть - SaveOrder уже прошёл, заказа нет - CreateOrder
+        не дошёл до сервера и заказ создаётся заново с тем же GUID.
         
         Args:
             order (Order): Объект заказа
             station_code (int): Код станции
         
         Returns:
-            str: GUID заказа в R-Keeper или None в случае ошибки
+            tuple: (GUID заказа или None, True если блюда добавлены)
+        """
+        order_guid = order.rkeeper_order_id
+        dish_count = self._get_order_dish_count(order_guid)
+        
+        if dish_count is None:
+            logger.info(f"Заказ {order_guid} не найден в R-Keeper, создаём его заново для заказа #{order.id}")
+            order_guid = self._create_order(order, station_code, order_guid)
+            return order_guid, bool(order_guid) and self._add_items_to_order(order_guid, order, station_code)
+        
+        if dish_count:
+            logger.info(f"Блюда заказа #{order.id} уже сохранены в R-Keeper ({order_guid}), SaveOrder не повторяем")
+            return order_guid, True
+        
+        logger.info(f"Заказ #{order.id} создан в R-Keeper ({order_guid}) без блюд, повторяем SaveOrder")
+        return order_guid, self._add_items_to_order(order_guid, order, station_code)
+    
+    def _get_order_dish_count(self, order_guid):
+        """
+        Число блюд в заказе R-Keeper (команда GetOrder)
+        
+        Args:
+            order_guid (str): GUID заказа в R-Keeper
+        
+        Returns:
+            int: Число блюд или None, если сервер не нашёл заказ
+        
+        Raises:
+            requests.exceptions.RequestException: Кассовый сервер недоступен
+        """
+        xml_query = self._build_query(f'''<RK7CMD CMD="GetOrder">
+          <Order guid="{order_guid}"/>
+         </RK7CMD>''')
+        
+        with self._timed('get_order'):
+            response = self.client.post(xml_query, timeout=30)
+        response.raise_for_status()
+        
+        logger.debug("Ответ R-Keeper на GetOrder: %s", response.text)
+        
+        root = ET.fromstring(response.text)
+        result = self._command_results(root)[0]
+        if result.get('Status') != 'Ok':
+            logger.info(f"GetOrder {order_guid}: {result.get('ErrorText', 'Неизвестная ошибка')}")
+            return None
+        return len(root.findall('.//Dish'))
+    
+    def _submit_prepared(self, order, station_code):
+        """
+        Отправка заказа с заранее подготовленными командами CreateOrder и SaveOrder
+        
+        GUID заказа генерируется на нашей стороне, а seqNumber резервируется до
+        первого запроса, поэтому обе команды собираются заранее. В режиме
+        'pipelined' они уходят двумя запросами подряд по одному keep-alive
+        соединению, в режиме 'batched' - одним RK7Query с двумя RK7CMD.
+        
+        Args:
+            order (Order): Объект заказа
+            station_code (int): Код станции
+        
+        Returns:
+            tuple: (GUID заказа или None, True если блюда добавлены)
+        """
+        with self._timed('prepare'):
+            order_guid = '{' + str(uuid.uuid4()).upper() + '}'
+            create_cmd = self._build_create_order_cmd(order, station_code, order_guid)
+            reservation = self._reserve_seq()
+            save_cmd = self._build_save_order_cmd(order_guid, order, station_code, reservation)
+        
+        if save_cmd is None:
+            logger.error("Нет позиций для добавления в заказ R-Keeper")
+            return None, False
+        
+        # GUID сохраняем до отправки: если ответ потеряется, повторная попытка
+        # найдёт уже созданный заказ (см. _resume_order)
+        order.rkeeper_order_id = order_guid
+        order.save(update_fields=['rkeeper_order_id'])
+        
+        if self.submit_mode == 'batched':
+            with self._timed('batch'):
+                response = self.client.post(self._build_query(create_cmd, save_cmd), timeout=30)
+            response.raise_for_status()
+            results = self._command_results(ET.fromstring(response.text))
+            create_result = results[0]
+            # Если сервер выполнил только первую команду, SaveOrder отправим отдельно
+            save_result = results[1] if len(results) > 1 else None
+        else:
+            with self._timed('create_order'):
+                response = self.client.post(self._build_query(create_cmd), timeout=30)
+            response.raise_for_status()
+            create_result = self._command_results(ET.fromstring(response.text))[0]
+            save_result = None
+        
+        if create_result.get('Status') != 'Ok':
+            logger.error(f"Ошибка при создании заказа в R-Keeper: {create_result.get('ErrorText', 'Неизвестная ошибка')}")
+            return None, False
+        
+        # Сервер может проигнорировать предложенный GUID - тогда используем выданный им
+        server_guid = create_result.get('guid') or order_guid
+        if server_guid != order_guid:
+            order.rkeeper_order_id = server_guid
+            order.save(update_fields=['rkeeper_order_id'])
+        
+        if save_result is None:
+            if server_guid != order_guid:
+                save_cmd = self._build_save_order_cmd(server_guid, order, station_code, reservation)
+            with self._timed('save_order'):
+                response = self.client.post(self._build_query(save_cmd), timeout=30)
+            response.raise_for_status()
+            save_result = self._command_results(ET.fromstring(response.text))[0]
+        
+        if save_result.get('Status') == 'Ok':
+            self._mark_saved(order, reservation)
+            logger.info(f"Заказ {server_guid} успешно сохранен в R-Keeper")
+            return server_guid, True
+        
+        # Конфликт seqNumber и прочие ошибки SaveOrder разбираем обычным путём
+        error_code = save_result.get('RK7ErrorN', '')
+        error_text = save_result.get('ErrorText', 'Неизвестная ошибка')
+        logger.warning(f"SaveOrder returned error {error_code}: {error_text} (попытка 1)")
+        retry = self._handle_save_error(error_code, error_text, reservation)
+        if retry is not None:
+            return server_guid, retry
+        return server_guid, self._add_items_to_order(server_guid, order, station_code, retry_count=1)
+    
+    def _build_query(self, *commands):
+        """Собирает RK7Query из одной или нескольких команд RK7CMD"""
+        commands_xml = "\n".join(commands)
+        return f'''<?xml version="1.0" encoding="utf-8"?>
+        <RK7Query>
+        {commands_xml}
+        </RK7Query>
+        '''
+    
+    def _command_results(self, root):
+        """
+        Возвращает атрибуты результатов команд из ответа RK7
+        
+        На запрос с несколькими командами сервер отвечает элементами
+        CommandResult внутри RK7QueryResult, на одиночный - атрибутами корня.
+        """
+        command_results = root.findall('CommandResult') or [root]
+        results = []
+        for result in command_results:
+            attrs = dict(result.attrib)
+            if not attrs.get('guid'):
+                order_element = result.find('.//Order')
+                if order_element is not None and order_element.get('guid'):
+                    attrs['guid'] = order_element.get('guid')
+            results.append(attrs)
+        return results
+    
+    def _build_create_order_cmd(self, order, station_code, order_guid=None):
+        """
+        Формирует команду CreateOrder
+        
+        Args:
+            order (Order): Объект заказа
+            station_code (int): Код станции
+            order_guid (str): GUID, который следует присвоить заказу (необязательно)
+        
+        Returns:
+            str: XML команды RK7CMD
         """
         # Получаем номер стола из связанного объекта table
         table = order.table if order.table else None
@@ -155,34 +309,41 @@ class RKeeperService:
             escaped_comment = order.comment.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
             comment_parts.append(f"Комментарий: {escaped_comment}")
         persistent_comment = " | ".join(comment_parts)
+        guid_attr = f' guid="{order_guid}"' if order_guid else ''
         
         # Создаем заказ с указанием номера стола, официанта и комментария
-        xml_query = f'''<?xml version="1.0" encoding="utf-8"?>
-        <RK7Query>
-         <RK7CMD CMD="CreateOrder">
-          <Order persistentComment="{persistent_comment}">
+        return f'''<RK7CMD CMD="CreateOrder">
+          <Order persistentComment="{persistent_comment}"{guid_attr}>
            <Table code="{table_number}"/>
            <Station code="{station_code}"/>
            <GuestType id="1"/>
            {f'<Waiter code="{order.waiter.code}"/>' if order.waiter else ''}
           </Order>
-         </RK7CMD>
-        </RK7Query>
-        '''
+         </RK7CMD>'''
+    
+    def _create_order(self, order, station_code, order_guid=None):
+        """
+        Создание нового заказа в R-Keeper
         
-        logger.debug(f"XML запрос для создания заказа: {xml_query}")
+        Args:
+            order (Order): Объект заказа
+            station_code (int): Код станции
+            order_guid (str): GUID, который следует присвоить заказу (необязательно)
+        
+        Returns:
+            str: GUID заказа в R-Keeper или None в случае ошибки
+        """
+        table_number = order.table.number if order.table else 1
+        xml_query = self._build_query(self._build_create_order_cmd(order, station_code, order_guid))
+        
+        logger.debug("XML запрос для создания заказа: %s", xml_query)
         
         try:
-            response = self.session.post(
-                self.api_url,
-                data=xml_query.encode('utf-8'),
-                verify=False,
-                headers=self.headers,
-                timeout=30  # Увеличиваем таймаут
-            )
+            with self._timed('create_order'):
+                response = self.client.post(xml_query, timeout=30)
             response.raise_for_status()
             
-            logger.debug(f"Ответ R-Keeper: {response.text}")
+            logger.debug("Ответ R-Keeper: %s", response.text)
             
             # Парсим ответ
             root = ET.fromstring(response.text)
@@ -216,29 +377,30 @@ class RKeeperService:
             logger.error(f"Ошибка при создании заказа в R-Keeper: {str(e)}")
             return None
     
-    def _add_items_to_order(self, order_guid, order, station_code, retry_count=0):
+    def _reserve_seq(self):
+        """Резервирует seqNumber в общем счётчике, если настроено лицензирование"""
+        if not (self.license_anchor and self.license_token and self.license_instance_guid):
+            return None
+        with self._timed('license_seq'):
+            return self.seq_allocator.reserve(self._get_license_seq)
+    
+    def _build_save_order_cmd(self, order_guid, order, station_code, reservation):
         """
-        Добавление позиций в заказ R-Keeper
+        Формирует команду SaveOrder с позициями заказа
         
         Args:
             order_guid (str): GUID заказа в R-Keeper
             order (Order): Объект заказа
             station_code (int): Код станции
-            retry_count (int): Количество попыток (для предотвращения бесконечной рекурсии)
+            reservation (SeqReservation): Зарезервированный seqNumber или None
         
         Returns:
-            bool: True в случае успеха, False в случае ошибки
+            str: XML команды RK7CMD или None, если нет позиций для отправки
         """
-        # Ограничиваем количество попыток
-        if retry_count >= 3:
-            logger.error(f"Превышено максимальное количество попыток ({retry_count}) для заказа {order_guid}")
-            return False
-        
         # Подготовка XML для блюд
         dish_elements = []
         
-        items = order.items.all()
-        logger.info(f"Добавление блюд в заказ {order_guid}, найдено {items.count()} позиций (попытка {retry_count + 1})")
+        items = order.items.select_related('menu_item')
         
         for item in items:
             try:
@@ -263,69 +425,104 @@ class RKeeperService:
                 else:
                     dish_elements.append(f'<Dish id="{rkeeper_id}" quantity="{quantity}"/>')
                 
-                logger.debug(f"Подготовлена позиция заказа: {item.menu_item.name}, количество: {quantity}, комментарий: {comment}")
+                logger.debug("Подготовлена позиция заказа: %s, количество: %s, комментарий: %s", item.menu_item.name, quantity, comment)
             except Exception as e:
                 logger.error(f"Ошибка при подготовке позиции заказа: {str(e)}")
         
         # Если нет блюд для отправки, возвращаем ошибку
         if not dish_elements:
-            logger.error("Нет позиций для добавления в заказ R-Keeper")
-            return False
+            return None
         
-        # Формируем XML-запрос с информацией лицензии из заказа
         dishes_xml = "\n".join(dish_elements)
         
-        # Получаем текущий seqNumber из кэша или инициализируем новый для первого запроса
-        seq = cache.get(self.cache_key)
-        if seq is None:
-            # Пытаемся получить актуальный seqNumber с сервера
-            try:
-                logger.info("Trying to get current seqNumber from server for initial setup")
-                server_seq = self._get_license_seq()
-                seq = server_seq + 1
-                cache.set(self.cache_key, seq)
-                logger.info(f"Initial seqNumber set to {seq} based on server value {server_seq}")
-            except Exception as e:
-                logger.warning(f"Failed to get seqNumber from server, using 0: {e}")
-                # первый запрос для нового экземпляра лицензии (seqNumber=0)
-                seq = 0
-                cache.set(self.cache_key, seq)
-                logger.info("Initial seqNumber set to 0 for new license instance")
-        
-        logger.info(f"Используем seqNumber={seq} для SaveOrder (попытка {retry_count + 1})")
-        
         license_xml = ''
-        if self.license_anchor and self.license_token and self.license_instance_guid:
+        if reservation:
             license_xml = f'''<LicenseInfo anchor="{self.license_anchor}" licenseToken="{self.license_token}">
-             <LicenseInstance guid="{self.license_instance_guid}" seqNumber="{seq}"/>
+             <LicenseInstance guid="{self.license_instance_guid}" seqNumber="{reservation.seq}"/>
         </LicenseInfo>'''
         
-        xml_query = f'''<?xml version="1.0" encoding="utf-8"?>
-        <RK7Query>
-         <RK7CMD CMD="SaveOrder">
+        return f'''<RK7CMD CMD="SaveOrder">
           {license_xml}
           <Order guid="{order_guid}"/>
           <Session>
            <Station code="{station_code}"/>
            {dishes_xml}
           </Session>
-         </RK7CMD>
-        </RK7Query>
-        '''
+         </RK7CMD>'''
+    
+    def _handle_save_error(self, error_code, error_text, reservation):
+        """
+        Обрабатывает ошибку SaveOrder
+        
+        Returns:
+            bool|None: None - нужно повторить SaveOrder, иначе итоговый результат
+        """
+        # Ошибка 5304: инстанс лицензии не найден → создаём новый инстанс
+        if error_code == '5304' and reservation:
+            self.seq_allocator.reset_instance(reservation.epoch)
+            return None
         
-        logger.debug(f"XML запрос для добавления позиций: {xml_query}")
+        # Ошибки 5305/5310: seqNumber неверен или не увеличен → узнаём актуальный.
+        # Синхронизацию выполняет только первый процесс, получивший ошибку
+        if error_code in ['5305', '5310'] and reservation:
+            with self._timed('license_seq'):
+                self.seq_allocator.resync(reservation.epoch, self._get_license_seq)
+            return None
+        
+        # Ошибка лицензии другого типа
+        if error_text and 'License check' in error_text:
+            logger.warning(f"License check error during SaveOrder: {error_text}")
+            return True
+        
+        logger.error(f"SaveOrder failed with unhandled error {error_code}: {error_text}")
+        return False
+    
+    def _mark_saved(self, order, reservation):
+        """Запоминает seqNumber, с которым заказ принят сервером"""
+        if reservation:
+            order.rkeeper_license_seq = reservation.seq
+            order.save(update_fields=['rkeeper_license_seq'])
+    
+    def _add_items_to_order(self, order_guid, order, station_code, retry_count=0):
+        """
+        Добавление позиций в заказ R-Keeper
+        
+        Args:
+            order_guid (str): GUID заказа в R-Keeper
+            order (Order): Объект заказа
+            station_code (int): Код станции
+            retry_count (int): Количество попыток (для предотвращения бесконечной рекурсии)
+        
+        Returns:
+            bool: True в случае успеха, False в случае ошибки
+        """
+        # Ограничиваем количество попыток
+        if retry_count >= 3:
+            logger.error(f"Превышено максимальное количество попыток ({retry_count}) для заказа {order_guid}")
+            return False
+        
+        logger.info(f"Добавление блюд в заказ {order_guid} (попытка {retry_count + 1})")
+        
+        # Резервируем seqNumber в общем счётчике (при первом запросе он синхронизируется с сервером)
+        reservation = self._reserve_seq()
+        if reservation:
+            logger.info(f"Используем seqNumber={reservation.seq} для SaveOrder (попытка {retry_count + 1})")
+        
+        save_cmd = self._build_save_order_cmd(order_guid, order, station_code, reservation)
+        if save_cmd is None:
+            logger.error("Нет позиций для добавления в заказ R-Keeper")
+            return False
+        
+        xml_query = self._build_query(save_cmd)
+        
+        logger.debug("XML запрос для добавления позиций: %s", xml_query)
         
         try:
-            response = self.session.post(
-                self.api_url,
-                data=xml_query.encode('utf-8'),
-                verify=False,
-                headers=self.headers,
-                timeout=30  # Увеличиваем таймаут
-            )
+            with self._timed('save_order'):
+                response = self.client.post(xml_query, timeout=30)
             response.raise_for_status()
             
-            logger.debug(f"Ответ R-Keeper: {response.text}")
+            logger.debug("Ответ R-Keeper: %s", response.text)
             
             # Парсим ответ
             root = ET.fromstring(response.text)
@@ -337,63 +534,23 @@ class RKeeperService:
                 error_code = root.get('RK7ErrorN', '')
                 logger.warning(f"SaveOrder returned error {error_code}: {error_text} (попытка {retry_count + 1})")
                 
-                # Ошибка 5304: инстанс лицензии не найден → создаём новый инстанс
-                if error_code == '5304':
-                    cache.set(self.cache_key, 0)
-                    logger.info(f"Reset seqNumber to 0 for error 5304 and retry")
+                result = self._handle_save_error(error_code, error_text, reservation)
+                if result is None:
                     return self._add_items_to_order(order_guid, order, station_code, retry_count + 1)
-                
-                # Ошибки 5305/5310: seqNumber неверен или не увеличен → узнаём актуальный
-                if error_code in ['5305', '5310']:
-                    try:
-                        correct_seq = self._get_license_seq()
-                        # Для повторного SaveOrder используем следующий после полученного seqNumber
-                        next_seq = correct_seq + 1
-                        cache.set(self.cache_key, next_seq)
-                        logger.info(f"Updated seqNumber from server {correct_seq} to {next_seq} for retry")
-                        return self._add_items_to_order(order_guid, order, station_code, retry_count + 1)
-                    except requests.exceptions.Timeout as e:
-                        logger.error(f"Timeout while getting seqNumber on error {error_code}: {e}")
-                        # При таймауте сбрасываем seqNumber в 0 и не делаем повторную попытку
-                        cache.set(self.cache_key, 0)
-                        logger.info("Reset seqNumber to 0 due to timeout")
-                        return False
-                    except Exception as e:
-                        logger.error(f"Failed to refresh seqNumber on error {error_code}: {e}")
-                        # Если не удалось получить правильный seqNumber, сбрасываем в 0
-                        cache.set(self.cache_key, 0)
-                        logger.info("Reset seqNumber to 0 due to error getting correct seqNumber")
-                        return self._add_items_to_order(order_guid, order, station_code, retry_count + 1)
-                
-                # Ошибка лицензии другого типа
-                if error_text and 'License check' in error_text:
-                    logger.warning(f"License check error during SaveOrder: {error_text}")
-                    return True
-                
-                logger.error(f"SaveOrder failed with unhandled error {error_code}: {error_text}")
-                return False
+                return result
             
-            # При успешном SaveOrder инкрементируем seqNumber
-            try:
-                cache.incr(self.cache_key)
-                logger.info(f"Successfully incremented seqNumber to {cache.get(self.cache_key)}")
-            except ValueError:
-                cache.set(self.cache_key, 1)
-                logger.info("Reset seqNumber to 1 after ValueError")
+            self._mark_saved(order, reservation)
             
             logger.info(f"Заказ {order_guid} успешно сохранен в R-Keeper")
             return True
-            
+        
         except requests.exceptions.Timeout as e:
             logger.error(f"Таймаут при добавлении позиций в заказ {order_guid}: {str(e)}")
-            # При таймауте сбрасываем seqNumber
-            cache.set(self.cache_key, 0)
-            logger.info("Reset seqNumber to 0 due to timeout in SaveOrder")
             return False
         except Exception as e:
             logger.error(f"Ошибка при добавлении позиций: {str(e)}")
             return False
-    
+
     def _get_license_seq(self):
         """Запрос текущего seqNumber инстанса от R-Keeper"""
         # Формируем запрос для получения текущего seqNumber (LicenseInstance внутри LicenseInfo)
@@ -406,15 +563,13 @@ class RKeeperService:
  </RK7CMD>
 </RK7Query>
 '''
-        logger.debug(f"XML запрос GetXMLLicenseInstanceSeqNumber: {xml_query}")
+        logger.debug("XML запрос GetXMLLicenseInstanceSeqNumber: %s", xml_query)
         
         try:
-            response = self.session.post(
-                self.api_url, data=xml_query.encode('utf-8'), headers=self.headers, verify=False, timeout=10
-            )
+            response = self.client.post(xml_query, timeout=10)
             response.raise_for_status()
             
-            logger.debug(f"Ответ GetXMLLicenseInstanceSeqNumber: {response.text}")
+            logger.debug("Ответ GetXMLLicenseInstanceSeqNumber: %s", response.text)
             
             root = ET.fromstring(response.text)
             status = root.get('Status')
@@ -447,8 +602,8 @@ class RKeeperService:
         """Принудительный сброс seqNumber лицензии"""
         try:
             logger.info("Принудительный сброс seqNumber лицензии")
-            cache.delete(self.cache_key)
-            logger.info("seqNumber сброшен в кэше")
+            self.seq_allocator.clear()
+            logger.info("seqNumber сброшен")
             return True
         except Exception as e:
             logger.error(f"Ошибка при сбросе seqNumber: {str(e)}")
@@ -458,18 +613,9 @@ class RKeeperService:
         """Принудительная синхронизация seqNumber с сервером"""
         try:
             logger.info("Принудительная синхронизация seqNumber с сервером")
-            server_seq = self._get_license_seq()
-            next_seq = server_seq + 1
-            cache.set(self.cache_key, next_seq)
-            logger.info(f"seqNumber синхронизирован: сервер={server_seq}, локальный={next_seq}")
+            next_seq = self.seq_allocator.force_resync(self._get_license_seq)
+            logger.info(f"seqNumber синхронизирован: следующий номер {next_seq}")
             return True
-        except requests.exceptions.Timeout as e:
-            logger.error(f"Таймаут при синхронизации seqNumber: {str(e)}")
-            cache.set(self.cache_key, 0)
-            logger.info("seqNumber сброшен в 0 из-за таймаута")
-            return False
         except Exception as e:
             logger.error(f"Ошибка при синхронизации seqNumber: {str(e)}")
-            cache.set(self.cache_key, 0)
-            logger.info("seqNumber сброшен в 0 из-за ошибки")
-            return False 
\ No newline at end of file
+            return False
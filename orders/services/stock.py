@@ -0,0 +1,113 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from menu.models import MenuItem, UNLIMITED_QUANTITY
+from ..models import StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+class OutOfStockError(Exception):
+    """Остатка позиции не хватает для заказа"""
+
+    def __init__(self, menu_item):
+        self.menu_item = menu_item
+        super().__init__(f"Недостаточно остатка позиции {menu_item.name}")
+
+
+def is_limited(menu_item):
+    """Ограничено ли количество позиции"""
+    return menu_item.quantity < UNLIMITED_QUANTITY
+
+
+def available_quantity(menu_item):
+    """Доступный к заказу остаток с учётом резервов"""
+    if not is_limited(menu_item):
+        return menu_item.quantity
+    return max(menu_item.quantity - menu_item.reserved_quantity, 0)
+
+
+def reserve_stock(order, lines):
+    """
+    Резервирует остатки позиций заказа
+
+    Каждая позиция резервируется условным UPDATE ... WHERE quantity >=
+    reserved_quantity + n, поэтому параллельные заказы не продадут больше,
+    чем есть. Должна вызываться внутри транзакции создания заказа: при
+    нехватке любой позиции транзакция откатывается целиком. Блокировки строк
+    держатся только до конца этой транзакции, а не на время оплаты.
+
+    Args:
+        order (Order): Заказ
+        lines (list): Позиции корзины (CartLine)
+
+    Raises:
+        OutOfStockError: Если остатка какой-либо позиции не хватает
+    """
+    expires_at = timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+    reservations = []
+    # Порядок по id исключает взаимные блокировки параллельных заказов
+    for line in sorted(lines, key=lambda line: line.id):
+        if not is_limited(line.menu_item):
+            continue
+        updated = MenuItem.objects.filter(
+            id=line.id,
+            quantity__gte=F('reserved_quantity') + line.quantity,
+        ).update(reserved_quantity=F('reserved_quantity') + line.quantity)
+        if not updated:
+            raise OutOfStockError(line.menu_item)
+        reservations.append(StockReservation(
+            order=order, menu_item=line.menu_item, quantity=line.quantity, expires_at=expires_at
+        ))
+    StockReservation.objects.bulk_create(reservations)
+    return reservations
+
+
+def release_stock(order_id):
+    """
+    Снимает резервы заказа (оплата не прошла, заказ отменён или уже
+    отправлен в R-Keeper и учтён в его остатках)
+
+    Returns:
+        int: Количество снятых резервов
+    """
+    with transaction.atomic():
+        reservations = list(
+            StockReservation.objects.select_for_update().filter(order_id=order_id).order_by('menu_item_id')
+        )
+        for reservation in reservations:
+            MenuItem.objects.filter(
+                id=reservation.menu_item_id, reserved_quantity__gte=reservation.quantity
+            ).update(reserved_quantity=F('reserved_quantity') - reservation.quantity)
+        StockReservation.objects.filter(id__in=[reservation.id for reservation in reservations]).delete()
+    if reservations:
+        logger.info(f"Сняты резервы остатков заказа #{order_id}: {len(reservations)} позиций")
+    return len(reservations)
+
+
+def release_expired_reservations():
+    """
+    Снимает истёкшие резервы неоплаченных заказов
+
+    Резервы оплаченных заказов остаются до отправки заказа в R-Keeper
+    (или до отказа от отправки, см. rkeeper_outbox._schedule_retry).
+
+    Returns:
+        int: Количество заказов, резервы которых сняты
+    """
+    order_ids = set(
+        StockReservation.objects
+        .filter(expires_at__lte=timezone.now())
+        .exclude(order__status__in=['paid', 'processing'])
+        .values_list('order_id', flat=True)
+    )
+    for order_id in order_ids:
+        release_stock(order_id)
+    if order_ids:
+        logger.info(f"Сняты истёкшие резервы остатков {len(order_ids)} заказов")
+    return len(order_ids)
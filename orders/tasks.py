@@ -0,0 +1,42 @@
+from celery import shared_task
+from django.conf import settings
+import logging
+
+from .services.rkeeper_outbox import claim_due_entries, process_entry
+from .services.stock import release_expired_reservations
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def dispatch_rkeeper_outbox():
+    """
+    Разбирает очередь отправки заказов в R-Keeper: захватывает записи,
+    время отправки которых наступило, и запускает их отправку
+    """
+    claimed = claim_due_entries()
+    for entry_id, lease in claimed:
+        send_order_to_rkeeper_task.delay(entry_id, lease)
+    if claimed:
+        logger.info(f"Запущена отправка в R-Keeper для {len(claimed)} заказов")
+    return len(claimed)
+
+# Задача должна завершиться раньше, чем истечёт захват записи очереди
+@shared_task(time_limit=int(settings.RKEEPER_OUTBOX_LEASE * 0.9))
+def send_order_to_rkeeper_task(entry_id, lease):
+    """
+    Отправляет в R-Keeper один заказ из очереди
+
+    Args:
+        entry_id (int): ID записи RKeeperOutbox
+        lease (int): Номер захвата записи
+    """
+    sent = process_entry(entry_id, lease)
+    if sent:
+        # Освободился слот - забираем следующие заказы, не дожидаясь расписания
+        dispatch_rkeeper_outbox.delay()
+    return sent
+
+@shared_task
+def release_expired_stock_reservations():
+    """Снимает резервы остатков заказов, которые так и не были оплачены"""
+    return release_expired_reservations()
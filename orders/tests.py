@@ -1,3 +1,593 @@
-from django.test import TestCase
+import json
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import redis
+import requests
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.query_budget import QueryBudgetTestMixin
+from menu.models import Category, MenuItem, Station
+
+from . import views
+from .admin import OrderAdmin
+from .benchmark import SCENARIOS, FunnelBenchmark, compare_results, isolated_storage, seed_benchmark_data
+from .models import Order, OrderItem, PaymentCallbackEvent, RKeeperOutbox, StockReservation, Table, Waiter
+from .services.cart import CartLine
+from .services.cart_store import RedisCartStore, SessionCartStore
+from .services.checkout import place_order
+from .services.license_seq import DatabaseLicenseSeqAllocator, SeqReservation
+from .services.payment_callback import APPLIED, DUPLICATE, NOT_FOUND, SKIPPED, process_payment_callback
+from .services.rkeeper_outbox import claim_due_entries, process_entry
+from .services.rkeeper_service import RKeeperService
+from .services.stock import OutOfStockError, release_expired_reservations, release_stock
+
+
+@skipUnless(connection.vendor == 'postgresql', 'План запроса проверяется только на PostgreSQL')
+class OrderLookupIndexTests(TestCase):
+    """Поиск заказа по платежу и активных столов использует индексы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Order.objects.bulk_create([
+            Order(total_amount=100, payment_id=f'pay-{i}' if i % 2 else None)
+            for i in range(200)
+        ])
+        Table.objects.bulk_create([
+            Table(number=i, station_id='101', is_active=i % 4 != 0)
+            for i in range(1, 101)
+        ])
+
+    def setUp(self):
+        # На маленькой тестовой таблице планировщик предпочёл бы полный просмотр
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def test_payment_lookup_uses_partial_index(self):
+        plan = Order.objects.filter(payment_id='pay-7').values_list('id', flat=True).explain()
+        self.assertIn('orders_order_payment_idx', plan)
+
+    def test_active_tables_use_partial_index(self):
+        plan = Table.objects.filter(is_active=True).order_by('number').explain()
+        self.assertIn('orders_table_active_idx', plan)
+
+
+@override_settings(CART_BACKEND='session')
+class FunnelBenchmarkTests(TestCase):
+    """Прогон замеров воронки заказа проходит все шаги и даёт сравнимые результаты"""
+
+    def test_run_measures_every_step(self):
+        station = seed_benchmark_data(menu_size=20, tables=3)
+        results = FunnelBenchmark(iterations=3, warmup=1, items_per_order=2).run(station)
+
+        self.assertEqual(list(results['scenarios']), SCENARIOS)
+        self.assertEqual(results['scenarios']['add_to_cart']['requests'], 6)
+        for stats in results['scenarios'].values():
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+            self.assertGreater(stats['queries_max'], 0)
+        self.assertEqual(Order.objects.filter(status='paid').count(), 4)
+        self.assertEqual(RKeeperOutbox.objects.count(), 4)
+
+    def test_compare_results_reports_regressions(self):
+        baseline = {'scenarios': {'checkout': {'p95_ms': 10.0, 'queries_max': 2}}}
+        current = {'scenarios': {'checkout': {'p95_ms': 11.0, 'queries_max': 2}}}
+        self.assertEqual(compare_results(current, baseline, max_regression=20), [])
+
+        current['scenarios']['checkout'].update(p95_ms=13.0, queries_max=3)
+        self.assertEqual(len(compare_results(current, baseline, max_regression=20)), 2)
+
+    def test_isolated_storage_keeps_shared_cache_clean(self):
+        cache.set('shared', 'production')
+        with isolated_storage():
+            self.assertIsNone(cache.get('shared'))
+            cache.set('shared', 'benchmark')
+            self.assertTrue(settings.CART_KEY_PREFIX.startswith('bench-'))
+        self.assertEqual(cache.get('shared'), 'production')
+
+
+@override_settings(ALLOWED_HOSTS=['*'], CART_BACKEND='session')
+class CartQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Представления корзины укладываются в свои бюджеты запросов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        station = seed_benchmark_data(menu_size=10, tables=1)
+        cls.item_ids = list(MenuItem.objects.filter(station=station).values_list('id', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def _post_json(self, view, url_name, data):
+        return self.assertViewWithinBudget(
+            view, self.client.post, reverse(url_name), json.dumps(data), content_type='application/json'
+        )
+
+    def test_cart_views_within_budget(self):
+        for item_id in self.item_ids[:5]:
+            response = self._post_json(views.add_to_cart, 'orders:add_to_cart', {'item_id': item_id, 'quantity': 1})
+            self.assertEqual(response.status_code, 200)
+
+        item_id = self.item_ids[0]
+        self._post_json(views.update_cart_item, 'orders:update_cart_item', {'item_id': item_id, 'quantity': 2})
+        self._post_json(views.remove_from_cart, 'orders:remove_from_cart', {'item_id': item_id})
+        self.assertViewWithinBudget(views.cart_count, self.client.get, reverse('orders:cart_count'))
+        self.assertViewWithinBudget(views.CartDataView.as_view(), self.client.get, reverse('orders:cart_data'))
+        self.assertViewWithinBudget(views.CartView.as_view(), self.client.get, reverse('orders:cart'))
+        self.assertViewWithinBudget(views.CheckoutView.as_view(), self.client.get, reverse('orders:checkout'))
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class OrderAdminQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Страницы админки заказов не делают запросов на каждую строку"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        seed_benchmark_data(menu_size=10, tables=10)
+        items = list(MenuItem.objects.all()[:5])
+        for table in Table.objects.all():
+            order = Order.objects.create(table=table, total_amount=500, status='paid')
+            OrderItem.objects.bulk_create([OrderItem(order=order, menu_item=item, quantity=1, price=100, total=100) for item in items])
+            RKeeperOutbox.objects.create(order=order)
+        cls.order = order
+
+    def setUp(self):
+        # Бюджет должен выдерживать и первый запрос после сброса справочников
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_changelists_within_budget(self):
+        for model in (Waiter, Table, Order, OrderItem, RKeeperOutbox):
+            with self.subTest(model=model.__name__):
+                self.assertChangelistWithinBudget(self.client, admin.site._registry[model])
+
+    def test_order_change_within_budget(self):
+        with self.assertQueryBudget(OrderAdmin.change_query_budget, 'Order change'):
+            response = self.client.get(reverse('admin:orders_order_change', args=[self.order.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_order_items_stay_editable(self):
+        response = self.client.get(reverse('admin:orders_order_change', args=[self.order.pk]))
+        self.assertContains(response, 'name="items-0-menu_item"')
+        self.assertContains(response, 'items-__prefix__-menu_item')
+        for item in self.order.items.select_related('menu_item__station'):
+            self.assertContains(response, f'<option value="{item.menu_item_id}" selected>{item.menu_item}</option>')
+
+
+    @override_settings(QUERY_BUDGET_MODE='raise')
+    def test_order_save_with_items(self):
+        items = list(self.order.items.order_by('pk'))
+        data = {
+            'station_id': '', 'table': self.order.table_id, 'total_amount': '600.00', 'status': 'paid',
+            'payment_id': '', 'rkeeper_order_id': '',
+            'items-TOTAL_FORMS': len(items) + 1, 'items-INITIAL_FORMS': len(items),
+            'items-MIN_NUM_FORMS': 0, 'items-MAX_NUM_FORMS': 1000,
+        }
+        for i, item in enumerate(items):
+            data.update({f'items-{i}-id': item.pk, f'items-{i}-order': self.order.pk,
+                         f'items-{i}-menu_item': item.menu_item_id, f'items-{i}-quantity': 2})
+        new_item = MenuItem.objects.exclude(pk__in=[item.menu_item_id for item in items]).first()
+        data.update({f'items-{len(items)}-menu_item': new_item.pk, f'items-{len(items)}-quantity': 1})
+
+        response = self.client.post(reverse('admin:orders_order_change', args=[self.order.pk]), data)
+
+        self.assertRedirects(response, reverse('admin:orders_order_changelist'))
+        self.assertEqual(self.order.items.count(), len(items) + 1)
+        self.assertEqual(set(self.order.items.exclude(menu_item=new_item).values_list('quantity', flat=True)), {2})
+
+
+class DatabaseLicenseSeqAllocatorTests(TestCase):
+    """Выдача и синхронизация seqNumber лицензии R-Keeper"""
+
+    def setUp(self):
+        self.allocator = DatabaseLicenseSeqAllocator('test-guid')
+
+    def test_reserve_initializes_from_server(self):
+        fetch = mock.Mock(return_value=41)
+        self.assertEqual(self.allocator.reserve(fetch), SeqReservation(42, 1))
+        self.assertEqual(self.allocator.reserve(fetch), SeqReservation(43, 1))
+        fetch.assert_called_once()
+
+    def test_resync_skips_when_epoch_moved_on(self):
+        reservation = self.allocator.reserve(lambda: 10)
+        self.assertTrue(self.allocator.resync(reservation.epoch, lambda: 20))
+        self.assertEqual(self.allocator.current(), 21)
+
+        # Другой процесс получил ошибку на номере из старого epoch
+        fetch = mock.Mock(return_value=99)
+        self.assertFalse(self.allocator.resync(reservation.epoch, fetch))
+        fetch.assert_not_called()
+        self.assertEqual(self.allocator.reserve(fetch), SeqReservation(21, 2))
+
+    def test_resync_fetches_server_seq_outside_lock(self):
+        reservation = self.allocator.reserve(lambda: 0)
+        calls = []
+        real_lock = self.allocator._lock
+
+        def lock():
+            calls.append('lock')
+            return real_lock()
+
+        def fetch():
+            calls.append('fetch')
+            return 5
+
+        with mock.patch.object(self.allocator, '_lock', side_effect=lock):
+            self.assertTrue(self.allocator.resync(reservation.epoch, fetch))
+        self.assertEqual(calls, ['fetch', 'lock'])
+        self.assertEqual(self.allocator.current(), 6)
+
+    def test_reset_instance(self):
+        reservation = self.allocator.reserve(lambda: 500)
+        self.assertTrue(self.allocator.reset_instance(reservation.epoch))
+        self.assertFalse(self.allocator.reset_instance(reservation.epoch))
+        self.assertEqual(self.allocator.reserve(lambda: 500), SeqReservation(0, 2))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Блокировка строк проверяется только на PostgreSQL')
+class ConcurrentLicenseSeqTests(TransactionTestCase):
+    """Параллельные reserve() не выдают один номер дважды"""
+
+    def test_concurrent_reserve_gives_unique_numbers(self):
+        DatabaseLicenseSeqAllocator('test-guid').reserve(lambda: 0)
+
+        def reserve(_):
+            try:
+                return DatabaseLicenseSeqAllocator('test-guid').reserve(lambda: 0).seq
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            numbers = list(executor.map(reserve, range(80)))
+        self.assertEqual(sorted(numbers), list(range(2, 82)))
+
+
+@override_settings(RKEEPER_OUTBOX_CONCURRENCY=4, RKEEPER_OUTBOX_LEASE=300)
+class RKeeperOutboxTests(TestCase):
+    """Заказ из очереди отправляется в R-Keeper один раз"""
+
+    def setUp(self):
+        self.order = Order.objects.create(total_amount=100, status='paid')
+        self.entry = RKeeperOutbox.objects.create(order=self.order)
+        patcher = mock.patch('orders.services.rkeeper_outbox.RKeeperService')
+        self.send_order = patcher.start().return_value.send_order
+        self.send_order.return_value = 'rk-1'
+        self.addCleanup(patcher.stop)
+
+    def test_duplicate_delivery_sends_once(self):
+        [(entry_id, lease)] = claim_due_entries()
+        self.assertTrue(process_entry(entry_id, lease))
+        self.assertFalse(process_entry(entry_id, lease))
+
+        self.send_order.assert_called_once()
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.status, 'sent')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'processing')
+
+    def test_reclaimed_entry_rejects_stale_task(self):
+        [(entry_id, stale_lease)] = claim_due_entries()
+        # Захват истёк, не дойдя до отправки (задача потерялась)
+        RKeeperOutbox.objects.filter(id=entry_id).update(next_attempt_at=timezone.now())
+        [(_, lease)] = claim_due_entries()
+
+        self.assertFalse(process_entry(entry_id, stale_lease))
+        self.assertTrue(process_entry(entry_id, lease))
+        self.send_order.assert_called_once()
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.attempts, 1)
+
+    @override_settings(RKEEPER_OUTBOX_MAX_ATTEMPTS=2)
+    def test_repeatedly_expired_lease_is_dead_lettered(self):
+        for _ in range(2):
+            self.assertEqual(len(claim_due_entries()), 1)
+            # Воркер упал во время отправки
+            RKeeperOutbox.objects.filter(id=self.entry.id).update(next_attempt_at=timezone.now())
+
+        self.assertEqual(claim_due_entries(), [])
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.status, self.entry.attempts), ('dead', 2))
+
+    def test_stale_worker_cannot_overwrite_result(self):
+        [(entry_id, lease)] = claim_due_entries()
+
+        def reclaim_during_send(order):
+            RKeeperOutbox.objects.filter(id=entry_id).update(next_attempt_at=timezone.now())
+            claim_due_entries()
+            return 'rk-1'
+
+        self.send_order.side_effect = reclaim_during_send
+        self.assertFalse(process_entry(entry_id, lease))
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.status, 'processing')
+
+    def test_failed_send_is_retried_later(self):
+        self.send_order.return_value = None
+        [(entry_id, lease)] = claim_due_entries()
+        self.assertFalse(process_entry(entry_id, lease))
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.status, self.entry.attempts), ('pending', 1))
+        self.assertEqual(claim_due_entries(), [])
+
+    @mock.patch('orders.tasks.dispatch_rkeeper_outbox.delay')
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def test_admin_retry_skips_entries_being_sent(self, dispatch):
+        dead = RKeeperOutbox.objects.create(
+            order=Order.objects.create(total_amount=100, status='paid'), status='dead', attempts=8
+        )
+        [(entry_id, lease)] = claim_due_entries()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+        self.client.post(reverse('admin:orders_rkeeperoutbox_changelist'), {
+            'action': 'retry_dispatch', '_selected_action': [entry_id, dead.id],
+        })
+
+        self.assertEqual(RKeeperOutbox.objects.get(id=entry_id).status, 'processing')
+        dead.refresh_from_db()
+        self.assertEqual((dead.status, dead.attempts), ('pending', 0))
+        self.assertTrue(process_entry(entry_id, lease))
+
+    @override_settings(RKEEPER_OUTBOX_CONCURRENCY=2)
+    def test_concurrency_limit(self):
+        for _ in range(3):
+            RKeeperOutbox.objects.create(order=Order.objects.create(total_amount=100, status='paid'))
+        self.assertEqual(len(claim_due_entries()), 2)
+        self.assertEqual(claim_due_entries(), [])
+
+
+def _rk7_response(xml):
+    return mock.Mock(text=xml, raise_for_status=mock.Mock())
+
+
+@override_settings(RKEEPER_LICENSE_ANCHOR='', RKEEPER_SUBMIT_MODE='pipelined')
+class RKeeperResendTests(TestCase):
+    """Повторная отправка не добавляет блюда в заказ R-Keeper второй раз"""
+
+    GUID = '{00000000-0000-0000-0000-000000000001}'
+
+    @classmethod
+    def setUpTestData(cls):
+        station = Station.objects.create(name='Зал', rkeeper_code='1', rkeeper_id='101')
+        category = Category.objects.create(name='Десерты', station=station)
+        cake = MenuItem.objects.create(name='Торт', price=500, category=category, station=station, rkeeper_id='77')
+        table = Table.objects.create(number=5, name='Зал', station_id='101')
+        cls.order = Order.objects.create(table=table, total_amount=500, status='paid')
+        OrderItem.objects.create(order=cls.order, menu_item=cake, quantity=1, price=500, total=500)
+
+    def setUp(self):
+        patcher = mock.patch('orders.services.rkeeper_service.get_rk7_client')
+        self.post = patcher.start().return_value.post
+        self.addCleanup(patcher.stop)
+
+    def _commands(self):
+        return [call.args[0].split('CMD="')[1].split('"')[0] for call in self.post.call_args_list]
+
+    def test_saved_order_is_not_saved_again(self):
+        Order.objects.filter(id=self.order.id).update(rkeeper_order_id=self.GUID)
+        self.post.return_value = _rk7_response(
+            f'<RK7QueryResult Status="Ok"><Order guid="{self.GUID}"><Session><Dish id="77"/></Session></Order></RK7QueryResult>'
+        )
+        self.assertEqual(RKeeperService().send_order(Order.objects.get(id=self.order.id)), self.GUID)
+        self.assertEqual(self._commands(), ['GetOrder'])
+
+    def test_empty_order_gets_dishes(self):
+        Order.objects.filter(id=self.order.id).update(rkeeper_order_id=self.GUID)
+        self.post.side_effect = [
+            _rk7_response(f'<RK7QueryResult Status="Ok"><Order guid="{self.GUID}"/></RK7QueryResult>'),
+            _rk7_response('<RK7QueryResult Status="Ok"/>'),
+        ]
+        self.assertEqual(RKeeperService().send_order(Order.objects.get(id=self.order.id)), self.GUID)
+        self.assertEqual(self._commands(), ['GetOrder', 'SaveOrder'])
+
+    def test_lost_order_is_created_with_same_guid(self):
+        Order.objects.filter(id=self.order.id).update(rkeeper_order_id=self.GUID)
+        self.post.side_effect = [
+            _rk7_response('<RK7QueryResult Status="Fail" ErrorText="Order not found"/>'),
+            _rk7_response(f'<RK7QueryResult Status="Ok" guid="{self.GUID}"/>'),
+            _rk7_response('<RK7QueryResult Status="Ok"/>'),
+        ]
+        self.assertEqual(RKeeperService().send_order(Order.objects.get(id=self.order.id)), self.GUID)
+        self.assertEqual(self._commands(), ['GetOrder', 'CreateOrder', 'SaveOrder'])
+        self.assertIn(f'guid="{self.GUID}"', self.post.call_args_list[1].args[0])
+
+    def test_guid_is_saved_before_posting(self):
+        self.post.side_effect = requests.exceptions.Timeout()
+        self.assertIsNone(RKeeperService().send_order(self.order))
+        guid = Order.objects.values_list('rkeeper_order_id', flat=True).get(id=self.order.id)
+        self.assertIn(f'guid="{guid}"', self.post.call_args.args[0])
+
+
+def _redis_available():
+    try:
+        return redis.Redis.from_url(settings.CART_REDIS_URL, socket_connect_timeout=0.5).ping()
+    except redis.RedisError:
+        return False
+
+
+class CartStoreBehaviour:
+    """Общие проверки хранилищ корзины; store_class задаёт наследник"""
+
+    store_class = None
+
+    def setUp(self):
+        request = RequestFactory().get('/')
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        self.store = self.store_class(request)
+        self.addCleanup(self.store.clear)
+
+    def test_add_respects_max_quantity(self):
+        self.assertEqual(self.store.add('1', 2, 3), 2)
+        self.assertIsNone(self.store.add('1', 2, 3))
+        self.assertEqual(self.store.add('1', 1, 3), 3)
+        self.assertEqual(self.store.items(), {'1': 3})
+        self.assertEqual(self.store.count(), 3)
+
+    def test_update_and_remove_keep_count(self):
+        self.store.add('1', 2, 10)
+        self.assertEqual(self.store.add('2', 3, 10), 5)
+        self.assertEqual(self.store.update('1', 5), 8)
+        self.assertEqual(self.store.remove('2'), 5)
+        self.assertEqual(self.store.items(), {'1': 5})
+        self.assertEqual(self.store.count(), 5)
+
+    def test_missing_item(self):
+        self.assertIsNone(self.store.update('1', 2))
+        self.assertIsNone(self.store.remove('1'))
+        self.store.add('1', 1, 10)
+        self.assertIsNone(self.store.remove('2'))
+        self.assertEqual(self.store.count(), 1)
+
+    def test_clear(self):
+        self.store.add('1', 1, 10)
+        self.store.clear()
+        self.assertEqual(self.store.items(), {})
+        self.assertEqual(self.store.count(), 0)
+
+
+class SessionCartStoreTests(CartStoreBehaviour, TestCase):
+    store_class = SessionCartStore
+
+
+@skipUnless(_redis_available(), 'Нужен Redis по адресу CART_REDIS_URL')
+class RedisCartStoreTests(CartStoreBehaviour, TestCase):
+    store_class = RedisCartStore
+
+
+class StockReservationTests(TestCase):
+    """Резервы остатков блюд с ограниченным количеством"""
+
+    @classmethod
+    def setUpTestData(cls):
+        station = Station.objects.create(name='Зал', rkeeper_code='1', rkeeper_id='101')
+        category = Category.objects.create(name='Десерты', station=station)
+        cls.cake = MenuItem.objects.create(name='Торт', price=500, quantity=5, category=category, station=station)
+        cls.pie = MenuItem.objects.create(name='Пирог', price=300, quantity=1, category=category, station=station)
+
+    def _place(self, *lines):
+        return place_order(
+            [CartLine(item, quantity, item.price * quantity) for item, quantity in lines],
+            sum(item.price * quantity for item, quantity in lines),
+        )
+
+    def _reserved(self, item):
+        return MenuItem.objects.values_list('reserved_quantity', flat=True).get(id=item.id)
+
+    def test_reserve_does_not_oversell(self):
+        self._place((self.cake, 3))
+        with self.assertRaises(OutOfStockError):
+            self._place((self.cake, 3))
+        self.assertEqual(self._reserved(self.cake), 3)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_shortage_of_one_line_rolls_back_order(self):
+        with self.assertRaises(OutOfStockError):
+            self._place((self.cake, 2), (self.pie, 2))
+        self.assertEqual(self._reserved(self.cake), 0)
+        self.assertFalse(Order.objects.exists())
+
+    def test_release_stock(self):
+        order = self._place((self.cake, 2), (self.pie, 1))
+        self.assertEqual(release_stock(order.id), 2)
+        self.assertEqual((self._reserved(self.cake), self._reserved(self.pie)), (0, 0))
+        self.assertEqual(release_stock(order.id), 0)
+
+    def test_expired_reservations_of_unpaid_orders_are_released(self):
+        unpaid = self._place((self.cake, 2))
+        paid = self._place((self.cake, 1))
+        Order.objects.filter(id=paid.id).update(status='paid')
+        StockReservation.objects.update(expires_at=timezone.now())
+
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertFalse(StockReservation.objects.filter(order=unpaid).exists())
+        self.assertEqual(self._reserved(self.cake), 1)
+
+    @override_settings(ALLOWED_HOSTS=['*'], CART_BACKEND='session')
+    def test_payment_failure_releases_stock(self):
+        self.client.post(reverse('orders:add_to_cart'), json.dumps({'item_id': self.cake.id, 'quantity': 2}),
+                         content_type='application/json')
+        with mock.patch('orders.views.ForteBankPaymentService') as service:
+            service.return_value.create_payment.side_effect = RuntimeError('bank is down')
+            response = self.client.post(reverse('orders:create_order'))
+
+        self.assertRedirects(response, reverse('orders:cart'), fetch_redirect_response=False)
+        self.assertEqual(Order.objects.get().status, 'failed')
+        self.assertEqual(self._reserved(self.cake), 0)
+
+    @override_settings(RKEEPER_OUTBOX_MAX_ATTEMPTS=1)
+    def test_dead_outbox_entry_releases_stock(self):
+        order = self._place((self.cake, 2))
+        Order.objects.filter(id=order.id).update(status='paid')
+        RKeeperOutbox.objects.create(order=order)
+        with mock.patch('orders.services.rkeeper_outbox.RKeeperService') as service:
+            service.return_value.send_order.return_value = None
+            [(entry_id, lease)] = claim_due_entries()
+            process_entry(entry_id, lease)
+
+        self.assertEqual(RKeeperOutbox.objects.get().status, 'dead')
+        self.assertEqual(self._reserved(self.cake), 0)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Параллельные транзакции проверяются только на PostgreSQL')
+class ConcurrentStockReservationTests(TransactionTestCase):
+    """Параллельные заказы не продают больше остатка"""
+
+    def test_concurrent_reserves(self):
+        station = Station.objects.create(name='Зал', rkeeper_code='1', rkeeper_id='101')
+        category = Category.objects.create(name='Десерты', station=station)
+        cake = MenuItem.objects.create(name='Торт', price=500, quantity=5, category=category, station=station)
+
+        def order_one(_):
+            try:
+                place_order([CartLine(cake, 1, cake.price)], cake.price)
+                return True
+            except OutOfStockError:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = list(executor.map(order_one, range(10)))
+        self.assertEqual(results.count(True), 5)
+        cake.refresh_from_db()
+        self.assertEqual(cake.reserved_quantity, 5)
+
+
+@mock.patch('orders.services.rkeeper_outbox._schedule_dispatch')
+class PaymentCallbackTests(TestCase):
+    """Уведомления ForteBank применяются к заказу один раз"""
+
+    def setUp(self):
+        self.order = Order.objects.create(total_amount=100, status='new', payment_id='pay-1')
+
+    def _status(self):
+        return Order.objects.values_list('status', flat=True).get(id=self.order.id)
+
+    def test_duplicate_callback_costs_one_query(self, schedule_dispatch):
+        self.assertEqual(process_payment_callback('pay-1', 'FullyPaid'), APPLIED)
+        with self.assertNumQueries(1):
+            self.assertEqual(process_payment_callback('pay-1', 'FullyPaid'), DUPLICATE)
+
+    def test_late_failure_does_not_revert_paid_order(self, schedule_dispatch):
+        process_payment_callback('pay-1', 'FullyPaid')
+        self.assertEqual(process_payment_callback('pay-1', 'Failed'), SKIPPED)
+        self.assertEqual(self._status(), 'paid')
+
+    def test_unknown_payment_rolls_back_event(self, schedule_dispatch):
+        self.assertEqual(process_payment_callback('pay-2', 'FullyPaid'), NOT_FOUND)
+        self.assertFalse(PaymentCallbackEvent.objects.filter(payment_id='pay-2').exists())
+
+    def test_paid_enqueues_one_outbox_entry(self, schedule_dispatch):
+        with self.captureOnCommitCallbacks(execute=True):
+            process_payment_callback('pay-1', 'FullyPaid')
+            process_payment_callback('pay-1', 'Completed')
+        self.assertEqual(self._status(), 'paid')
+        self.assertEqual(RKeeperOutbox.objects.filter(order=self.order).count(), 1)
+        schedule_dispatch.assert_called_once()
@@ -1,119 +1,94 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.views.generic import ListView, DetailView, View
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-from decimal import Decimal
+from django.utils import timezone
 import json
 import logging
-from django.urls import reverse
 
-from .models import Order, OrderItem, Waiter, Table
+from .models import Order
 from menu.models import MenuItem
 from .services.forte_payment import ForteBankPaymentService
-from .services.rkeeper_service import RKeeperService
-from core.utils import format_price, calculate_order_total, validate_table_number
+from .services.cart import resolve_cart
+from .services.cart_store import get_cart_store
+from .services.checkout import place_order
+from .services.stock import OutOfStockError, available_quantity, release_stock
+from .services.payment_callback import NOT_FOUND, process_payment_callback
+from core.query_budget import query_budget
+from core.registry import get_active_table
+from core.utils import format_price
 
 logger = logging.getLogger(__name__)
 
+@query_budget(3)
 class CartView(View):
     template_name = 'orders/cart.html'
     context_object_name = 'cart_items'
     
     def get(self, request):
-        cart = request.session.get('cart', {})
-        items = []
-        total_amount = Decimal('0')
-
-        for item_id, quantity in cart.items():
-            try:
-                menu_item = MenuItem.objects.get(id=item_id)
-                item_total = menu_item.price * Decimal(quantity)
-                total_amount += item_total
-                items.append({
-                    'id': menu_item.id,
-                    'name': menu_item.name,
-                    'price': menu_item.price,
-                    'photo_url': menu_item.photo.url if menu_item.photo else '',
-                    'quantity': quantity,
-                    'total': item_total
-                })
-            except MenuItem.DoesNotExist:
-                continue
+        resolved = resolve_cart(get_cart_store(request).items())
                 
         context = {
-            'cart_items': items,
-            'total_amount': total_amount
+            'cart_items': resolved.lines,
+            'total_amount': resolved.total_amount
         }
         return render(request, self.template_name, context)
 
+@query_budget(5)
 @require_POST
 def add_to_cart(request):
     try:
-        print("Headers:", dict(request.headers))
-        print("Request method:", request.method)
-        print("Raw body:", request.body)
-        print("POST data:", request.POST)
-        
         data = json.loads(request.body) if request.body else request.POST
-        print("Parsed data:", data)
         
         item_id = str(data.get('item_id'))  # Преобразуем в строку
         quantity = int(data.get('quantity', 1))
         
-        print(f"Adding item {item_id} to cart with quantity {quantity}")
-        
         try:
             menu_item = MenuItem.objects.get(id=item_id)
-            print(f"Found menu item: {menu_item.name}, quantity in DB: {menu_item.quantity}")
             
-            cart = request.session.get('cart', {})
-            current_quantity = int(cart.get(item_id, 0))
-            print(f"Current quantity in cart: {current_quantity}")
-            
-            # Проверяем, не превышает ли количество товара в корзине максимальное количество
-            if current_quantity + quantity > menu_item.quantity:
-                print(f"Error: Maximum quantity reached. Current: {current_quantity}, Adding: {quantity}, Max: {menu_item.quantity}")
+            # Добавляем к существующему количеству в корзине, проверяя
+            # максимальное количество товара одной атомарной операцией
+            max_quantity = available_quantity(menu_item)
+            total_count = get_cart_store(request).add(item_id, quantity, max_quantity)
+            if total_count is None:
+                logger.debug("cart.add rejected: item=%s quantity=%s max=%s", item_id, quantity, max_quantity,
+                             extra={'event': 'cart.add.rejected', 'item_id': item_id, 'quantity': quantity})
                 return JsonResponse({
                     'success': False,
                     'message': 'Достигнуто максимальное количество товара'
                 }, status=400)
             
-            # Добавляем к существующему количеству в корзине
-            cart[item_id] = current_quantity + quantity
-            print(f"New quantity in cart: {cart[item_id]}")
-                
-            request.session['cart'] = cart
-            total_count = sum(int(value) for value in cart.values())
-            
+            logger.debug("cart.add: item=%s quantity=%s count=%s", item_id, quantity, total_count,
+                         extra={'event': 'cart.add', 'item_id': item_id, 'quantity': quantity})
             return JsonResponse({
                 'success': True,
                 'message': f'Товар добавлен в корзину',
                 'count': total_count
             })
         except MenuItem.DoesNotExist:
-            print(f"Error: Menu item {item_id} not found")
+            logger.debug("cart.add: item=%s not found", item_id,
+                         extra={'event': 'cart.add.not_found', 'item_id': item_id})
             return JsonResponse({
                 'success': False,
                 'message': 'Товар не найден'
             }, status=404)
     except json.JSONDecodeError as e:
-        print(f"JSONDecodeError: {str(e)}")
+        logger.debug("cart.add: invalid JSON: %s", e, extra={'event': 'cart.add.invalid'})
         return JsonResponse({
             'success': False, 
             'message': 'Неверный формат данных'
         }, status=400)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"Unexpected error: {str(e)}")
+        logger.exception("Ошибка при добавлении в корзину: %s", e)
         return JsonResponse({
             'success': False,
             'message': f'Внутренняя ошибка сервера: {str(e)}'
         }, status=500)
 
+@query_budget(5)
 @require_POST
 def update_cart_item(request):
     try:
@@ -121,28 +96,24 @@ def update_cart_item(request):
         item_id = str(data.get('item_id'))
         quantity = int(data.get('quantity', 1))
         
-        print(f"Updating item {item_id} in cart to quantity {quantity}")
-        
         try:
             menu_item = MenuItem.objects.get(id=item_id)
-            print(f"Found menu item: {menu_item.name}, quantity in DB: {menu_item.quantity}")
             
-            # Проверяем, не превышает ли запрошенное количество максимальное
-            if quantity > menu_item.quantity:
-                print(f"Error: Maximum quantity exceeded. Requested: {quantity}, Max: {menu_item.quantity}")
+            # Проверяем, не превышает ли запрошенное количество доступный остаток
+            max_quantity = available_quantity(menu_item)
+            if quantity > max_quantity:
+                logger.debug("cart.update rejected: item=%s quantity=%s max=%s", item_id, quantity, max_quantity,
+                             extra={'event': 'cart.update.rejected', 'item_id': item_id, 'quantity': quantity})
                 return JsonResponse({
                     'success': False,
                     'message': 'Превышено максимальное количество товара'
                 }, status=400)
             
-            cart = request.session.get('cart', {})
-            
             # Если товар есть в корзине, обновляем его количество
-            if item_id in cart:
-                cart[item_id] = quantity
-                request.session['cart'] = cart
-                total_count = sum(int(value) for value in cart.values())
-                
+            total_count = get_cart_store(request).update(item_id, quantity)
+            if total_count is not None:
+                logger.debug("cart.update: item=%s quantity=%s count=%s", item_id, quantity, total_count,
+                             extra={'event': 'cart.update', 'item_id': item_id, 'quantity': quantity})
                 return JsonResponse({
                     'success': True,
                     'message': 'Количество товара обновлено',
@@ -155,7 +126,8 @@ def update_cart_item(request):
                 }, status=404)
                 
         except MenuItem.DoesNotExist:
-            print(f"Error: Menu item {item_id} not found")
+            logger.debug("cart.update: item=%s not found", item_id,
+                         extra={'event': 'cart.update.not_found', 'item_id': item_id})
             return JsonResponse({
                 'success': False,
                 'message': 'Товар не найден'
@@ -166,19 +138,16 @@ def update_cart_item(request):
             'message': 'Неверный формат данных'
         }, status=400)
 
+@query_budget(4)
 @require_POST
 def remove_from_cart(request):
     try:
         data = json.loads(request.body) if request.body else request.POST
         item_id = str(data.get('item_id'))
         
-        cart = request.session.get('cart', {})
+        total_count = get_cart_store(request).remove(item_id)
         
-        if item_id in cart:
-            del cart[item_id]
-            request.session['cart'] = cart
-            total_count = sum(int(value) for value in cart.values())
-            
+        if total_count is not None:
             return JsonResponse({
                 'success': True,
                 'message': 'Товар удален из корзины',
@@ -195,153 +164,97 @@ def remove_from_cart(request):
             'message': 'Неверный формат данных'
         }, status=400)
 
+@query_budget(2)
 def cart_count(request):
-    cart = request.session.get('cart', {})
-    total_count = sum(int(value) for value in cart.values())
-    return JsonResponse({'count': total_count})
+    return JsonResponse({'count': get_cart_store(request).count()})
 
+@query_budget(3)
 class CartDataView(View):
     def get(self, request):
-        cart = request.session.get('cart', {})
-        items = []
-        total_amount = Decimal('0')
-
-        for item_id, quantity in cart.items():
-            try:
-                menu_item = MenuItem.objects.get(id=item_id)
-                item_total = menu_item.price * Decimal(quantity)
-                total_amount += item_total
-                items.append({
-                    'id': menu_item.id,
-                    'name': menu_item.name,
-                    'price': str(menu_item.price),
-                    'photo_url': menu_item.photo.url if menu_item.photo else '',
-                    'quantity': quantity,
-                    'total': str(item_total)
-                })
-            except MenuItem.DoesNotExist:
-                continue
+        resolved = resolve_cart(get_cart_store(request).items())
                 
         return JsonResponse({
-            'items': items,
-            'total_amount': str(total_amount),
-            'count': sum(int(value) for value in cart.values())
+            'items': [line.as_dict() for line in resolved.lines],
+            'total_amount': str(resolved.total_amount),
+            'count': resolved.count
         })
 
+@query_budget(3)
 class CheckoutView(ListView):
     template_name = 'orders/checkout.html'
     context_object_name = 'items'
 
     def get_queryset(self):
-        cart = self.request.session.get('cart', {})
-        items = []
-        
-        for item_id, quantity in cart.items():
-            try:
-                menu_item = MenuItem.objects.get(id=item_id)
-                item_total = menu_item.price * Decimal(quantity)
-                items.append({
-                    'id': menu_item.id,
-                    'name': menu_item.name,
-                    'price': menu_item.price,
-                    'quantity': quantity,
-                    'total': item_total,
-                    'photo_url': menu_item.photo.url if menu_item.photo else ''
-                })
-            except MenuItem.DoesNotExist:
-                continue
-                
-        return items
+        self.resolved_cart = resolve_cart(get_cart_store(self.request).items())
+        return self.resolved_cart.lines
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        items = context['items']
-        total_amount = sum(item['total'] for item in items)
-        context['total_amount'] = total_amount
+        context['total_amount'] = self.resolved_cart.total_amount
         return context
 
+@query_budget(10)
 @require_POST
 def create_order(request):
-    # Получаем данные корзины из сессии
-    cart = request.session.get('cart', {})
+    # Получаем данные корзины
+    cart_store = get_cart_store(request)
+    cart = cart_store.items()
     
     if not cart:
         messages.error(request, 'Корзина пуста')
         return redirect('orders:cart')
     
     # Создаем заказ
-    items = []
-    total_amount = Decimal('0')
-    
-    for item_id, quantity in cart.items():
-        try:
-            menu_item = MenuItem.objects.get(id=item_id)
-            item_total = menu_item.price * Decimal(quantity)
-            total_amount += item_total
-            items.append({
-                'menu_item': menu_item,
-                'quantity': quantity,
-                'price': menu_item.price,
-                'total': item_total
-            })
-        except MenuItem.DoesNotExist:
-            continue
+    resolved = resolve_cart(cart)
+    items = resolved.lines
+    total_amount = resolved.total_amount
             
     if not items:
         messages.error(request, 'Нет доступных товаров')
         return redirect('orders:cart')
     
     comment = request.POST.get('comment', '')
-    table_number = request.session.get('table_number')
+    table_number = request.table_number
     
-    # Получаем объект стола
+    # Получаем объект стола (с официантом) из кэшированного справочника
     table = None
     if table_number:
-        try:
-            table = Table.objects.get(number=table_number, is_active=True)
-        except Table.DoesNotExist:
+        table = get_active_table(table_number)
+        if table is None:
             logger.warning(f"Не найден активный стол с номером {table_number}")
     
-    # Создаем заказ в базе данных
-    order = Order.objects.create(
-        table=table,
-        station_id=request.session.get('station_code'),
-        waiter=table.waiter if table else None,
-        total_amount=total_amount,
-        status='new',
-        comment=comment
-    )
-    
-    # Создаем позиции заказа
-    for item in items:
-        comment = request.POST.get(f'comment_{item["menu_item"].id}', '')
-        
-        OrderItem.objects.create(
-            order=order,
-            menu_item=item['menu_item'],
-            quantity=item['quantity'],
-            price=item['price'],
-            total=item['total'],
-            comment=comment
+    # Создаем заказ и его позиции одной транзакцией, резервируя остатки
+    try:
+        order = place_order(
+            items,
+            total_amount,
+            table=table,
+            station_id=request.session.get('station_code'),
+            comment=comment,
+            item_comments={item.id: request.POST.get(f'comment_{item.id}', '') for item in items}
         )
+    except OutOfStockError as e:
+        messages.error(request, f'Недостаточно товара «{e.menu_item.name}». Уменьшите количество в корзине.')
+        return redirect('orders:cart')
     
-    # Создаем платеж в ForteBank
+    # Создаем платеж в ForteBank (payment_id сохраняется в заказе внутри create_payment)
     try:
         payment_service = ForteBankPaymentService()
         payment_data = payment_service.create_payment(order)
         
-        # Сохраняем payment_id в заказе
-        order.payment_id = payment_data.get('order_id')
-        order.save()
-        
         # Очищаем корзину
-        request.session['cart'] = {}
+        cart_store.clear()
         
         # Перенаправляем на платежный виджет ForteBank
         return redirect(payment_data.get('payment_url'))
         
     except Exception as e:
         logger.error(f"Ошибка при создании платежа: {e}")
+        if not order.payment_id:
+            # Платёж не создан - резерв не нужен, иначе повторная попытка
+            # с той же корзиной упрётся в собственный резерв гостя
+            Order.objects.filter(id=order.id, status='new').update(status='failed', updated_at=timezone.now())
+            release_stock(order.id)
         messages.error(request, 'Произошла ошибка при создании платежа. Пожалуйста, попробуйте позже.')
         return redirect('orders:cart')
 
@@ -356,6 +269,7 @@ class OrderDetailView(DetailView):
         context['formatted_total'] = format_price(order.total_amount)
         return context
 
+@query_budget(12)
 @method_decorator(csrf_exempt, name='dispatch')
 class PaymentCallbackView(View):
     def post(self, request, *args, **kwargs):
@@ -387,52 +301,11 @@ class PaymentCallbackView(View):
                 logger.error("Missing ID or STATUS in callback data")
                 return JsonResponse({'error': 'Missing ID or STATUS'}, status=400)
                 
-            try:
-                order = Order.objects.get(payment_id=payment_id)
-            except Order.DoesNotExist:
+            # Повторы и одновременные уведомления отсекаются внутри process_payment_callback
+            result = process_payment_callback(payment_id, status)
+            if result == NOT_FOUND:
                 logger.error(f"Order with payment_id {payment_id} not found")
                 return JsonResponse({'error': 'Order not found'}, status=404)
-                
-            # Обновляем статус заказа в зависимости от статуса платежа
-            if status in ['FullyPaid', 'Completed', 'Success']:
-                # Проверяем, не был ли заказ уже отправлен в R-Keeper
-                if order.status == 'processing' or order.rkeeper_order_id:
-                    logger.info(f"Order {order.id} already sent to R-Keeper (status: {order.status}, rkeeper_id: {order.rkeeper_order_id}), skipping duplicate send")
-                    # Просто помечаем как оплаченный, если еще не помечен
-                    if order.status != 'paid':
-                        order.status = 'paid'
-                        order.save()
-                        logger.info(f"Order {order.id} marked as paid (was already in R-Keeper)")
-                else:
-                    # Сначала обновляем статус на 'paid'
-                    order.status = 'paid'
-                    order.save()
-                    logger.info(f"Order {order.id} marked as paid")
-                    
-                    # Затем отправляем заказ в R-Keeper
-                    try:
-                        rkeeper_service = RKeeperService()
-                        success = rkeeper_service.send_order(order)
-                        
-                        if success:
-                            # Только после успешной отправки в R-Keeper меняем статус на 'processing'
-                            order.status = 'processing'
-                            order.save()
-                            logger.info(f"Order {order.id} successfully sent to R-Keeper and marked as processing")
-                        else:
-                            logger.error(f"Failed to send order {order.id} to R-Keeper")
-                    except Exception as e:
-                        logger.error(f"Error sending order to R-Keeper: {str(e)}", exc_info=True)
-                
-            elif status in ['Cancelled', 'Canceled']:
-                order.status = 'cancelled'
-                order.save()
-                logger.info(f"Order {order.id} cancelled")
-                
-            elif status in ['Failed', 'Error', 'Rejected']:
-                order.status = 'failed'
-                order.save()
-                logger.info(f"Order {order.id} payment failed")
             
             # Если это GET запрос, делаем редирект на главную страницу
             if request.method == "GET":
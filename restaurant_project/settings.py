@@ -54,6 +54,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первыми, чтобы учитывать время и запросы всех middleware (сессия, пользователь)
+    'core.middleware.RequestMetricsMiddleware',
+    'core.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -99,9 +102,28 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD', 'your_password'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        # Проверка соединения перед повторным использованием в новом запросе
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    if os.environ.get('DB_POOL', '0') == '1':
+        # Пул соединений psycopg 3 внутри процесса (gunicorn-воркер, Celery-воркер).
+        # С пулом постоянные соединения (CONN_MAX_AGE) не используются
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+                'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),  # секунды ожидания свободного соединения
+            },
+        }
+    else:
+        # Постоянные соединения: открываются один раз на процесс и живут CONN_MAX_AGE секунд
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+    # За PgBouncer в режиме transaction серверные курсоры не работают
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = os.environ.get('DB_PGBOUNCER', '0') == '1'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -179,13 +201,80 @@ RKEEPER_LICENSE_ANCHOR = os.environ.get('RKEEPER_LICENSE_ANCHOR', '')  # Фор
 RKEEPER_LICENSE_TOKEN = os.environ.get('RKEEPER_LICENSE_TOKEN', '')  # ID лицензии
 RKEEPER_LICENSE_INSTANCE_GUID = os.environ.get('RKEEPER_LICENSE_INSTANCE_GUID', '')  # Уникальный GUID экземпляра приложения
 
-# Кэш для хранения seqNumber лицензии R-Keeper
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'rkeeper_seq_cache',
+# Пул HTTP-соединений с кассовым сервером R-Keeper (один на процесс)
+RKEEPER_POOL_SIZE = int(os.environ.get('RKEEPER_POOL_SIZE', 10))  # максимум соединений в пуле
+RKEEPER_POOL_MAX_IDLE = int(os.environ.get('RKEEPER_POOL_MAX_IDLE', 60))  # секунды простоя до сброса соединений
+RKEEPER_TIMEOUT = int(os.environ.get('RKEEPER_TIMEOUT', 30))  # таймаут запроса по умолчанию, секунды
+
+# Режим отправки заказа в R-Keeper:
+# sequential - CreateOrder, затем SaveOrder (seqNumber запрашивается по необходимости)
+# pipelined - обе команды и seqNumber готовятся заранее и уходят подряд по одному соединению
+# batched - обе команды в одном RK7Query (если кассовый сервер поддерживает несколько RK7CMD)
+RKEEPER_SUBMIT_MODE = os.environ.get('RKEEPER_SUBMIT_MODE', 'sequential')
+
+# Очередь отправки оплаченных заказов в R-Keeper
+RKEEPER_OUTBOX_CONCURRENCY = int(os.environ.get('RKEEPER_OUTBOX_CONCURRENCY', 4))  # заказов одновременно на весь кластер
+RKEEPER_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('RKEEPER_OUTBOX_MAX_ATTEMPTS', 8))  # после этого запись помечается 'dead'
+RKEEPER_OUTBOX_BACKOFF_BASE = int(os.environ.get('RKEEPER_OUTBOX_BACKOFF_BASE', 30))  # секунды, удваивается с каждой попыткой
+RKEEPER_OUTBOX_BACKOFF_MAX = int(os.environ.get('RKEEPER_OUTBOX_BACKOFF_MAX', 1800))  # секунды
+RKEEPER_OUTBOX_LEASE = int(os.environ.get('RKEEPER_OUTBOX_LEASE', 300))  # секунды до повторного захвата зависшей записи
+
+# Резерв остатков блюд с ограниченным количеством держится, пока заказ ожидает оплаты
+STOCK_RESERVATION_TTL = int(os.environ.get('STOCK_RESERVATION_TTL', 1200))  # секунды
+
+# Redis, общий для всех процессов gunicorn и Celery
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/1')
+
+# Общий счётчик seqNumber лицензии R-Keeper: 'redis' (атомарный INCR) или 'db' (блокировка строки в PostgreSQL)
+RKEEPER_LICENSE_SEQ_BACKEND = os.environ.get('RKEEPER_LICENSE_SEQ_BACKEND', 'redis')
+RKEEPER_LICENSE_SEQ_REDIS_URL = os.environ.get('RKEEPER_LICENSE_SEQ_REDIS_URL', REDIS_URL)
+RKEEPER_LICENSE_SEQ_LOCK_TIMEOUT = int(os.environ.get('RKEEPER_LICENSE_SEQ_LOCK_TIMEOUT', 30))  # секунды
+
+# Хранилище корзины: 'redis' (хэш на сессию, атомарные изменения) или 'session' (сессия Django)
+CART_BACKEND = os.environ.get('CART_BACKEND', 'redis')
+CART_REDIS_URL = os.environ.get('CART_REDIS_URL', REDIS_URL)
+CART_KEY_PREFIX = os.environ.get('CART_KEY_PREFIX', 'cart')
+
+# Кэш: 'redis' (общий для всех процессов gunicorn и Celery) или 'locmem' (отдельный в каждом процессе, для разработки)
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'redis')
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', REDIS_URL)
+# Пространство имён ключей, если один Redis обслуживает несколько окружений
+CACHE_KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX', 'restoqr')
+# Сериализатор значений (путь к классу); сжатие zlib - core.cache.CompressedRedisSerializer
+CACHE_SERIALIZER = os.environ.get('CACHE_SERIALIZER', 'core.cache.CompressedRedisSerializer')
+CACHE_COMPRESS_MIN_SIZE = int(os.environ.get('CACHE_COMPRESS_MIN_SIZE', 1024))  # байты
+CACHE_COMPRESS_LEVEL = int(os.environ.get('CACHE_COMPRESS_LEVEL', 6))
+
+SESSION_COOKIE_AGE = int(os.environ.get('SESSION_COOKIE_AGE', 60 * 60 * 24 * 14))  # секунды
+
+if CACHE_BACKEND == 'redis':
+    def _redis_cache(key_prefix, url=CACHE_REDIS_URL, timeout=300):
+        return {
+            'BACKEND': 'core.cache.InstrumentedRedisCache',
+            'LOCATION': url,
+            'KEY_PREFIX': f'{CACHE_KEY_PREFIX}:{key_prefix}',
+            'TIMEOUT': timeout,
+            'OPTIONS': {'serializer': CACHE_SERIALIZER},
+        }
+
+    CACHES = {
+        'default': _redis_cache('cache'),
+        'sessions': _redis_cache('sessions', timeout=SESSION_COOKIE_AGE),
+    }
+    # Сессии читаются из Redis, база используется только при промахе кэша
+    SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+    SESSION_CACHE_ALIAS = 'sessions'
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.InstrumentedLocMemCache',
+            'LOCATION': 'default',
+        },
+        'sessions': {
+            'BACKEND': 'core.cache.InstrumentedLocMemCache',
+            'LOCATION': 'sessions',
+        },
     }
-}
 
 # Настройки сайта
 SITE_NAME = os.environ.get('SITE_NAME', 'Ресторан')
@@ -197,6 +286,25 @@ CURRENCY_SYMBOL = os.environ.get('CURRENCY_SYMBOL', '₸')
 MIN_TABLE_NUMBER = int(os.environ.get('MIN_TABLE_NUMBER', 1))
 MAX_TABLE_NUMBER = int(os.environ.get('MAX_TABLE_NUMBER', 100))
 
+# Номер стола хранится в подписанной cookie, а не в сессии
+TABLE_COOKIE_NAME = 'table_number'
+TABLE_COOKIE_SALT = 'core.table_number'
+TABLE_COOKIE_AGE = int(os.environ.get('TABLE_COOKIE_AGE', 60 * 60 * 24 * 14))  # секунды
+
+# Метрики запросов (core.middleware.RequestMetricsMiddleware)
+# Заголовок Server-Timing раскрывает число запросов и время ответа банка и кассы: по умолчанию
+# только при DEBUG, сотрудникам (is_staff) он отдаётся всегда
+REQUEST_METRICS_HEADER = os.environ.get('REQUEST_METRICS_HEADER', '1' if DEBUG else '0') == '1'
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', 0.1))  # доля запросов в логе
+REQUEST_METRICS_SLOW_MS = int(os.environ.get('REQUEST_METRICS_SLOW_MS', 1000))  # медленные запросы пишутся всегда
+
+# Проверка бюджетов SQL-запросов представлений (core.query_budget): off, warn или raise
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'raise' if DEBUG else 'off')
+
+# Справочники столов и страниц для контекст-процессоров (core.registry)
+CORE_REGISTRY_LOCAL_TTL = int(os.environ.get('CORE_REGISTRY_LOCAL_TTL', 5))  # секунды между сверками версии с общим кэшем
+CORE_REGISTRY_TIMEOUT = int(os.environ.get('CORE_REGISTRY_TIMEOUT', 3600))  # секунды
+
 # Настройки Celery
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'django-db')
@@ -215,9 +323,36 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': 300.0,  # каждые 5 минут (300 секунд)
         'options': {'expires': 60.0},  # задача истекает через 1 минуту если не выполнена
     },
+    'dispatch-rkeeper-outbox': {
+        'task': 'orders.tasks.dispatch_rkeeper_outbox',
+        'schedule': 30.0,  # повторные попытки и заказы, пропущенные при сбое брокера
+        'options': {'expires': 30.0},
+    },
+    'release-expired-stock-reservations': {
+        'task': 'orders.tasks.release_expired_stock_reservations',
+        'schedule': 60.0,
+        'options': {'expires': 60.0},
+    },
 }
 
+# Синхронизация меню: меню станций загружаются параллельно и должны уложиться
+# в срок жизни задачи Celery Beat (expires=60 с)
+MENU_SYNC_CONCURRENCY = int(os.environ.get('MENU_SYNC_CONCURRENCY', 4))
+MENU_SYNC_STATION_TIMEOUT = int(os.environ.get('MENU_SYNC_STATION_TIMEOUT', 20))  # секунды
+MENU_SYNC_DEADLINE = int(os.environ.get('MENU_SYNC_DEADLINE', 40))  # секунды
+
+# Снимки меню станций в кэше перестраиваются при изменении меню; срок жизни
+# ограничивает устаревание, если кэш не общий для процессов (LocMemCache)
+MENU_SNAPSHOT_TIMEOUT = int(os.environ.get('MENU_SNAPSHOT_TIMEOUT', 300))  # секунды
+
 # Настройки логирования
+# Уровень логгеров приложений menu и orders (DEBUG выводит XML-обмен с R-Keeper)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+# Доли записей уровня INFO и ниже по логгерам, например 'orders.views=0.1,orders.services=0.5'
+LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', '')
+
+# Запросы только кладут записи в очередь (core.log_handlers.QueuedHandler),
+# форматирование и запись в файл выполняются в фоновом потоке
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -230,6 +365,16 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'sync': {
+            'format': '{asctime} - {name} - {levelname} - {message}',
+            'style': '{',
+        },
+    },
+    'filters': {
+        'sampling': {
+            '()': 'core.log_handlers.SamplingFilter',
+            'rates': LOG_SAMPLE_RATES,
+        },
     },
     'handlers': {
         'console': {
@@ -240,22 +385,53 @@ LOGGING = {
             'class': 'logging.FileHandler',
             'filename': 'django.log',
             'formatter': 'verbose',
+            'delay': True,
+        },
+        'menu_sync_file': {
+            'class': 'logging.FileHandler',
+            'filename': 'menu_sync.log',
+            'formatter': 'sync',
+            'delay': True,
+        },
+        # Обработчики-очереди объявляются после тех, в которые они пишут
+        'queued': {
+            'class': 'core.log_handlers.QueuedHandler',
+            'targets': ['cfg://handlers.console', 'cfg://handlers.file'],
+            'filters': ['sampling'],
+        },
+        'queued_menu_sync': {
+            'class': 'core.log_handlers.QueuedHandler',
+            'targets': ['cfg://handlers.menu_sync_file'],
         },
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queued'],
             'level': 'INFO',
             'propagate': True,
         },
         'menu': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'handlers': ['queued'],
+            'level': LOG_LEVEL,
             'propagate': True,
         },
         'orders': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'handlers': ['queued'],
+            'level': LOG_LEVEL,
+            'propagate': True,
+        },
+        'core': {
+            'handlers': ['queued'],
+            'level': LOG_LEVEL,
+            'propagate': True,
+        },
+        # Журнал синхронизации меню дополнительно пишется в menu_sync.log
+        'menu.sync_utils': {
+            'handlers': ['queued_menu_sync'],
+            'propagate': True,
+        },
+        'menu.management.commands.sync_menu_from_stations': {
+            'handlers': ['queued_menu_sync'],
             'propagate': True,
         },
     },
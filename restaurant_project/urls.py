@@ -20,10 +20,12 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import RedirectView
 from django.conf.urls.i18n import i18n_patterns
+from core.views import database_health
 
 # URL-адреса, не зависящие от языка
 urlpatterns = [
     path('i18n/', include('django.conf.urls.i18n')),  # URL для переключения языков
+    path('health/db/', database_health, name='database_health'),  # Проверка базы для мониторинга
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 # URL-адреса, зависящие от языка
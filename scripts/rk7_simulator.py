@@ -0,0 +1,311 @@
+"""
+Локальный имитатор XML-интерфейса RK7 для нагрузочных замеров
+
+Отвечает на команды CreateOrder, SaveOrder, GetOrderMenu, GetRefData
+(MenuItems, EMPLOYEES) и GetXMLLicenseInstanceSeqNumber так же, как кассовый
+сервер: одиночная команда - атрибутами корня RK7QueryResult, несколько
+команд в одном RK7Query - элементами CommandResult. Счётчик seqNumber
+лицензии ведётся по правилам сервера (5304 - экземпляр не найден, 5310 -
+номер не увеличен), ошибки можно добавлять случайно.
+
+Запуск:
+    python scripts/rk7_simulator.py --port 8765 --menu-size 2000 --latency 40 --jitter 10
+    RKEEPER_API_URL=http://127.0.0.1:8765/rk7api/v0/xmlinterface.xml python manage.py sync_menu_from_stations
+
+GET /stats возвращает число обработанных команд и ошибок в JSON.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import quoteattr
+
+# Ошибки лицензирования, которые можно добавлять в ответы SaveOrder
+LICENSE_ERRORS = {
+    '5304': 'License check failed: license instance not found',
+    '5305': 'License check failed: wrong seqNumber',
+    '5310': 'License check failed: seqNumber was not increased',
+}
+
+
+def parse_latency_overrides(values):
+    """Разбирает задержки отдельных команд вида SaveOrder=200"""
+    overrides = {}
+    for value in values or []:
+        command, _, latency = value.partition('=')
+        overrides[command] = float(latency)
+    return overrides
+
+
+class RK7Simulator:
+    """Состояние имитатора: меню, справочники, заказы и счётчики лицензий"""
+
+    def __init__(self, options):
+        self.options = options
+        self.random = random.Random(options.seed)
+        self.lock = threading.Lock()
+        self.license_seq = {}  # guid экземпляра лицензии -> последний принятый seqNumber
+        self.orders = set()
+        self.stats = Counter()
+        self.latency = parse_latency_overrides(options.latency_cmd)
+        # Справочники не меняются, поэтому собираются один раз
+        self.menu_items = self._build_menu_items()
+        self.menu_items_ref = self._reference(
+            'MenuItems', (self._menu_item_xml(item) for item in self.menu_items)
+        ).encode('utf-8')
+        self.employees_ref = self._reference('EMPLOYEES', (
+            f'<Item Ident="{1000 + i}" Code="{i + 1}" Name="Официант {i + 1}" Status="rsActive"/>'
+            for i in range(options.employees)
+        )).encode('utf-8')
+
+    def _build_menu_items(self):
+        items = []
+        for i in range(self.options.menu_size):
+            limited = self.random.random() < self.options.limited_share
+            items.append({
+                'ident': 100000 + i,
+                'code': i + 1,
+                'name': f'Блюдо {i + 1}',
+                'category': f'Категория {i % self.options.categories + 1}',
+                'price': self.random.randint(5, 500) * 1000,  # в копейках
+                'quantity': self.random.randint(0, 20) if limited else None,
+            })
+        return items
+
+    @staticmethod
+    def _menu_item_xml(item):
+        return (
+            f'<Item ItemIdent="{item["ident"]}" Code="{item["code"]}" Name="{item["name"]}" Status="rsActive" '
+            f'CategPath="Меню\\{item["category"]}" RecipeText="" Price="{item["price"]}"/>'
+        )
+
+    @staticmethod
+    def _root_attrs(status='Ok', **attrs):
+        # Время сервера и длительность меняются в каждом ответе, как у настоящего RK7
+        attrs = {
+            'ServerVersion': '7.7.0.0',
+            'XmlVersion': '248',
+            'NetName': 'RK7SIM',
+            'Status': status,
+            'Processed': '1',
+            'DateTime': datetime.now().isoformat(timespec='seconds'),
+            'WorkTime': '0',
+            **attrs,
+        }
+        return ' '.join(f'{name}={quoteattr(str(value))}' for name, value in attrs.items())
+
+    def _reference(self, name, items_xml):
+        return (
+            f'<?xml version="1.0" encoding="UTF-8"?>\n<RK7QueryResult {self._root_attrs()}>'
+            f'<RK7Reference Name="{name}"><Items>{"".join(items_xml)}</Items></RK7Reference></RK7QueryResult>'
+        )
+
+    def delay(self, commands):
+        """Имитирует время обработки запроса сервером"""
+        latency = max((self.latency.get(command, self.options.latency) for command in commands), default=0)
+        latency += self.random.uniform(-self.options.jitter, self.options.jitter)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def handle(self, body):
+        """
+        Выполняет RK7Query
+
+        Returns:
+            tuple: (HTTP-статус, тело ответа в байтах)
+        """
+        root = ET.fromstring(body)
+        commands = [element for element in root if element.tag in ('RK7CMD', 'RK7Command')]
+        names = [command.get('CMD', '') for command in commands]
+        self.delay(names)
+
+        with self.lock:
+            self.stats['requests'] += 1
+            if self.random.random() < self.options.http_error_rate:
+                self.stats['http_errors'] += 1
+                return 503, b'Service Unavailable'
+
+        # Справочники отдаются заранее собранными
+        if len(commands) == 1 and names[0] == 'GetRefData':
+            with self.lock:
+                self.stats['GetRefData'] += 1
+            ref_name = commands[0].get('RefName', '')
+            if ref_name == 'MenuItems':
+                return 200, self.menu_items_ref
+            if ref_name.upper() == 'EMPLOYEES':
+                return 200, self.employees_ref
+            return 200, self._result(('Error', {'ErrorText': f'Unknown reference {ref_name}'}, ''))
+
+        results = [self.execute(command) for command in commands]
+        if len(results) == 1:
+            return 200, self._result(results[0])
+        parts = ''.join(
+            f'<CommandResult CMD={quoteattr(name)} {self._attrs(status, attrs)}>{content}</CommandResult>'
+            for name, (status, attrs, content) in zip(names, results)
+        )
+        return 200, f'<?xml version="1.0" encoding="UTF-8"?>\n<RK7QueryResult {self._root_attrs()}>{parts}</RK7QueryResult>'.encode('utf-8')
+
+    @staticmethod
+    def _attrs(status, attrs):
+        return ' '.join(f'{name}={quoteattr(str(value))}' for name, value in {'Status': status, **attrs}.items())
+
+    def _result(self, result):
+        status, attrs, content = result
+        return (
+            f'<?xml version="1.0" encoding="UTF-8"?>\n<RK7QueryResult {self._root_attrs(status, **attrs)}>'
+            f'{content}</RK7QueryResult>'
+        ).encode('utf-8')
+
+    def execute(self, command):
+        """
+        Выполняет одну команду
+
+        Returns:
+            tuple: (Status, дополнительные атрибуты, вложенный XML)
+        """
+        name = command.get('CMD', '')
+        with self.lock:
+            self.stats[name] += 1
+        handler = getattr(self, f'cmd_{name}', None)
+        if handler is None:
+            return 'Error', {'ErrorText': f'Unknown command {name}'}, ''
+        return handler(command)
+
+    def cmd_GetOrderMenu(self, command):
+        items = []
+        for item in self.menu_items:
+            quantity = item['quantity']
+            # Часть остатков меняется между запросами, если задан --menu-churn
+            if quantity is not None and self.random.random() < self.options.menu_churn:
+                quantity = self.random.randint(0, 20)
+            quantity_attr = '' if quantity is None else f' Quantity="{quantity}"'
+            items.append(f'<Item Ident="{item["ident"]}" Price="{item["price"]}"{quantity_attr}/>')
+        return 'Ok', {}, f'<Dishes>{"".join(items)}</Dishes>'
+
+    def cmd_CreateOrder(self, command):
+        order = command.find('Order')
+        guid = order.get('guid') if order is not None and order.get('guid') else '{' + str(uuid.uuid4()).upper() + '}'
+        with self.lock:
+            self.orders.add(guid)
+        return 'Ok', {'guid': guid}, f'<Order guid="{guid}"/>'
+
+    def cmd_SaveOrder(self, command):
+        order = command.find('Order')
+        guid = order.get('guid') if order is not None else None
+        with self.lock:
+            if guid not in self.orders:
+                return 'Query Executing Error', {'RK7ErrorN': '3', 'ErrorText': f'Order {guid} not found'}, ''
+
+            instance = command.find('.//LicenseInstance')
+            if instance is not None:
+                error_code = self._check_license(instance.get('guid'), int(instance.get('seqNumber', -1)))
+                if error_code:
+                    self.stats[f'error_{error_code}'] += 1
+                    return 'Query Executing Error', {'RK7ErrorN': error_code, 'ErrorText': LICENSE_ERRORS[error_code]}, ''
+        dishes = len(command.findall('.//Dish'))
+        return 'Ok', {}, f'<Order guid="{guid}" dishCount="{dishes}"/>'
+
+    def _check_license(self, instance_guid, seq):
+        """Проверяет seqNumber экземпляра лицензии; вызывается под self.lock"""
+        if self.options.error_codes and self.random.random() < self.options.error_rate:
+            return self.random.choice(self.options.error_codes)
+        last_seq = self.license_seq.get(instance_guid)
+        if last_seq is None:
+            # Новый экземпляр регистрируется запросом с seqNumber=0
+            if seq != 0:
+                return '5304'
+        elif seq <= last_seq:
+            return '5310'
+        self.license_seq[instance_guid] = seq
+        return None
+
+    def cmd_GetXMLLicenseInstanceSeqNumber(self, command):
+        instance = command.find('.//LicenseInstance')
+        guid = instance.get('guid') if instance is not None else None
+        with self.lock:
+            last_seq = self.license_seq.get(guid)
+        if last_seq is None:
+            return 'Query Executing Error', {'RK7ErrorN': '5304', 'ErrorText': LICENSE_ERRORS['5304']}, ''
+        return 'Ok', {}, f'<LicenseInfo><LicenseInstance guid="{guid}" seqNumber="{last_seq}"/></LicenseInfo>'
+
+
+def make_handler(simulator):
+    class RK7RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, как у кассового сервера
+        # Заголовки и тело пишутся отдельно: без этого Nagle добавляет ~40 мс к ответу
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                status, content = simulator.handle(body)
+            except ET.ParseError as e:
+                status, content = 400, f'Invalid XML: {e}'.encode('utf-8')
+            self._send(status, content, 'application/xml; charset=utf-8')
+
+        def do_GET(self):
+            if self.path.rstrip('/') != '/stats':
+                self._send(404, b'Not Found', 'text/plain')
+                return
+            with simulator.lock:
+                stats = dict(simulator.stats, orders=len(simulator.orders))
+            self._send(200, json.dumps(stats).encode('utf-8'), 'application/json')
+
+        def _send(self, status, content, content_type):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            if simulator.options.verbose:
+                super().log_message(format, *args)
+
+    return RK7RequestHandler
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Имитатор XML-интерфейса RK7')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--menu-size', type=int, default=500, help='Количество блюд в меню и справочнике')
+    parser.add_argument('--categories', type=int, default=20, help='Количество категорий меню')
+    parser.add_argument('--limited-share', type=float, default=0.1, help='Доля блюд с ограниченным остатком')
+    parser.add_argument('--menu-churn', type=float, default=0.0,
+                        help='Доля ограниченных остатков, меняющихся между запросами GetOrderMenu')
+    parser.add_argument('--employees', type=int, default=30, help='Количество сотрудников в справочнике')
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа, мс')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Разброс задержки, мс')
+    parser.add_argument('--latency-cmd', action='append', metavar='CMD=MS',
+                        help='Задержка отдельной команды, например SaveOrder=200 (можно повторять)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля SaveOrder с ошибкой лицензии')
+    parser.add_argument('--error-codes', default='5304,5305,5310', help='Коды ошибок лицензии через запятую')
+    parser.add_argument('--http-error-rate', type=float, default=0.0, help='Доля ответов HTTP 503')
+    parser.add_argument('--seed', type=int, default=None, help='Начальное значение генератора случайных чисел')
+    parser.add_argument('--verbose', action='store_true', help='Выводить каждый запрос')
+    return parser
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    options.error_codes = [code for code in options.error_codes.split(',') if code in LICENSE_ERRORS]
+    simulator = RK7Simulator(options)
+    server = ThreadingHTTPServer((options.host, options.port), make_handler(simulator))
+    print(f'Имитатор RK7 слушает http://{options.host}:{options.port}/ (меню: {options.menu_size} блюд)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()